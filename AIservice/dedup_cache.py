@@ -0,0 +1,157 @@
+###############################
+#           system libs
+#------------------------------
+import os
+import time
+import sqlite3
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class TTLHashCache:
+    """
+    Кеш хешей обработанного контента со скользящим окном.
+
+    Каждая запись живет ttl_seconds с момента добавления и вытесняется сама
+    по себе, а не вместе со всем кешем. Записи сгруппированы во временные
+    корзины шириной bucket_seconds: вытеснение снимает целые устаревшие
+    корзины с головы очереди, поэтому его стоимость пропорциональна числу
+    удаленных записей, а не размеру кеша.
+
+    При заданном snapshot_path состояние сохраняется в SQLite и загружается
+    при старте, так что перезапуск контейнера не обнуляет дедупликацию.
+    """
+
+    def __init__(self, ttl_seconds: float, bucket_seconds: float = 60.0, snapshot_path: str = ""):
+        self.ttl_seconds = ttl_seconds
+        self.bucket_seconds = bucket_seconds
+        self.snapshot_path = snapshot_path
+
+        self.entries: Dict[str, float] = {}  # хеш -> время добавления
+        self.buckets: Dict[int, Set[str]] = {}  # номер корзины -> хеши (в порядке вставки)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.last_snapshot_at: Optional[float] = None
+
+    def _bucket_id(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds)
+
+    def evict_expired(self, now: Optional[float] = None) -> int:
+        """Удаляет записи, чей TTL истек. Возвращает количество удаленных записей"""
+        now = now or time.time()
+        cutoff = now - self.ttl_seconds
+        evicted = 0
+
+        # Корзины создаются в порядке времени, поэтому устаревшие всегда в начале
+        for bucket_id in list(self.buckets):
+            if (bucket_id + 1) * self.bucket_seconds > cutoff:
+                break
+            for content_hash in self.buckets.pop(bucket_id):
+                if self._bucket_id(self.entries.get(content_hash, -1)) == bucket_id:
+                    del self.entries[content_hash]
+                    evicted += 1
+
+        # Граничная корзина вытесняется поштучно
+        if self.buckets:
+            first_id = next(iter(self.buckets))
+            bucket = self.buckets[first_id]
+            for content_hash in [h for h in bucket if self.entries.get(h, now) <= cutoff]:
+                bucket.discard(content_hash)
+                del self.entries[content_hash]
+                evicted += 1
+            if not bucket:
+                del self.buckets[first_id]
+
+        self.evictions += evicted
+        return evicted
+
+    def add(self, content_hash: str, added_at: Optional[float] = None) -> None:
+        """Добавляет хеш (или продлевает TTL уже существующего)"""
+        added_at = added_at or time.time()
+        previous = self.entries.get(content_hash)
+        if previous is not None:
+            old_bucket = self.buckets.get(self._bucket_id(previous))
+            if old_bucket is not None:
+                old_bucket.discard(content_hash)
+
+        self.entries[content_hash] = added_at
+        self.buckets.setdefault(self._bucket_id(added_at), set()).add(content_hash)
+
+    def contains(self, content_hash: str) -> bool:
+        """Проверяет наличие хеша с учетом TTL и обновляет счетчики попаданий"""
+        self.evict_expired()
+        if content_hash in self.entries:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def clear(self) -> int:
+        """Полностью очищает кеш. Возвращает количество удаленных записей"""
+        size = len(self.entries)
+        self.entries.clear()
+        self.buckets.clear()
+        return size
+
+    def oldest_entry_age(self) -> float:
+        """Возраст самой старой записи в секундах (0 для пустого кеша)"""
+        if not self.entries:
+            return 0.0
+        return time.time() - min(self.entries.values())
+
+    def stats(self) -> Dict:
+        """Возвращает счетчики кеша"""
+        lookups = self.hits + self.misses
+        return {
+            'cache_size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'ttl_hours': round(self.ttl_seconds / 3600, 2),
+            'oldest_entry_age_hours': round(self.oldest_entry_age() / 3600, 2),
+            'snapshot_path': self.snapshot_path or None,
+            'last_snapshot_at': self.last_snapshot_at,
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    ###############################
+    #         snapshot (SQLite)
+    #------------------------------
+    def snapshot_rows(self) -> List[Tuple[str, float]]:
+        """Копия записей для сохранения (берется в event loop, пишется в потоке)"""
+        return list(self.entries.items())
+
+    def write_snapshot(self, rows: List[Tuple[str, float]]) -> None:
+        """Атомарно перезаписывает снимок кеша в SQLite"""
+        if not self.snapshot_path:
+            return
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with sqlite3.connect(self.snapshot_path) as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS content_hashes (hash TEXT PRIMARY KEY, added_at REAL NOT NULL)")
+            connection.execute("DELETE FROM content_hashes")
+            connection.executemany("INSERT INTO content_hashes (hash, added_at) VALUES (?, ?)", rows)
+        self.last_snapshot_at = time.time()
+
+    def load_snapshot(self) -> int:
+        """Загружает неустаревшие записи из снимка. Возвращает количество загруженных"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+
+        cutoff = time.time() - self.ttl_seconds
+        with sqlite3.connect(self.snapshot_path) as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS content_hashes (hash TEXT PRIMARY KEY, added_at REAL NOT NULL)")
+            rows = connection.execute(
+                "SELECT hash, added_at FROM content_hashes WHERE added_at > ? ORDER BY added_at",
+                (cutoff,)
+            ).fetchall()
+
+        for content_hash, added_at in rows:
+            self.add(content_hash, added_at=added_at)
+        return len(rows)
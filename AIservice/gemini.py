@@ -5,17 +5,20 @@ import re
 import json
 import hashlib
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import lru_cache
 from typing import List, Optional, Dict, Any, Union
 ###############################
 #           my moduls
 #------------------------------
 from .prompts import prompt
+from .dedup_cache import TTLHashCache
+from .response_cache import ResponseCache, ResponseKey
 from config import settings
 ###############################
 #            FAST API
 #------------------------------
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, HTTPException
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 ###############################
@@ -27,9 +30,24 @@ import google.generativeai as genai
 genai.configure(api_key=settings.ai_service.gemini_key)
 model = genai.GenerativeModel("gemini-1.5-flash")
 
-# Глобальный кеш для отслеживания уже обработанных постов
-processed_content_hashes = set()
-last_cache_clear = datetime.now()
+# Глобальный кеш для отслеживания уже обработанных постов (каждая запись живет свой TTL)
+dedup_cache = TTLHashCache(
+    ttl_seconds=settings.ai_service.dedup_ttl_hours * 3600,
+    snapshot_path=settings.ai_service.dedup_snapshot_path
+)
+last_cache_clear = datetime.now()  # Время последней ручной очистки
+
+# Кеш ответов Gemini по отдельным постам (повторы и одинаковые посты из разных источников)
+response_cache_enabled = settings.ai_service.response_cache_size > 0
+response_cache = ResponseCache(
+    max_entries=settings.ai_service.response_cache_size,
+    ttl_seconds=settings.ai_service.response_cache_ttl_hours * 3600
+)
+
+# Ограничение одновременных запросов к Gemini и учет очереди
+gemini_semaphore = asyncio.Semaphore(max(1, settings.ai_service.gemini_concurrency))
+gemini_active_requests = 0  # Запросы, которые сейчас выполняются в Gemini
+gemini_queued_requests = 0  # Запросы, ожидающие свободного слота
 
 # Модель для валидации входных данных
 class PostBatch(BaseModel):
@@ -48,24 +66,44 @@ app.add_middleware(
 )
 
 
-def check_and_auto_clear_cache():
-    """Проверяет и автоматически очищает кеш если прошло 24 часа"""
-    global processed_content_hashes, last_cache_clear
-    
-    current_time = datetime.now()
-    hours_passed = (current_time - last_cache_clear).total_seconds() / 3600
-    
-    if hours_passed >= 24:
-        cache_size_before = len(processed_content_hashes)
-        processed_content_hashes.clear()
-        last_cache_clear = current_time
-        
-        print(f"🔄 Автоматическая очистка кеша: удалено {cache_size_before} записей")
-        print(f"⏰ Следующая очистка через 24 часа: {(current_time + timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        return True
-    
-    return False
+@app.on_event("startup")
+async def load_dedup_snapshot():
+    """Загружает снимок кеша дубликатов, сохраненный до перезапуска"""
+    try:
+        loaded = await asyncio.to_thread(dedup_cache.load_snapshot)
+        if loaded:
+            print(f"📂 Загружено {loaded} записей кеша дубликатов из {dedup_cache.snapshot_path}")
+    except Exception as e:
+        print(f"❌ Ошибка загрузки снимка кеша: {e}")
+
+
+@app.on_event("shutdown")
+async def save_dedup_snapshot():
+    """Сохраняет снимок кеша дубликатов при остановке сервиса"""
+    await save_snapshot_if_due(force=True)
+
+
+async def save_snapshot_if_due(force: bool = False) -> None:
+    """Сохраняет снимок кеша в SQLite, если прошел dedup_snapshot_interval"""
+    if not dedup_cache.snapshot_path:
+        return
+    last = dedup_cache.last_snapshot_at or 0
+    if not force and datetime.now().timestamp() - last < settings.ai_service.dedup_snapshot_interval:
+        return
+    try:
+        # Копию берем в event loop, а пишем на диск в отдельном потоке
+        rows = dedup_cache.snapshot_rows()
+        await asyncio.to_thread(dedup_cache.write_snapshot, rows)
+    except Exception as e:
+        print(f"❌ Ошибка сохранения снимка кеша: {e}")
+
+
+def check_and_auto_clear_cache() -> int:
+    """Вытесняет записи кеша, у которых истек TTL. Возвращает количество удаленных"""
+    evicted = dedup_cache.evict_expired()
+    if evicted:
+        print(f"🔄 Вытеснено {evicted} устаревших записей кеша (TTL {settings.ai_service.dedup_ttl_hours} ч)")
+    return evicted
 
 
 def generate_content_hash(text: str) -> str:
@@ -77,10 +115,10 @@ def generate_content_hash(text: str) -> str:
     return hashlib.md5(normalized.encode()).hexdigest()
 
 
-def check_content_similarity(new_text: str, existing_hashes: set) -> bool:
+def check_content_similarity(new_text: str, cache: TTLHashCache) -> bool:
     """Проверяет, похож ли новый текст на уже обработанные"""
     new_hash = generate_content_hash(new_text)
-    return new_hash in existing_hashes
+    return cache.contains(new_hash)
 
 
 def filter_duplicate_results(results: List[Dict]) -> List[Dict]:
@@ -102,10 +140,10 @@ def filter_duplicate_results(results: List[Dict]) -> List[Dict]:
         content_hash = generate_content_hash(text)
         
         # Проверяем как на глобальные, так и на сессионные дубликаты
-        if content_hash not in processed_content_hashes and content_hash not in session_hashes:
+        if content_hash not in session_hashes and not dedup_cache.contains(content_hash):
             filtered_results.append(result)
             session_hashes.add(content_hash)
-            processed_content_hashes.add(content_hash)
+            dedup_cache.add(content_hash)
             print(f"✅ Добавлен уникальный контент: {text[:50]}...")
         else:
             print(f"❌ Дубликат отфильтрован: {text[:50]}...")
@@ -113,16 +151,118 @@ def filter_duplicate_results(results: List[Dict]) -> List[Dict]:
     return filtered_results
 
 
+def attach_result_indexes(results: List[Dict], indexes: List[int]) -> List[Dict]:
+    """
+    Нормализует поле index в результатах AI.
+
+    Индекс указывает на позицию поста во входном списке posts. Индексы, которых
+    не было в запросе (indexes), отбрасываются (index=None); если в запросе был
+    один пост, результат без индекса относится к нему.
+    """
+    allowed = set(indexes)
+    normalized = []
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        index = result.get('index')
+        try:
+            index = int(index) if index is not None else None
+        except (TypeError, ValueError):
+            index = None
+        if index not in allowed:
+            index = None
+        if index is None and len(indexes) == 1:
+            index = indexes[0]
+        normalized.append({**result, 'index': index})
+    return normalized
+
+
+@lru_cache(maxsize=8)
+def get_prompt_version(prompt_template: str) -> str:
+    """Версия промпта - короткий хеш его текста (меняется при любой правке промпта)"""
+    return hashlib.md5(prompt_template.encode()).hexdigest()[:12]
+
+
+def make_response_key(prompt_version: str, post: str, has_image: bool) -> ResponseKey:
+    """Ключ кеша ответов: версия промпта, нормализованный пост и наличие изображения"""
+    return (prompt_version, generate_content_hash(post), bool(has_image))
+
+
+def remember_results(results: List[Dict]) -> None:
+    """
+    Отмечает результаты из кеша ответов в кеше дубликатов без повторной фильтрации.
+
+    Результаты в кеше ответов уже прошли фильтр дубликатов, и их хеши попали
+    в кеш дубликатов при первом ответе - повторный фильтр отбросил бы их все.
+    Хеши добавляются заново, чтобы новые ответы того же запроса сверялись с
+    ними, даже если запись в кеше дубликатов успела истечь.
+    """
+    for result in results:
+        text = result.get('text', '')
+        if text:
+            dedup_cache.add(generate_content_hash(text))
+
+
+def store_responses(results: List[Dict], posts: List[tuple], prompt_version: str, has_image: bool) -> None:
+    """
+    Сохраняет ответы Gemini в кеш по каждому входному посту.
+
+    Кешируются результаты после фильтрации дубликатов - ровно то, что получил
+    клиент, поэтому попадание в кеш возвращается без повторной фильтрации.
+    Если хотя бы один результат многопостового запроса нельзя сопоставить с
+    входным постом, ничего не кешируем: пустой ответ для поста мог бы оказаться
+    ложным.
+    """
+    if not response_cache_enabled:
+        return
+    if any(result['index'] is None for result in results):
+        return
+    for index, post in posts:
+        post_results = [
+            {key: value for key, value in result.items() if key != 'index'}
+            for result in results if result['index'] == index
+        ]
+        response_cache.put(make_response_key(prompt_version, post, has_image), post_results)
+
+
+async def generate_with_limit(content: str) -> str:
+    """
+    Асинхронно вызывает Gemini с ограничением числа одновременных запросов.
+
+    Запросы сверх gemini_concurrency ждут в очереди; если очередь длиннее
+    gemini_max_queue, запрос отклоняется с HTTP 503, чтобы клиент повторил позже.
+    """
+    global gemini_active_requests, gemini_queued_requests
+
+    if gemini_queued_requests >= settings.ai_service.gemini_max_queue:
+        print(f"🚦 Очередь Gemini переполнена ({gemini_queued_requests} запросов), запрос отклонен")
+        raise HTTPException(status_code=503, detail="Gemini queue is full, retry later")
+
+    gemini_queued_requests += 1
+    try:
+        await gemini_semaphore.acquire()
+    finally:
+        gemini_queued_requests -= 1
+
+    gemini_active_requests += 1
+    try:
+        response = await model.generate_content_async(content)
+        return response.text.strip()
+    finally:
+        gemini_active_requests -= 1
+        gemini_semaphore.release()
+
+
 # Функция обработки постов через Gemini API
-def process_posts(posts: list[str], has_image: bool = False, prompt_template: str = prompt) -> list[str]:
+async def process_posts(posts: list[str], has_image: bool = False, prompt_template: str = prompt) -> list[str]:
     # Проверяем автоочистку кеша
     check_and_auto_clear_cache()
     
-    # Проверяем на дубликаты на входе
+    # Проверяем на дубликаты на входе, запоминая исходный индекс каждого поста
     unique_posts = []
-    for post in posts:
-        if not check_content_similarity(post, processed_content_hashes):
-            unique_posts.append(post)
+    for index, post in enumerate(posts):
+        if not check_content_similarity(post, dedup_cache):
+            unique_posts.append((index, post))
         else:
             print(f"🔄 Входной пост уже обработан ранее: {post[:50]}...")
     
@@ -130,6 +270,23 @@ def process_posts(posts: list[str], has_image: bool = False, prompt_template: st
         print("🚫 Все входные посты являются дубликатами")
         return []
     
+    # Посты, на которые Gemini уже отвечал, берем из кеша ответов
+    prompt_version = get_prompt_version(prompt_template)
+    cached_results = []
+    posts_to_generate = []
+    for index, post in unique_posts:
+        cached = response_cache.get(make_response_key(prompt_version, post, has_image)) if response_cache_enabled else None
+        if cached is None:
+            posts_to_generate.append((index, post))
+        else:
+            cached_results.extend({**result, 'index': index} for result in cached)
+            print(f"⚡ Ответ взят из кеша: {post[:50]}...")
+    remember_results(cached_results)
+
+    if not posts_to_generate:
+        print(f"📊 Результат из кеша: {len(cached_results)}")
+        return cached_results
+
     # Формируем промпт, добавляя посты в виде списка
     content = prompt_template + "\n\n"
     
@@ -138,15 +295,15 @@ def process_posts(posts: list[str], has_image: bool = False, prompt_template: st
         content += "ВАЖНО: К сообщению прикреплено изображение, которое будет автоматически добавлено в пост.\n\n"
     
     # Добавляем инструкцию для уникальности с учетом количества постов
-    if len(unique_posts) > 1:
-        content += f"ВНИМАНИЕ: Обрабатывается {len(unique_posts)} постов. Убедись, что каждый выходной пост уникален и не повторяет смысл других.\n\n"
+    if len(posts_to_generate) > 1:
+        content += f"ВНИМАНИЕ: Обрабатывается {len(posts_to_generate)} постов. Убедись, что каждый выходной пост уникален и не повторяет смысл других.\n\n"
     
-    content += "\n".join(f"- {p}" for p in unique_posts)
+    # Нумеруем посты исходными индексами, чтобы клиент мог сопоставить результаты
+    content += "\n".join(f"- [{index}] {p}" for index, p in posts_to_generate)
 
     try:
-        # Отправляем запрос к Gemini API
-        response = model.generate_content(content)
-        raw = response.text.strip()
+        # Отправляем запрос к Gemini API, не блокируя event loop
+        raw = await generate_with_limit(content)
 
         # Выводим сырой ответ для отладки
         print("📥 GEMINI RAW RESPONSE:")
@@ -167,13 +324,22 @@ def process_posts(posts: list[str], has_image: bool = False, prompt_template: st
             lines = raw.splitlines()
             parsed_results = [{"text": line.strip("-• ").strip()} for line in lines if line and not line.startswith("Вот")]
 
-        # Фильтруем дубликаты
+        # Проставляем индекс входного поста для каждого результата
+        parsed_results = attach_result_indexes(parsed_results, indexes=[index for index, _ in posts_to_generate])
+
+        # Фильтруем дубликаты только в новых ответах: ответы из кеша уже отфильтрованы
         filtered_results = filter_duplicate_results(parsed_results)
         
-        print(f"📊 Результат: {len(parsed_results)} -> {len(filtered_results)} (после фильтрации дубликатов)")
+        # Запоминаем отфильтрованные ответы - повтор поста получит тот же результат
+        store_responses(filtered_results, posts_to_generate, prompt_version, has_image)
         
-        return filtered_results
+        print(f"📊 Результат: {len(parsed_results)} -> {len(filtered_results)} (после фильтрации дубликатов), из кеша: {len(cached_results)}")
+        
+        return cached_results + filtered_results
 
+    except HTTPException:
+        # Переполнение очереди отдаем клиенту как есть
+        raise
     except Exception as e:
         # Логируем ошибку и возвращаем пустой список
         print(f"❌ Gemini Error: {e}")
@@ -184,7 +350,8 @@ def process_posts(posts: list[str], has_image: bool = False, prompt_template: st
 @app.post('/gemini/filter')
 async def multi_filter(data: PostBatch):
     # Обрабатываем посты и возвращаем результат
-    result = process_posts(posts=data.posts, has_image=data.has_image)
+    result = await process_posts(posts=data.posts, has_image=data.has_image)
+    await save_snapshot_if_due()
     return {
         'status': 'success',
         'result': result,
@@ -195,10 +362,10 @@ async def multi_filter(data: PostBatch):
 @app.post('/gemini/clear_cache')
 async def clear_duplicate_cache():
     """Очищает кеш дубликатов"""
-    global processed_content_hashes, last_cache_clear
-    cache_size = len(processed_content_hashes)
-    processed_content_hashes.clear()
+    global last_cache_clear
+    cache_size = dedup_cache.clear()
     last_cache_clear = datetime.now()
+    await save_snapshot_if_due(force=True)
     return {
         'status': 'success',
         'message': f'Кеш очищен вручную. Удалено {cache_size} записей.'
@@ -209,42 +376,30 @@ async def clear_duplicate_cache():
 @app.get('/gemini/cache_stats')
 async def get_cache_stats():
     """Возвращает статистику кеша"""
-    current_time = datetime.now()
-    hours_since_clear = (current_time - last_cache_clear).total_seconds() / 3600
-    hours_until_clear = max(0, 24 - hours_since_clear)
-    
+    check_and_auto_clear_cache()
     return {
         'status': 'success',
-        'cache_size': len(processed_content_hashes),
-        'recent_hashes': list(processed_content_hashes)[-10:] if processed_content_hashes else [],
-        'last_auto_clear': last_cache_clear.strftime('%Y-%m-%d %H:%M:%S'),
-        'hours_since_clear': round(hours_since_clear, 1),
-        'hours_until_next_clear': round(hours_until_clear, 1),
-        'next_auto_clear': (last_cache_clear + timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S')
+        **dedup_cache.stats(),
+        'recent_hashes': list(dedup_cache.entries)[-10:],
+        'response_cache': response_cache.stats(),
+        'last_manual_clear': last_cache_clear.strftime('%Y-%m-%d %H:%M:%S'),
     }
 
 
-# Эндпоинт для принудительного запуска автоочистки
+# Эндпоинт для принудительного запуска вытеснения устаревших записей
 @app.post('/gemini/force_auto_clear')
 async def force_auto_clear():
-    """Принудительно запускает автоочистку кеша"""
-    global last_cache_clear
-    # Устанавливаем время последней очистки на 25 часов назад
-    last_cache_clear = datetime.now() - timedelta(hours=25)
-    
-    # Запускаем проверку автоочистки
-    was_cleared = check_and_auto_clear_cache()
-    
-    if was_cleared:
-        return {
-            'status': 'success',
-            'message': 'Автоочистка кеша выполнена принудительно'
-        }
-    else:
-        return {
-            'status': 'error',
-            'message': 'Ошибка при выполнении автоочистки'
-        }
+    """Принудительно вытесняет записи кеша с истекшим TTL"""
+    evicted = check_and_auto_clear_cache()
+    expired_responses = response_cache.evict_expired()
+    await save_snapshot_if_due(force=True)
+    return {
+        'status': 'success',
+        'message': (
+            f'Вытеснено {evicted} записей с истекшим TTL ({settings.ai_service.dedup_ttl_hours} ч), '
+            f'ответов из кеша Gemini: {expired_responses}'
+        )
+    }
 
 
 # Health check эндпоинт для мониторинга состояния сервиса
@@ -257,8 +412,13 @@ async def health_check():
     return {
         'status': 'healthy',
         'timestamp': current_time.isoformat(),
-        'cache_size': len(processed_content_hashes),
+        'cache_size': len(dedup_cache),
+        'response_cache_size': len(response_cache),
+        'response_cache_hit_rate': response_cache.stats()['hit_rate'],
         'gemini_model': 'gemini-1.5-flash',
+        'gemini_active_requests': gemini_active_requests,
+        'gemini_queued_requests': gemini_queued_requests,
+        'gemini_concurrency': settings.ai_service.gemini_concurrency,
         'last_cache_clear': last_cache_clear.isoformat(),
         'hours_since_clear': round(hours_since_clear, 1),
         'version': '1.0.0'
@@ -43,10 +43,12 @@ prompt = (
     "- Если несколько входных постов касаются одного события - объедини их в один качественный пост.\n"
     "- Варьируй структуру предложений: используй простые, сложные, причастные обороты.\n"
     "- Используй разные способы подачи информации: прямая подача фактов, аналитический подход, контекстное объяснение.\n\n"
-    "Формат ответа — JSON-массив объектов. Каждый объект содержит поле `text` с очищенным постом:\n"
+    "Формат ответа — JSON-массив объектов. Каждый объект содержит поле `text` с очищенным постом "
+    "и поле `index` — номер входного поста (число в квадратных скобках перед ним), из которого получен результат. "
+    "Если пост объединяет несколько входных постов, укажи номер первого из них:\n"
     "[\n"
-    "  { \"text\": \"...\" },\n"
-    "  { \"text\": \"...\" }\n"
+    "  { \"index\": 0, \"text\": \"...\" },\n"
+    "  { \"index\": 2, \"text\": \"...\" }\n"
     "]\n\n"
     "Пример удаления рекламы:\n"
     "Входной пост в списке: \"🔥 Подписывайся! Сигналы каждый день!\"\n"
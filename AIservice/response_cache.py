@@ -0,0 +1,94 @@
+###############################
+#           system libs
+#------------------------------
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+# Ключ кеша: (версия промпта, хеш нормализованного поста, есть ли изображение)
+ResponseKey = Tuple[str, str, bool]
+
+
+class ResponseCache:
+    """
+    Кеш ответов Gemini для отдельных входных постов с вытеснением LRU + TTL.
+
+    Значение - список результатов, которые Gemini вернул для поста (пустой
+    список тоже кешируется: пост был отфильтрован как реклама или мусор).
+    Версия промпта входит в ключ, поэтому после правки промпта старые ответы
+    перестают находиться и постепенно вытесняются.
+
+    Args:
+        max_entries (int): Максимальное число записей; при переполнении удаляется
+            давно не использованная
+        ttl_seconds (float): Время жизни записи с момента сохранения
+    """
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+
+        self.entries: "OrderedDict[ResponseKey, Tuple[List[Dict], float]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # вытеснено по LRU
+        self.expirations = 0  # удалено по TTL
+
+    def get(self, key: ResponseKey) -> Optional[List[Dict]]:
+        """Возвращает копию сохраненного ответа или None, если его нет или он устарел"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        results, stored_at = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return [dict(result) for result in results]
+
+    def put(self, key: ResponseKey, results: List[Dict]) -> None:
+        """Сохраняет ответ для поста, вытесняя самые старые по использованию записи"""
+        self.entries[key] = ([dict(result) for result in results], time.time())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def evict_expired(self) -> int:
+        """Удаляет все записи с истекшим TTL. Возвращает количество удаленных"""
+        cutoff = time.time() - self.ttl_seconds
+        expired = [key for key, (_, stored_at) in self.entries.items() if stored_at < cutoff]
+        for key in expired:
+            del self.entries[key]
+        self.expirations += len(expired)
+        return len(expired)
+
+    def clear(self) -> int:
+        """Полностью очищает кеш. Возвращает количество удаленных записей"""
+        size = len(self.entries)
+        self.entries.clear()
+        return size
+
+    def stats(self) -> Dict:
+        """Возвращает счетчики кеша"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'ttl_hours': round(self.ttl_seconds / 3600, 2),
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
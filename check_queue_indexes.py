@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+import logging
+import sys
+
+from sqlalchemy import select, text, and_, or_, exists
+
+from database.models import engine, Messages, NewsStatus, MessageDelivery, DeliveryStatus
+from database.message_queue import lease_is_free
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def build_queue_queries(sample_channel_ids: list[int]) -> dict:
+    """Запросы очереди в том виде, в котором их выполняет posting worker"""
+    now = datetime.utcnow()
+    return {
+        "AI очередь (NEW)": (
+            select(Messages.id)
+            .where(
+                or_(
+                    Messages.status == NewsStatus.NEW,
+                    and_(Messages.status == NewsStatus.SENT_TO_AI, Messages.lease_until != None)
+                ),
+                Messages.text != None,
+                Messages.text != "",
+                lease_is_free(now)
+            )
+            .order_by(Messages.date.asc())
+            .limit(5)
+        ),
+        "Рассылка по каналам (AI_PROCESSED без доставок)": (
+            select(Messages.id)
+            .where(
+                Messages.status == NewsStatus.AI_PROCESSED,
+                Messages.ai_processed_text != None,
+                Messages.ai_processed_text != "",
+                Messages.channel_id.in_(sample_channel_ids),
+                ~exists().where(MessageDelivery.message_id == Messages.id),
+                lease_is_free(now)
+            )
+            .order_by(Messages.date.asc())
+            .limit(5)
+        ),
+        "Доставки в каналы (PENDING / ERROR)": (
+            select(MessageDelivery.id)
+            .where(
+                MessageDelivery.status.in_([DeliveryStatus.PENDING, DeliveryStatus.ERROR]),
+                MessageDelivery.target_chat_id.in_(["@sample_target"]),
+                MessageDelivery.retry_count < 3,
+                lease_is_free(now, MessageDelivery)
+            )
+            .order_by(MessageDelivery.id.asc())
+            .limit(5)
+        ),
+        "Повтор ошибок (retry_count)": (
+            select(Messages.id)
+            .where(
+                (Messages.status == NewsStatus.ERROR_AI_PROCESSING) |
+                (Messages.status == NewsStatus.ERROR_POSTING),
+                (Messages.retry_count < 3) | (Messages.retry_count == None),
+                lease_is_free(now)
+            )
+            .order_by(Messages.date.asc())
+            .limit(2)
+        ),
+        "Дубликат по content_hash": (
+            select(Messages.id)
+            .where(
+                Messages.content_hash == "0" * 32,
+                Messages.status == NewsStatus.POSTED,
+                Messages.date >= now - timedelta(hours=24)
+            )
+            .limit(1)
+        ),
+    }
+
+
+def explain(connection, query) -> tuple[list[str], list[str], list[str]]:
+    """
+    Выполняет EXPLAIN для запроса и разбирает план.
+
+    Returns:
+        tuple[list[str], list[str], list[str]]: строки плана, проблемы (полный
+            просмотр таблицы) и замечания (сортировка без индекса - допустима,
+            пока после фильтра по индексу остается мало строк)
+    """
+    dialect = engine.dialect.name
+    sql = str(query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    problems = []
+    notes = []
+
+    if dialect == "mysql":
+        result = connection.execute(text(f"EXPLAIN {sql}"))
+        columns = list(result.keys())
+        plan = []
+        for row in result:
+            row = dict(zip(columns, row))
+            plan.append(
+                f"type={row.get('type')} key={row.get('key')} rows={row.get('rows')} extra={row.get('Extra')}"
+            )
+            if row.get("type") == "ALL":
+                problems.append("полный просмотр таблицы (type=ALL)")
+            if "filesort" in (row.get("Extra") or ""):
+                notes.append("сортировка без индекса (Using filesort)")
+    elif dialect == "postgresql":
+        plan = [row[0] for row in connection.execute(text(f"EXPLAIN {sql}"))]
+        if any("Seq Scan on messages" in line or "Seq Scan on message_deliveries" in line for line in plan):
+            problems.append("полный просмотр таблицы (Seq Scan)")
+        if any(line.strip().startswith("Sort") for line in plan):
+            notes.append("сортировка без индекса (Sort)")
+    elif dialect == "sqlite":
+        plan = [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+        if any(line.startswith(("SCAN messages", "SCAN message_deliveries")) and "INDEX" not in line for line in plan):
+            problems.append("полный просмотр таблицы (SCAN)")
+        if any("TEMP B-TREE FOR ORDER BY" in line for line in plan):
+            notes.append("сортировка без индекса (TEMP B-TREE)")
+    else:
+        plan = [f"EXPLAIN для диалекта {dialect} не поддерживается"]
+
+    return plan, problems, notes
+
+
+def check_queue_indexes() -> bool:
+    """Проверяет планы запросов очереди. Возвращает True, если все запросы идут по индексам"""
+    with engine.connect() as connection:
+        sample_channel_ids = connection.execute(
+            select(Messages.channel_id).distinct().limit(5)
+        ).scalars().all() or [0]
+
+        all_ok = True
+        for name, query in build_queue_queries(sample_channel_ids).items():
+            plan, problems, notes = explain(connection, query)
+            logger.info(f"🔍 {name}")
+            for line in plan:
+                logger.info(f"    {line}")
+            for note in notes:
+                logger.info(f"    ℹ️  {note}")
+            if problems:
+                all_ok = False
+                for problem in problems:
+                    logger.warning(f"    ⚠️  {problem}")
+            else:
+                logger.info("    ✅ запрос использует индексы")
+
+    return all_ok
+
+
+if __name__ == "__main__":
+    print("🔍 Проверка планов запросов очереди сообщений (EXPLAIN)")
+    if check_queue_indexes():
+        print("🎉 Все запросы очереди используют индексы")
+    else:
+        print("❌ Есть запросы без индекса - примените migrate_add_queue_indexes.py")
+        sys.exit(1)
@@ -8,6 +8,30 @@ class AIServiceSettings(BaseModel):
     """Настройки сервиса искусственного интеллекта"""
     gemini_key: str  # Ключ API для Gemini
     api_url: str = Field(default="", description="URL API искусственного интеллекта для фильтрации")
+    batch_size: int = 1  # Сколько NEW сообщений отправлять в AI одним запросом (1 - без пакетов)
+    handoff_queue_size: int = 1000  # Очередь ID новых сообщений от парсера к AI этапу (0 - только опрос БД)
+    handoff_linger: float = 0.2  # Сколько ждать следующих ID, чтобы собрать пакет (секунды)
+    
+    # Настройки HTTP клиента posting worker'а для запросов к AI
+    request_timeout: float = 30.0  # Таймаут запроса к AI сервису (секунды)
+    http_max_connections: int = 20  # Максимум одновременных соединений в пуле
+    http_max_keepalive: int = 10  # Максимум простаивающих keep-alive соединений
+    http_keepalive_expiry: float = 30.0  # Время жизни простаивающего соединения (секунды)
+    http2: bool = False  # Использовать HTTP/2 (нужен пакет h2: pip install httpx[http2])
+    
+    # Поиск почти-дубликатов (SimHash) в posting worker
+    near_dup_enabled: bool = True  # Пропускать почти-дубликаты до AI и перед постингом
+    near_dup_max_distance: int = 8  # Максимальное расстояние Хэмминга между 64-битными отпечатками
+    near_dup_retention_hours: float = 72  # Сколько часов истории хранить в индексе
+    
+    # Настройки самого AI сервиса
+    gemini_concurrency: int = 4  # Сколько запросов к Gemini выполняется одновременно
+    gemini_max_queue: int = 100  # Сколько запросов может ждать в очереди (сверх лимита - HTTP 503)
+    dedup_ttl_hours: float = 24  # Время жизни каждой записи кеша дубликатов (часы)
+    dedup_snapshot_path: str = ""  # Путь к SQLite снимку кеша дубликатов (пусто - без снимка)
+    dedup_snapshot_interval: float = 60  # Как часто сохранять снимок (секунды)
+    response_cache_size: int = 5000  # Сколько ответов Gemini хранить в кеше (0 - кеш выключен)
+    response_cache_ttl_hours: float = 6  # Время жизни ответа в кеше (часы)
     
     model_config = ConfigDict(extra="allow")
 
@@ -30,6 +54,27 @@ class TelegramBotSettings(BaseModel):
     # Настройки отображения ссылок
     disable_link_preview: bool = True  # Отключить превью ссылок в сообщениях
     
+    # Настройки планировщика постинга
+    posting_global_rate: float = 25.0  # Глобальный лимит отправок бота (сообщений в секунду)
+    posting_chat_rate: float = 20.0  # Лимит отправок в один канал (сообщений в минуту)
+    posting_chat_burst: int = 3  # Допустимый всплеск отправок в один канал
+    posting_retry_after_attempts: int = 3  # Сколько раз повторять отправку после ответа 429 (retry_after)
+    posting_membership_ttl: float = 3600  # Сколько секунд доверять проверке "бот в канале"
+    posting_image_preprocess: bool = False  # Уменьшать и пережимать фото перед загрузкой (нужен Pillow)
+    posting_image_max_side: int = 1280  # Максимальная сторона фото после уменьшения (пиксели)
+    posting_image_quality: int = 85  # Качество JPEG после пережатия
+    posting_image_workers: int = 2  # Процессов для обработки фото
+    posting_lane_batch_size: int = 5  # Сколько сообщений забирает полоса канала за цикл
+    worker_id: str = ""  # Идентификатор процесса воркера в claimed_by (пусто - хост:PID)
+    claim_lease_seconds: int = 300  # Аренда взятого в работу сообщения; после нее его подхватит другой воркер
+    
+    # Этапы posting worker (AI, постинг, ошибки) - независимые задачи
+    pipeline_ai_concurrency: int = 1  # Параллельных циклов AI этапа
+    pipeline_posting_concurrency: int = 1  # Параллельных циклов этапа постинга
+    pipeline_idle_interval: float = 10.0  # Пауза этапа, когда работы нет (секунды)
+    pipeline_errors_interval: float = 30.0  # Период повтора ошибок (секунды)
+    pipeline_max_posting_backlog: int = 200  # AI этап ждет, пока обработанных и не опубликованных больше N (0 - без ограничения)
+    
     # Настройки аутентификации
     admin_password: str  # Пароль админа
     session_duration_hours: int  # Длительность сессии в часах
@@ -52,6 +97,13 @@ class TelegramParserSettings(BaseModel):
     phone_number: Optional[str] = None  # Номер телефона для авторизации в Telegram API
     session: str  # Имя файла сессии Telegram
     photo_storage: str  # Путь для хранения фотографий
+    album_window: float = 1.5  # Сколько секунд ждать остальные части альбома (grouped_id)
+    download_workers: int = 3  # Фоновых загрузчиков фото
+    download_queue_size: int = 200  # Размер очереди загрузок; при заполнении парсер ждет свободного места
+    download_timeout: float = 60.0  # Таймаут загрузки одного сообщения (секунды); столько же AI этап ждет фото
+    photo_retention_days: float = 14.0  # Через сколько дней удалять фото опубликованных / отброшенных сообщений (0 - хранить всегда)
+    photo_retention_batch: int = 200  # Сообщений за один шаг очистки
+    photo_retention_interval: float = 300.0  # Пауза этапа очистки, когда работы нет (секунды)
     
     model_config = ConfigDict(extra="allow")
 
@@ -60,6 +112,17 @@ class DatabaseSettings(BaseModel):
     """Настройки базы данных"""
     connect_string: str  # Строка подключения к базе данных
     
+    # Пул соединений (для каждого движка: синхронного и асинхронного)
+    pool_size: int = 10  # Постоянные соединения в пуле
+    max_overflow: int = 20  # Дополнительные соединения сверх pool_size при пиках
+    pool_timeout: float = 30.0  # Сколько ждать свободного соединения (секунды)
+    pool_recycle: int = 1800  # Пересоздавать соединения старше N секунд (меньше wait_timeout MySQL)
+    pool_pre_ping: bool = False  # Проверять соединение при каждой выдаче (лишний round trip)
+    
+    # Отложенная запись статусов сообщений (posting worker)
+    status_flush_interval: float = 0.3  # Период сброса буфера (секунды); 0 - писать сразу
+    status_flush_max_rows: int = 200  # Внеочередной сброс при накоплении N сообщений
+    
     model_config = ConfigDict(extra="allow")
 
 
@@ -102,7 +165,25 @@ class Settings(BaseSettings):
             # Создаем настройки для ИИ сервиса
             ai_service = AIServiceSettings(
                 gemini_key=os.getenv("GEMINI_KEY", ""),
-                api_url=os.getenv("AI_API_URL", "")
+                api_url=os.getenv("AI_API_URL", ""),
+                batch_size=int(os.getenv("AI_BATCH_SIZE", "1")),
+                handoff_queue_size=int(os.getenv("AI_HANDOFF_QUEUE_SIZE", "1000")),
+                handoff_linger=float(os.getenv("AI_HANDOFF_LINGER", "0.2")),
+                request_timeout=float(os.getenv("AI_REQUEST_TIMEOUT", "30")),
+                http_max_connections=int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "20")),
+                http_max_keepalive=int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "10")),
+                http_keepalive_expiry=float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY", "30")),
+                http2=os.getenv("AI_HTTP2", "false").lower() in ("true", "1", "yes"),
+                near_dup_enabled=os.getenv("NEAR_DUP_ENABLED", "true").lower() in ("true", "1", "yes"),
+                near_dup_max_distance=int(os.getenv("NEAR_DUP_MAX_DISTANCE", "8")),
+                near_dup_retention_hours=float(os.getenv("NEAR_DUP_RETENTION_HOURS", "72")),
+                gemini_concurrency=int(os.getenv("GEMINI_CONCURRENCY", "4")),
+                gemini_max_queue=int(os.getenv("GEMINI_MAX_QUEUE", "100")),
+                dedup_ttl_hours=float(os.getenv("AI_DEDUP_TTL_HOURS", "24")),
+                dedup_snapshot_path=os.getenv("AI_DEDUP_SNAPSHOT_PATH", ""),
+                dedup_snapshot_interval=float(os.getenv("AI_DEDUP_SNAPSHOT_INTERVAL", "60")),
+                response_cache_size=int(os.getenv("AI_RESPONSE_CACHE_SIZE", "5000")),
+                response_cache_ttl_hours=float(os.getenv("AI_RESPONSE_CACHE_TTL_HOURS", "6"))
             )
             
             # Настройки для бота Telegram
@@ -120,6 +201,24 @@ class Settings(BaseSettings):
                 promo_news_url=os.getenv("PROMO_NEWS_URL", "https://t.me/+T2sxJEJj2343Y2Ji"),
                 # Настройки отображения ссылок
                 disable_link_preview=os.getenv("DISABLE_LINK_PREVIEW", "true").lower() in ("true", "1", "yes"),
+                # Настройки планировщика постинга
+                posting_global_rate=float(os.getenv("POSTING_GLOBAL_RATE", "25")),
+                posting_chat_rate=float(os.getenv("POSTING_CHAT_RATE", "20")),
+                posting_chat_burst=int(os.getenv("POSTING_CHAT_BURST", "3")),
+                posting_retry_after_attempts=int(os.getenv("POSTING_RETRY_AFTER_ATTEMPTS", "3")),
+                posting_membership_ttl=float(os.getenv("POSTING_MEMBERSHIP_TTL", "3600")),
+                posting_image_preprocess=os.getenv("POSTING_IMAGE_PREPROCESS", "false").lower() in ("true", "1", "yes"),
+                posting_image_max_side=int(os.getenv("POSTING_IMAGE_MAX_SIDE", "1280")),
+                posting_image_quality=int(os.getenv("POSTING_IMAGE_QUALITY", "85")),
+                posting_image_workers=int(os.getenv("POSTING_IMAGE_WORKERS", "2")),
+                posting_lane_batch_size=int(os.getenv("POSTING_LANE_BATCH_SIZE", "5")),
+                worker_id=os.getenv("POSTING_WORKER_ID", ""),
+                claim_lease_seconds=int(os.getenv("POSTING_LEASE_SECONDS", "300")),
+                pipeline_ai_concurrency=int(os.getenv("PIPELINE_AI_CONCURRENCY", "1")),
+                pipeline_posting_concurrency=int(os.getenv("PIPELINE_POSTING_CONCURRENCY", "1")),
+                pipeline_idle_interval=float(os.getenv("PIPELINE_IDLE_INTERVAL", "10")),
+                pipeline_errors_interval=float(os.getenv("PIPELINE_ERRORS_INTERVAL", "30")),
+                pipeline_max_posting_backlog=int(os.getenv("PIPELINE_MAX_POSTING_BACKLOG", "200")),
                 # Настройки аутентификации
                 admin_password=os.getenv("ADMIN_PASSWORD", "admin123"),
                 session_duration_hours=int(os.getenv("SESSION_DURATION_HOURS", "12")),
@@ -138,12 +237,26 @@ class Settings(BaseSettings):
             telegram_parser = TelegramParserSettings(
                 phone_number=os.getenv("PHONE_NUMBER"),
                 session=os.getenv("SESSION", ""),
-                photo_storage=os.getenv("PHOTO_STORAGE", "database/photos")
+                photo_storage=os.getenv("PHOTO_STORAGE", "database/photos"),
+                album_window=float(os.getenv("PARSER_ALBUM_WINDOW", "1.5")),
+                download_workers=int(os.getenv("PARSER_DOWNLOAD_WORKERS", "3")),
+                download_queue_size=int(os.getenv("PARSER_DOWNLOAD_QUEUE_SIZE", "200")),
+                download_timeout=float(os.getenv("PARSER_DOWNLOAD_TIMEOUT", "60")),
+                photo_retention_days=float(os.getenv("PHOTO_RETENTION_DAYS", "14")),
+                photo_retention_batch=int(os.getenv("PHOTO_RETENTION_BATCH", "200")),
+                photo_retention_interval=float(os.getenv("PHOTO_RETENTION_INTERVAL", "300"))
             )
             
             # Настройки базы данных
             database = DatabaseSettings(
-                connect_string=os.getenv("DB_CONNECT_STRING", "")
+                connect_string=os.getenv("DB_CONNECT_STRING", ""),
+                pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+                max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+                pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+                pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+                pool_pre_ping=os.getenv("DB_POOL_PRE_PING", "false").lower() in ("true", "1", "yes"),
+                status_flush_interval=float(os.getenv("DB_STATUS_FLUSH_INTERVAL", "0.3")),
+                status_flush_max_rows=int(os.getenv("DB_STATUS_FLUSH_MAX_ROWS", "200"))
             )
             
             # Создаем объект настроек
@@ -1,5 +1,5 @@
 from telethon.tl.types import Channel
-from database.manager import session_scope
+from database.manager import session_scope, async_session_scope
 from database.models import Channels, engine, PostingTarget
 from sqlalchemy.orm import Session
 from sqlalchemy import select, Select, update
@@ -98,4 +98,49 @@ def get_channel_by_peer_id(peer_id: int) -> Channels | None:
     with Session(engine) as connection:
         query: Select = select(Channels).where(Channels.peer_id == peer_id)
         result = connection.scalars(query).one_or_none()
-        return result
\ No newline at end of file
+        return result
+
+
+async def get_channel_by_peer_id_async(peer_id: int) -> Channels | None:
+    """Асинхронная версия get_channel_by_peer_id"""
+    async with async_session_scope() as session:
+        query: Select = select(Channels).where(Channels.peer_id == peer_id)
+        return (await session.scalars(query)).one_or_none()
+
+
+async def add_channel_async(channel: Channel) -> None:
+    """
+    Асинхронная версия add_channel.
+    
+    Args:
+        channel (Channel): Объект канала Telethon, содержащий информацию о канале
+    """
+    try:
+        async with async_session_scope() as session:
+            # Проверяем существование канала по peer_id
+            query = select(Channels).where(Channels.peer_id == channel.id)
+            if (await session.scalars(query)).one_or_none():
+                print(f"Channel {channel.title} already exists in db with peer_id={channel.id}")
+                return
+
+            # Проверяем существование канала по username, если он есть
+            if channel.username:
+                query = select(Channels).where(Channels.username == channel.username)
+                existing_by_username = (await session.scalars(query)).one_or_none()
+                if existing_by_username:
+                    print(f"Channel {channel.title} already exists with username={channel.username}")
+
+                    # Если найден канал с тем же именем, но другим ID, обновляем ID
+                    if existing_by_username.peer_id != channel.id:
+                        print(f"Updating channel peer_id from {existing_by_username.peer_id} to {channel.id}")
+                        existing_by_username.peer_id = channel.id
+                    return
+
+            session.add(Channels(
+                peer_id = channel.id,
+                username = channel.username,
+                title = channel.title
+            ))
+        print(f"Channel {channel.title} added to db with peer_id={channel.id}")
+    except Exception as error:
+        print(f"Error adding channel: {error}")
@@ -4,7 +4,7 @@ from typing import List, Optional, Dict, Any, Union
 import logging
 
 from database.models import ParsingTelegramAccount
-from database.manager import session_scope
+from database.manager import session_scope, async_session_scope
 
 
 class ParsingTelegramAccRepository:
@@ -212,3 +212,24 @@ class ParsingTelegramAccRepository:
             logging.error(f"Ошибка при получении активных аккаунтов для парсинга: {e}")
             return []
                 
+
+    async def get_active_parsing_accounts_async(self) -> List[Dict[str, Any]]:
+        """
+        Асинхронная версия get_active_parsing_accounts для парсера
+        """
+        try:
+            async with async_session_scope() as db:
+                accounts = (await db.execute(select(ParsingTelegramAccount).filter_by(is_active=True))).scalars().all()
+                return [
+                    {
+                        'id': account.id,
+                        'phone_number': account.phone_number,
+                        'session_string': account.session_string,
+                        'status': account.status,
+                        'is_active': account.is_active
+                    }
+                    for account in accounts
+                ]
+        except Exception as e:
+            logging.error(f"Ошибка при получении активных аккаунтов для парсинга: {e}")
+            return []
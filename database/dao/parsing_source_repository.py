@@ -4,7 +4,7 @@ from typing import List, Optional, Dict, Any, Union
 import logging
 
 from database.models import ParsingSourceChannel, PostingTarget
-from database.manager import session_scope
+from database.manager import session_scope, async_session_scope
 
 class ParsingSourceRepository:
     """
@@ -263,6 +263,30 @@ class ParsingSourceRepository:
             logging.error(f"Ошибка при получении всех источников парсинга: {e}")
             return []
 
+    async def get_all_sources_async(self) -> List[Dict[str, Any]]:
+        """
+        Асинхронная версия get_all_sources для парсера.
+        
+        Returns:
+            List[Dict[str, Any]]: Список словарей с данными всех источников парсинга.
+        """
+        try:
+            async with async_session_scope() as db:
+                sources = (await db.execute(select(ParsingSourceChannel))).scalars().all()
+                return [
+                    {
+                        "id": source.id,
+                        "source_identifier": source.source_identifier,
+                        "source_title": source.source_title,
+                        "posting_target_id": source.posting_target_id,
+                        "added_at": source.added_at.isoformat() if source.added_at else None
+                    }
+                    for source in sources
+                ]
+        except Exception as e:
+            logging.error(f"Ошибка при получении всех источников парсинга: {e}")
+            return []
+
     def update_source(self, source_db_id: int, new_source_identifier: str = None, new_source_title: str = None) -> bool:
         """
         Обновляет информацию об источнике парсинга.
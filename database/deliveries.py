@@ -0,0 +1,263 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import select, update, insert, func, case, exists, and_
+from sqlalchemy.orm import selectinload
+
+from database.models import Messages, MessageDelivery, DeliveryStatus, NewsStatus, AsyncSessionLocal
+from database.message_queue import claim_rows, lease_release_values
+
+
+# Доставки, которые еще будут отправляться (остальные статусы окончательные)
+OPEN_DELIVERY_STATUSES = (DeliveryStatus.PENDING, DeliveryStatus.ERROR)
+
+
+async def create_deliveries(routes: dict[int, list[str]]) -> int:
+    """
+    Создает доставки (сообщение, целевой канал) и освобождает аренду сообщений.
+
+    Args:
+        routes (dict[int, list[str]]): ID сообщения -> target_chat_id каналов,
+            в которые его нужно опубликовать
+
+    Returns:
+        int: Количество созданных доставок
+
+    Действия:
+    Одной транзакцией вставляет доставки со статусом PENDING и снимает аренду
+    с сообщений: сообщение с доставками больше не попадает в рассылку,
+    поэтому упавший посередине воркер не создаст доставки дважды.
+    """
+    rows = [
+        {"message_id": message_id, "target_chat_id": target_chat_id, "status": DeliveryStatus.PENDING, "retry_count": 0}
+        for message_id, target_chat_ids in routes.items()
+        for target_chat_id in target_chat_ids
+    ]
+    if not rows:
+        return 0
+
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(MessageDelivery), rows)
+        await session.execute(
+            update(Messages)
+            .where(Messages.id.in_(list(routes)))
+            .values(**lease_release_values())
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    return len(rows)
+
+
+async def claim_deliveries(
+    target_chat_ids: list[str],
+    worker_id: str,
+    lease_seconds: float,
+    limit: int,
+    max_retry_count: int = 3
+) -> list[MessageDelivery]:
+    """
+    Забирает в аренду ожидающие доставки всех переданных каналов одним запросом.
+
+    Args:
+        target_chat_ids (list[str]): Активные целевые каналы
+        worker_id (str): Идентификатор процесса воркера
+        lease_seconds (float): Длительность аренды
+        limit (int): Максимальное количество доставок
+        max_retry_count (int): Доставки с большим числом неудач не выбираются
+
+    Returns:
+        list[MessageDelivery]: Доставки с загруженными сообщениями и фото альбомов (старые в начале)
+    """
+    if not target_chat_ids:
+        return []
+    return await claim_rows(
+        MessageDelivery,
+        conditions=[
+            MessageDelivery.status.in_(OPEN_DELIVERY_STATUSES),
+            MessageDelivery.target_chat_id.in_(target_chat_ids),
+            MessageDelivery.retry_count < max_retry_count
+        ],
+        worker_id=worker_id,
+        lease_seconds=lease_seconds,
+        limit=limit,
+        order_by=MessageDelivery.id.asc(),
+        options=(selectinload(MessageDelivery.message).selectinload(Messages.media),)
+    )
+
+
+async def save_delivery_results(results: list[dict]) -> None:
+    """
+    Записывает результаты отправки пачкой и освобождает аренду доставок.
+
+    Args:
+        results (list[dict]): Значения полей доставок с ключом "id"
+            (status, retry_count, error_info, posted_at)
+    """
+    if not results:
+        return
+    async with AsyncSessionLocal() as session:
+        # ORM bulk UPDATE по первичному ключу (executemany)
+        await session.execute(
+            update(MessageDelivery),
+            [{**values, **lease_release_values()} for values in results]
+        )
+        await session.commit()
+
+
+async def get_finished_messages(message_ids: list[int], target_chat_ids: list[str]) -> dict[int, bool]:
+    """
+    Находит сообщения, все доставки которых в активные каналы завершены.
+
+    Args:
+        message_ids (list[int]): Сообщения, доставки которых обрабатывались в этом цикле
+        target_chat_ids (list[str]): Активные целевые каналы; доставки в отключенные
+            каналы не задерживают итоговый статус сообщения
+
+    Returns:
+        dict[int, bool]: ID завершенного сообщения -> опубликовано ли оно хотя бы в один канал
+    """
+    if not message_ids:
+        return {}
+
+    is_open = MessageDelivery.status.in_(OPEN_DELIVERY_STATUSES) & MessageDelivery.target_chat_id.in_(target_chat_ids)
+    query = (
+        select(
+            MessageDelivery.message_id,
+            func.sum(case((is_open, 1), else_=0)),
+            func.sum(case((MessageDelivery.status == DeliveryStatus.POSTED, 1), else_=0))
+        )
+        .where(MessageDelivery.message_id.in_(message_ids))
+        .group_by(MessageDelivery.message_id)
+    )
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(query)).all()
+
+    return {message_id: bool(posted) for message_id, open_count, posted in rows if not open_count}
+
+
+async def get_stalled_messages(target_chat_ids: list[str], limit: int = 100) -> list[int]:
+    """
+    Находит сообщения AI_PROCESSED, у которых есть доставки, но ни одной
+    открытой доставки в активные каналы.
+
+    Итоговый статус сообщению ставит цикл постинга, но только для доставок,
+    взятых в этом цикле. Если оставшиеся доставки ведут в отключенные каналы,
+    их больше никто не возьмет, и сообщение без периодической проверки
+    осталось бы в AI_PROCESSED навсегда.
+
+    Args:
+        target_chat_ids (list[str]): Активные целевые каналы
+        limit (int): Максимальное количество сообщений
+
+    Returns:
+        list[int]: ID сообщений, которым можно ставить итоговый статус
+    """
+    is_open = and_(
+        MessageDelivery.message_id == Messages.id,
+        MessageDelivery.status.in_(OPEN_DELIVERY_STATUSES),
+        MessageDelivery.target_chat_id.in_(target_chat_ids)
+    )
+    query = (
+        select(Messages.id)
+        .where(
+            Messages.status == NewsStatus.AI_PROCESSED,
+            exists().where(MessageDelivery.message_id == Messages.id),
+            ~exists().where(is_open)
+        )
+        .order_by(Messages.id.asc())
+        .limit(limit)
+    )
+    async with AsyncSessionLocal() as session:
+        return list((await session.scalars(query)).all())
+
+
+async def requeue_failed_deliveries(message_ids: list[int]) -> int:
+    """
+    Возвращает неудачные доставки сообщений в очередь отправки.
+
+    Сообщение с доставками не попадает в рассылку по каналам, поэтому для
+    повторного постинга недостаточно вернуть ему статус AI_PROCESSED:
+    доставки с ошибками снова получают статус PENDING и обнуленный счетчик
+    попыток. У сообщения без доставок (ошибка до рассылки) менять нечего -
+    его заново разошлет fan_out_messages.
+
+    Returns:
+        int: Количество возвращенных в очередь доставок
+    """
+    if not message_ids:
+        return 0
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(MessageDelivery)
+            .where(
+                MessageDelivery.message_id.in_(message_ids),
+                MessageDelivery.status.in_((DeliveryStatus.ERROR, DeliveryStatus.ERROR_PERMANENT))
+            )
+            .values(status=DeliveryStatus.PENDING, retry_count=0, error_info=None, **lease_release_values())
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    return result.rowcount
+
+
+async def count_actionable_backlog(source_peer_ids: list[int], target_chat_ids: list[str], max_retry_count: int = 3) -> int:
+    """
+    Считает работу, которую постинг действительно выполнит.
+
+    Args:
+        source_peer_ids (list[int]): Источники, привязанные к активным каналам
+        target_chat_ids (list[str]): Активные целевые каналы
+        max_retry_count (int): Доставки с большим числом неудач не считаются
+
+    Returns:
+        int: Открытые доставки в активные каналы плюс обработанные AI сообщения
+            из привязанных источников, для которых доставки еще не созданы
+
+    Сообщения без маршрута (источник не привязан ни к одному активному каналу)
+    и доставки в отключенные каналы не считаются: постинг их не возьмет, и
+    ограничение очереди постинга не должно из-за них останавливать AI этап.
+    """
+    if not target_chat_ids:
+        return 0
+
+    open_deliveries = (
+        select(func.count())
+        .select_from(MessageDelivery)
+        .where(
+            MessageDelivery.status.in_(OPEN_DELIVERY_STATUSES),
+            MessageDelivery.target_chat_id.in_(target_chat_ids),
+            MessageDelivery.retry_count < max_retry_count
+        )
+    )
+    # Те же условия, что и у выборки сообщений для рассылки по каналам
+    waiting_fan_out = (
+        select(func.count())
+        .select_from(Messages)
+        .where(
+            Messages.status == NewsStatus.AI_PROCESSED,
+            Messages.ai_processed_text != None,
+            Messages.ai_processed_text != "",
+            Messages.channel_id.in_(source_peer_ids),
+            ~exists().where(MessageDelivery.message_id == Messages.id)
+        )
+    )
+    async with AsyncSessionLocal() as session:
+        deliveries_count = (await session.execute(open_deliveries)).scalar_one()
+        messages_count = (await session.execute(waiting_fan_out)).scalar_one() if source_peer_ids else 0
+    return deliveries_count + messages_count
+
+
+def delivery_result(delivery: MessageDelivery, success: bool, error_info: str | None = None, max_retry_count: int = 3) -> dict:
+    """
+    Значения полей доставки после попытки отправки.
+
+    Неудачная доставка остается в очереди со статусом ERROR, пока счетчик
+    попыток не достигнет max_retry_count, затем получает ERROR_PERMANENT.
+    """
+    if success:
+        return {"id": delivery.id, "status": DeliveryStatus.POSTED, "posted_at": datetime.utcnow(), "error_info": None}
+
+    retry_count = (delivery.retry_count or 0) + 1
+    status = DeliveryStatus.ERROR_PERMANENT if retry_count >= max_retry_count else DeliveryStatus.ERROR
+    logging.info(f"Доставка {delivery.id} (сообщение {delivery.message_id} -> {delivery.target_chat_id}): попытка {retry_count}, статус {status.value}")
+    return {"id": delivery.id, "status": status, "retry_count": retry_count, "error_info": (error_info or "")[:500] or None}
@@ -1,6 +1,6 @@
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 from sqlalchemy.orm import Session
-from database.models import engine
+from database.models import engine, AsyncSessionLocal
 
 
 
@@ -21,3 +21,18 @@ def session_scope():
         session.close()
 
 
+@asynccontextmanager
+async def async_session_scope():
+    """
+    Асинхронный провайдер сессий для работы с базой данных.
+    Автоматически коммитит транзакцию если не было исключений.
+    """
+    session = AsyncSessionLocal()
+    try:
+        yield session
+        await session.commit()  # Автоматический коммит при успешном выполнении
+    except Exception as e:
+        await session.rollback()
+        raise e
+    finally:
+        await session.close()
@@ -0,0 +1,118 @@
+import os
+import socket
+import secrets
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, or_
+
+from database.models import Messages, AsyncSessionLocal, async_engine
+
+
+# Диалекты, которые поддерживают SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8+, PostgreSQL)
+SKIP_LOCKED_DIALECTS = ("mysql", "postgresql")
+
+
+def default_worker_id() -> str:
+    """Идентификатор процесса воркера по умолчанию: хост и PID"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def lease_is_free(now: datetime, model=Messages):
+    """Условие: строка (по умолчанию сообщение) никем не занята или аренда истекла"""
+    return or_(model.lease_until == None, model.lease_until < now)
+
+
+async def claim_messages(conditions: list, worker_id: str, lease_seconds: float, limit: int) -> list[Messages]:
+    """
+    Атомарно забирает сообщения в аренду для обработки одним воркером.
+
+    Args:
+        conditions (list): Условия выборки (статус, источники и т.д.)
+        worker_id (str): Идентификатор процесса воркера
+        lease_seconds (float): Длительность аренды; после ее истечения сообщение
+            снова доступно другим воркерам (если воркер упал)
+        limit (int): Максимальное количество сообщений
+
+    Returns:
+        list[Messages]: Сообщения, аренда которых досталась этому вызову (старые в начале)
+    """
+    return await claim_rows(
+        Messages, conditions, worker_id, lease_seconds, limit,
+        order_by=Messages.date.asc()
+    )
+
+
+async def claim_rows(
+    model,
+    conditions: list,
+    worker_id: str,
+    lease_seconds: float,
+    limit: int,
+    order_by,
+    options: tuple = ()
+) -> list:
+    """
+    Атомарно забирает в аренду строки таблицы с полями claimed_by / lease_until.
+
+    Args:
+        model: Модель очереди (Messages, MessageDelivery)
+        conditions (list): Условия выборки
+        worker_id (str): Идентификатор процесса воркера
+        lease_seconds (float): Длительность аренды
+        limit (int): Максимальное количество строк
+        order_by: Порядок выборки
+        options (tuple): Опции загрузки для итогового SELECT (например, selectinload)
+
+    Returns:
+        list: Строки, аренда которых досталась этому вызову
+
+    Действия:
+    1. Выбирает ID свободных строк; на MySQL 8 / PostgreSQL строки блокируются
+       через FOR UPDATE SKIP LOCKED, и параллельные воркеры пропускают их
+    2. Условным UPDATE (условия + свободная аренда) проставляет claimed_by и lease_until;
+       на СУБД без SKIP LOCKED только это условие защищает от двойного захвата
+    3. Возвращает строки, в которых claimed_by совпал с токеном этого захвата
+    """
+    now = datetime.utcnow().replace(microsecond=0)  # DATETIME в MySQL хранится без микросекунд
+    lease_until = now + timedelta(seconds=lease_seconds)
+    # Уникальный токен на каждый захват: полосы одного процесса не примут чужие строки за свои
+    claim_token = f"{worker_id}/{secrets.token_hex(4)}"[-64:]
+
+    async with AsyncSessionLocal() as session:
+        candidates_query = (
+            select(model.id)
+            .where(*conditions, lease_is_free(now, model))
+            .order_by(order_by)
+            .limit(limit)
+        )
+        if async_engine.dialect.name in SKIP_LOCKED_DIALECTS:
+            candidates_query = candidates_query.with_for_update(skip_locked=True)
+
+        candidate_ids = (await session.execute(candidates_query)).scalars().all()
+        if not candidate_ids:
+            await session.commit()
+            return []
+
+        await session.execute(
+            update(model)
+            .where(model.id.in_(candidate_ids), *conditions, lease_is_free(now, model))
+            .values(claimed_by=claim_token, lease_until=lease_until)
+            .execution_options(synchronize_session=False)
+        )
+        claimed = (await session.execute(
+            select(model)
+            .where(model.id.in_(candidate_ids), model.claimed_by == claim_token)
+            .options(*options)
+            .order_by(order_by)
+        )).scalars().all()
+        await session.commit()
+
+    if len(claimed) < len(candidate_ids):
+        logging.debug(f"Захвачено {len(claimed)} из {len(candidate_ids)} строк {model.__tablename__} (остальные заняты другими воркерами)")
+    return claimed
+
+
+def lease_release_values() -> dict:
+    """Значения полей для освобождения аренды (вместе со сменой статуса)"""
+    return {"claimed_by": None, "lease_until": None}
@@ -1,9 +1,27 @@
 # ./database/messages_crud.py
 
-from sqlalchemy import select, Select, and_, delete
+import re
+import hashlib
+from sqlalchemy import select, Select, and_, delete, update
 from sqlalchemy.orm import Session
-from .models import engine, Messages
-from datetime import datetime
+from .models import engine, Messages, MessageMedia
+from .manager import async_session_scope
+from .message_queue import lease_release_values
+from datetime import datetime, timedelta
+
+
+# claimed_by сообщений, фото которых еще скачивает парсер
+PHOTO_DOWNLOAD_LEASE_OWNER = "parser:photo-download"
+
+def generate_content_hash(text: str) -> str:
+    """Генерирует хеш для текста, игнорируя пунктуацию и регистр"""
+    if not text:
+        return ""
+    # Приводим к нижнему регистру и удаляем лишние символы
+    normalized = re.sub(r'[^\w\s]', '', text.lower())
+    # Удаляем лишние пробелы
+    normalized = ' '.join(normalized.split())
+    return hashlib.md5(normalized.encode()).hexdigest()
 
 
 
@@ -57,6 +75,61 @@ def add_message(channel_id, message_id, text, date, photo_path, links, views) ->
             return None
 
 
+async def add_message_async(channel_id, message_id, text, date, photo_path, links, views, grouped_id=None, photo_lease_seconds=None) -> tuple[int | None, bool]:
+    """
+    Асинхронная версия add_message для горячего пути парсера (grouped_id - для альбомов).
+
+    photo_lease_seconds - сообщение сразу занято арендой загрузчика фото: AI этап
+    не возьмет его, пока фото не сохранено (save_message_photos_async снимает аренду)
+    или аренда не истекла.
+
+    Returns:
+        tuple[int | None, bool]: ID сообщения в БД (None при ошибке) и признак,
+            что запись создана сейчас; для дубликата возвращается ID существующей
+            записи и False - его фото и передачу AI этапу повторять не нужно
+    """
+    try:
+        async with async_session_scope() as session:
+            # Проверяем наличие сообщения по message_id без привязки к channel_id
+            query = select(Messages).where(Messages.message_id == message_id)
+            existing_messages = (await session.scalars(query)).all()
+
+            for msg in existing_messages:
+                print(f"Найдено сообщение в БД: message_id={message_id}, channel_id={msg.channel_id}")
+
+                # Если совпадает и channel_id и message_id, это дубликат
+                if msg.channel_id == channel_id:
+                    print(f"message: id:{message_id} already exist for channel {channel_id}")
+                    return msg.id, False
+
+                # Возможно, канал хранится с другим ID, но это то же сообщение
+                if msg.text == text and msg.date == date:
+                    print(f"message: id:{message_id} уже существует с другим channel_id")
+                    return msg.id, False
+
+            new_message = Messages(
+                channel_id = channel_id,
+                message_id = message_id,
+                text = text,
+                length = len(text) if text else 0,
+                date = date,
+                photo_path = photo_path,
+                links = links,
+                views = views,
+                grouped_id = grouped_id
+            )
+            if photo_lease_seconds:
+                new_message.claimed_by = PHOTO_DOWNLOAD_LEASE_OWNER
+                new_message.lease_until = datetime.utcnow() + timedelta(seconds=photo_lease_seconds)
+            session.add(new_message)
+            await session.flush()  # Получаем ID до коммита
+            print(f"Added new row to Messages\n     chat: {channel_id}\n    message: {message_id}")
+            return new_message.id, True
+    except Exception as e:
+        print(f"Error adding message: {e}")
+        return None, False
+
+
 def get_all_messages() -> list[Messages]:
     with Session(engine) as session:
         messages = session.scalars(select(Messages)).all()
@@ -144,6 +217,92 @@ def update_message_photo_path(message_id: int, photo_path: str) -> bool:
             return False
 
 
+async def extend_photo_lease_async(message_id: int, lease_seconds: float) -> bool:
+    """
+    Продлевает аренду загрузчика фото, когда загрузка сообщения начинается.
+
+    Аренда ставится при сохранении сообщения, но сообщение может долго ждать
+    в очереди загрузок; продление отсчитывает таймаут от начала скачивания.
+    Аренду, которую уже перехватил другой воркер, продление не трогает.
+
+    Returns:
+        bool: True, если аренда загрузчика продлена
+    """
+    try:
+        async with async_session_scope() as session:
+            result = await session.execute(
+                update(Messages)
+                .where(Messages.id == message_id, Messages.claimed_by == PHOTO_DOWNLOAD_LEASE_OWNER)
+                .values(lease_until=datetime.utcnow() + timedelta(seconds=lease_seconds))
+                .execution_options(synchronize_session=False)
+            )
+        return result.rowcount > 0
+    except Exception as e:
+        print(f"Ошибка при продлении аренды загрузки фото: {e}")
+        return False
+
+
+async def save_message_photos_async(message_id: int, photos: list[tuple[str, str]]) -> bool:
+    """
+    Записывает скачанные фото сообщения и снимает аренду загрузчика.
+
+    Args:
+        message_id (int): ID сообщения в БД
+        photos (list[tuple[str, str]]): (путь, sha256) фото по порядку; пустой
+            список - фото скачать не удалось, сообщение обрабатывается без него
+
+    Действия:
+    Первое фото записывается в Messages.photo_path / photo_sha256, все фото
+    альбома (если их больше одного) - в message_media; если фото альбома уже
+    записаны (повторная загрузка), они не дублируются. Аренда снимается в той
+    же транзакции, поэтому AI этап видит сообщение уже с фото. Снимается только
+    аренда загрузчика: если она истекла и сообщение взял другой воркер, его
+    аренда остается.
+    """
+    try:
+        async with async_session_scope() as session:
+            if photos:
+                await session.execute(
+                    update(Messages)
+                    .where(Messages.id == message_id)
+                    .values(photo_path=photos[0][0], photo_sha256=photos[0][1])
+                    .execution_options(synchronize_session=False)
+                )
+            await session.execute(
+                update(Messages)
+                .where(Messages.id == message_id, Messages.claimed_by == PHOTO_DOWNLOAD_LEASE_OWNER)
+                .values(**lease_release_values())
+                .execution_options(synchronize_session=False)
+            )
+            if len(photos) > 1:
+                has_media = (await session.execute(
+                    select(MessageMedia.id).where(MessageMedia.message_id == message_id).limit(1)
+                )).first() is not None
+                if has_media:
+                    print(f"Фото альбома ID {message_id} уже записаны, повторная запись пропущена")
+                else:
+                    session.add_all([
+                        MessageMedia(message_id=message_id, position=position, photo_path=photo_path, photo_sha256=sha256)
+                        for position, (photo_path, sha256) in enumerate(photos)
+                    ])
+        print(f"Сохранено фото для сообщения ID {message_id}: {len(photos)}")
+        return True
+    except Exception as e:
+        print(f"Ошибка при сохранении фото сообщения: {e}")
+        return False
+
+
+async def update_media_file_ids_async(file_ids: dict[int, str]) -> None:
+    """Сохраняет file_id загруженных фото альбома (ID записи MessageMedia -> file_id)"""
+    if not file_ids:
+        return
+    async with async_session_scope() as session:
+        await session.execute(
+            update(MessageMedia),
+            [{"id": media_id, "file_id": file_id} for media_id, file_id in file_ids.items()]
+        )
+
+
 def clear_messages_table() -> None:
     with Session(engine) as connection:
         try:
@@ -3,7 +3,7 @@ from __future__ import annotations # работа с типами и аннот
 from datetime import datetime
 
 # Импорты SQLAlchemy для работы с БД
-from sqlalchemy import create_engine, UniqueConstraint, ForeignKey
+from sqlalchemy import create_engine, UniqueConstraint, ForeignKey, Index
 from sqlalchemy.orm import (
     declarative_base,
     mapped_column,
@@ -11,6 +11,7 @@ from sqlalchemy.orm import (
     relationship,
     sessionmaker
 )
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.types import String, Text, DateTime, Integer, JSON, Boolean, BigInteger
 
 # Импорты для работы с перечислениями
@@ -19,6 +20,7 @@ from sqlalchemy import Enum as SQLAlchemyEnum, Text
 
 # Импорт централизованных настроек
 from config import settings
+from database.pool_metrics import PoolMetrics
 
 
 # Получение строки подключения к БД из настроек
@@ -27,8 +29,47 @@ if not DB_URL:
     raise ValueError("Database connection string not found in settings")
 
 
-engine = create_engine(DB_URL, echo=False, pool_pre_ping=True) # Создание движка SQLAlchemy
+# Асинхронные драйверы для синхронных строк подключения
+ASYNC_DRIVERS = {
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql": "mysql+aiomysql",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def make_async_url(url: str) -> str:
+    """Подменяет синхронный драйвер в строке подключения на асинхронный (pymysql -> aiomysql и т.д.)"""
+    scheme, separator, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{separator}{rest}"
+
+
+def pool_options(url: str) -> dict:
+    """Параметры пула соединений из settings.database (SQLite использует свои пулы без них)"""
+    db_settings = settings.database
+    options = {"pool_pre_ping": db_settings.pool_pre_ping, "pool_recycle": db_settings.pool_recycle}
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=db_settings.pool_size,
+            max_overflow=db_settings.max_overflow,
+            pool_timeout=db_settings.pool_timeout,
+        )
+    return options
+
+
+engine = create_engine(DB_URL, echo=False, **pool_options(DB_URL)) # Создание движка SQLAlchemy
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) # Создание фабрики сессий
+
+# Асинхронный движок для горячих путей (posting worker, парсер): запросы не занимают пул потоков
+async_engine = create_async_engine(make_async_url(DB_URL), echo=False, **pool_options(DB_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Метрики пулов соединений (выводятся в /worker_stats)
+sync_pool_metrics = PoolMetrics("sync")
+sync_pool_metrics.attach(engine)
+async_pool_metrics = PoolMetrics("async")
+async_pool_metrics.attach(async_engine.sync_engine)
 BaseModel = declarative_base() # Базовый класс для моделей SQLAlchemy
 
 
@@ -54,6 +95,20 @@ class NewsStatus(enum.Enum):
     ERROR_POSTING = "error_posting"
     ERROR_PERMANENT = "error_permanent"
 
+
+class DeliveryStatus(enum.Enum):
+    """
+    Статус доставки сообщения в один целевой канал:
+    - PENDING: ожидает отправки
+    - POSTED: опубликовано в канале
+    - ERROR: ошибка отправки, будет повтор
+    - ERROR_PERMANENT: окончательная ошибка после нескольких попыток
+    """
+    PENDING = "pending"
+    POSTED = "posted"
+    ERROR = "error"
+    ERROR_PERMANENT = "error_permanent"
+
 class AdminSession(BaseModel):
     __tablename__ = "admin_sessions"
 
@@ -117,7 +172,13 @@ class Channels(BaseModel):
 
 class Messages(BaseModel):
     __tablename__ = "messages"
-    __table_args__ = (UniqueConstraint("message_id", "channel_id", name="uq_message_channel"),) # Обеспечивает уникальность комбинации message_id и channel_id
+    __table_args__ = (
+        UniqueConstraint("message_id", "channel_id", name="uq_message_channel"), # Обеспечивает уникальность комбинации message_id и channel_id
+        # Составные индексы под запросы очереди posting worker (см. migrate_add_queue_indexes.py)
+        Index("ix_messages_status_date", "status", "date"),  # Очереди NEW / AI_PROCESSED по дате
+        Index("ix_messages_status_channel_date", "status", "channel_id", "date"),  # Очередь канала по его источникам
+        Index("ix_messages_status_retry", "status", "retry_count"),  # Сообщения с ошибками для повтора
+    )
 
     id:         Mapped[int]               = mapped_column(Integer, primary_key=True, autoincrement=True)  # Уникальный идентификатор
     channel_id: Mapped[int]               = mapped_column(BigInteger, ForeignKey("channels.peer_id"), nullable=False)  # Внешний ключ на канал
@@ -125,15 +186,24 @@ class Messages(BaseModel):
     text:       Mapped[str | None]        = mapped_column(Text, nullable=True)     # Текст сообщения
     length:     Mapped[int]               = mapped_column(Integer, nullable=False)  # Длина сообщения
     date:       Mapped[datetime]          = mapped_column(DateTime, nullable=False) # Дата публикации
-    photo_path: Mapped[str | None]        = mapped_column(String(100), unique=True, nullable=True)  # Путь к сохраненному фото
+    photo_path: Mapped[str | None]        = mapped_column(String(255), nullable=True)  # Путь к сохраненному фото (NULL - фото нет или еще не скачано)
+    photo_sha256: Mapped[str | None]      = mapped_column(String(64), nullable=True, index=True)  # SHA-256 содержимого фото (файл хранится по хешу)
+    photo_file_id: Mapped[str | None]     = mapped_column(String(255), nullable=True)  # file_id фото в Telegram после первой загрузки
+    grouped_id: Mapped[int | None]        = mapped_column(BigInteger, nullable=True)  # ID альбома в Telegram (сообщение собрано из нескольких частей)
     links:      Mapped[list[str] | None]  = mapped_column(JSON, nullable=True)  # Список ссылок в сообщении
     views:      Mapped[int]               = mapped_column(Integer, nullable=False, default=0)  # Количество просмотров
     status:     Mapped[NewsStatus]        = mapped_column(SQLAlchemyEnum(NewsStatus), default=NewsStatus.NEW, index=True)  # Статус обработки
     ai_processed_text: Mapped[str | None] = mapped_column(Text, nullable=True)  # Текст после обработки ИИ
+    content_hash: Mapped[str | None]      = mapped_column(String(32), nullable=True, index=True)  # Хеш нормализованного ai_processed_text для поиска дубликатов
     retry_count: Mapped[int]              = mapped_column(Integer, default=0)  # Счетчик попыток обработки
     error_info: Mapped[str | None]        = mapped_column(String(500), nullable=True)  # Подробная информация об ошибке
+    claimed_by: Mapped[str | None]        = mapped_column(String(64), nullable=True)  # Воркер, взявший сообщение в работу
+    lease_until: Mapped[datetime | None]  = mapped_column(DateTime, nullable=True, index=True)  # До какого времени действует аренда
 
     channel: Mapped[Channels] = relationship("Channels", back_populates="messages")  # Связь многие-к-одному с каналом
+    media: Mapped[list[MessageMedia]] = relationship(
+        "MessageMedia", back_populates="message", order_by="MessageMedia.position"
+    )  # Фото альбома (пусто для обычных сообщений)
    
    
     def __repr__(self):
@@ -141,6 +211,51 @@ class Messages(BaseModel):
 
 
 
+class MessageMedia(BaseModel):
+    __tablename__ = "message_media"
+    __table_args__ = (
+        UniqueConstraint("message_id", "position", name="uq_media_message_position"), # Порядок фото в альбоме
+    )
+
+    id:         Mapped[int]        = mapped_column(Integer, primary_key=True, autoincrement=True)
+    message_id: Mapped[int]        = mapped_column(Integer, ForeignKey("messages.id"), nullable=False, index=True)  # Сообщение-альбом
+    position:   Mapped[int]        = mapped_column(Integer, nullable=False)  # Номер фото в альбоме (с 0)
+    photo_path: Mapped[str]        = mapped_column(String(255), nullable=False)  # Путь к сохраненному фото
+    photo_sha256: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)  # SHA-256 содержимого фото
+    file_id:    Mapped[str | None] = mapped_column(String(255), nullable=True)  # file_id фото в Telegram после первой загрузки
+
+    message: Mapped[Messages] = relationship("Messages", back_populates="media")
+
+    def __repr__(self):
+        return f"<MessageMedia(message_id={self.message_id}, position={self.position}, path='{self.photo_path}')>"
+
+
+
+class MessageDelivery(BaseModel):
+    __tablename__ = "message_deliveries"
+    __table_args__ = (
+        UniqueConstraint("message_id", "target_chat_id", name="uq_delivery_message_target"), # Одна доставка сообщения в канал
+        Index("ix_deliveries_status_target", "status", "target_chat_id"),  # Очередь доставок активных каналов
+    )
+
+    id:             Mapped[int]                = mapped_column(Integer, primary_key=True, autoincrement=True)
+    message_id:     Mapped[int]                = mapped_column(Integer, ForeignKey("messages.id"), nullable=False, index=True)  # Доставляемое сообщение
+    target_chat_id: Mapped[str]                = mapped_column(String(255), nullable=False)  # Целевой канал (как в posting_targets)
+    status:         Mapped[DeliveryStatus]     = mapped_column(SQLAlchemyEnum(DeliveryStatus), default=DeliveryStatus.PENDING)  # Статус доставки
+    retry_count:    Mapped[int]                = mapped_column(Integer, default=0)  # Счетчик неудачных попыток отправки
+    error_info:     Mapped[str | None]         = mapped_column(String(500), nullable=True)  # Последняя ошибка отправки
+    created_at:     Mapped[datetime]           = mapped_column(DateTime, default=datetime.utcnow)
+    posted_at:      Mapped[datetime | None]    = mapped_column(DateTime, nullable=True)  # Когда опубликовано
+    claimed_by:     Mapped[str | None]         = mapped_column(String(64), nullable=True)  # Воркер, взявший доставку в работу
+    lease_until:    Mapped[datetime | None]    = mapped_column(DateTime, nullable=True, index=True)  # До какого времени действует аренда
+
+    message: Mapped[Messages] = relationship("Messages")  # Связь многие-к-одному с сообщением
+
+    def __repr__(self):
+        return f"<MessageDelivery(id={self.id}, message_id={self.message_id}, target='{self.target_chat_id}', status={self.status})>"
+
+
+
 class PostingTarget(BaseModel):
     __tablename__ = "posting_targets"
 
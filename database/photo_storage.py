@@ -0,0 +1,132 @@
+from datetime import datetime
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.orm import selectinload
+
+from database.models import Messages, MessageMedia, NewsStatus, AsyncSessionLocal
+
+
+# Статусы, после которых фото сообщения больше не понадобится
+PHOTO_TERMINAL_STATUSES = (NewsStatus.POSTED, NewsStatus.ERROR_PERMANENT)
+
+
+async def get_expired_photo_messages(cutoff: datetime, since: datetime | None, limit: int) -> list[Messages]:
+    """
+    Выбирает завершенные сообщения старше cutoff, у которых еще есть фото.
+
+    Args:
+        cutoff (datetime): Сообщения с датой раньше этой теряют фото
+        since (datetime | None): Курсор прохода - дата последнего обработанного
+            сообщения; выборка идет по индексу (status, date) с этой точки
+        limit (int): Размер порции
+
+    Returns:
+        list[Messages]: Сообщения с загруженными фото альбомов (старые в начале)
+    """
+    conditions = [
+        Messages.status.in_(PHOTO_TERMINAL_STATUSES),
+        Messages.date < cutoff,
+        Messages.photo_path != None
+    ]
+    if since is not None:
+        conditions.append(Messages.date >= since)
+
+    query = (
+        select(Messages)
+        .options(selectinload(Messages.media))
+        .where(*conditions)
+        .order_by(Messages.date.asc(), Messages.id.asc())
+        .limit(limit)
+    )
+    async with AsyncSessionLocal() as session:
+        return list((await session.scalars(query)).all())
+
+
+async def get_shared_photo_hashes(sha256s: list[str], exclude_message_ids: list[int]) -> set[str]:
+    """
+    Находит хеши фото, на которые ссылаются другие сообщения (файл удалять нельзя).
+
+    Args:
+        sha256s (list[str]): Хеши фото-кандидатов на удаление
+        exclude_message_ids (list[int]): Сообщения, фото которых удаляются
+
+    Returns:
+        set[str]: Хеши, которые еще используются
+    """
+    if not sha256s:
+        return set()
+    async with AsyncSessionLocal() as session:
+        in_messages = await session.scalars(
+            select(Messages.photo_sha256)
+            .where(Messages.photo_sha256.in_(sha256s), Messages.id.not_in(exclude_message_ids))
+        )
+        in_media = await session.scalars(
+            select(MessageMedia.photo_sha256)
+            .where(MessageMedia.photo_sha256.in_(sha256s), MessageMedia.message_id.not_in(exclude_message_ids))
+        )
+        return set(in_messages.all()) | set(in_media.all())
+
+
+async def clear_message_photos(message_ids: list[int]) -> None:
+    """Удаляет из БД сведения о фото сообщений (перед удалением файлов)"""
+    if not message_ids:
+        return
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(Messages)
+            .where(Messages.id.in_(message_ids))
+            .values(photo_path=None, photo_sha256=None)
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(delete(MessageMedia).where(MessageMedia.message_id.in_(message_ids)))
+        await session.commit()
+
+
+async def get_legacy_photo_messages(limit: int) -> list[Messages]:
+    """
+    Выбирает сообщения с фото, сохраненными до хранилища по хешу (без photo_sha256).
+
+    Фото альбома загружаются вместе с сообщением: первое фото альбома - тот же
+    файл, что и Messages.photo_path, и переносится один раз для обеих записей.
+    """
+    query = (
+        select(Messages)
+        .options(selectinload(Messages.media))
+        .where(Messages.photo_sha256 == None, Messages.photo_path != None)
+        .order_by(Messages.id.asc())
+        .limit(limit)
+    )
+    async with AsyncSessionLocal() as session:
+        return list((await session.scalars(query)).all())
+
+
+async def save_photo_locations(
+    messages: dict[int, tuple[str, str] | None],
+    media: dict[int, tuple[str, str] | None]
+) -> None:
+    """
+    Записывает новые пути фото пачкой.
+
+    Args:
+        messages (dict): ID сообщения -> (путь, sha256); None - файла нет, фото снимается
+        media (dict): ID записи MessageMedia -> (путь, sha256); None - запись удаляется
+    """
+    message_rows = [
+        {"id": message_id, "photo_path": location[0] if location else None, "photo_sha256": location[1] if location else None}
+        for message_id, location in messages.items()
+    ]
+    media_rows = [
+        {"id": media_id, "photo_path": location[0], "photo_sha256": location[1]}
+        for media_id, location in media.items() if location
+    ]
+    missing_media_ids = [media_id for media_id, location in media.items() if not location]
+
+    async with AsyncSessionLocal() as session:
+        # ORM bulk UPDATE по первичному ключу (executemany)
+        if message_rows:
+            await session.execute(update(Messages), message_rows)
+        if media_rows:
+            await session.execute(update(MessageMedia), media_rows)
+        if missing_media_ids:
+            await session.execute(delete(MessageMedia).where(MessageMedia.id.in_(missing_media_ids)))
+        await session.commit()
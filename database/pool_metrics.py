@@ -0,0 +1,117 @@
+import time
+import logging
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class PoolMetrics:
+    """
+    Метрики пула соединений SQLAlchemy.
+
+    Счетчики собираются через события пула (connect, checkout, checkin,
+    invalidate), а время ожидания свободного соединения - оберткой над
+    получением соединения из пула. По этим данным подбирается размер пула
+    под реальную конкурентность парсера и posting worker.
+
+    Args:
+        name (str): Имя пула в метриках (например, "sync" или "async")
+        slow_wait_ms (float): Ожидание дольше этого порога считается медленным
+    """
+    def __init__(self, name: str, slow_wait_ms: float = 100.0):
+        self.name = name
+        self.slow_wait_ms = slow_wait_ms
+        self.pool = None
+
+        self.connects = 0  # Открыто новых соединений с БД
+        self.checkouts = 0  # Выдано соединений из пула
+        self.checkins = 0  # Возвращено соединений в пул
+        self.invalidations = 0  # Соединений отброшено из-за ошибок
+        self.overflow_events = 0  # Выдач сверх pool_size
+        self.max_checked_out = 0
+
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.slow_waits = 0
+        self._lock = threading.Lock()  # Синхронный движок используется из разных потоков
+
+    def attach(self, engine: Engine) -> None:
+        """Подключает метрики к движку (для AsyncEngine передается engine.sync_engine)"""
+        self.pool = engine.pool
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+        # Событий "начало ожидания" у пула нет, поэтому время ожидания
+        # меряем оберткой над внутренним получением соединения
+        original_do_get = self.pool._do_get
+
+        def timed_do_get():
+            started = time.perf_counter()
+            try:
+                return original_do_get()
+            finally:
+                self._record_wait(time.perf_counter() - started)
+
+        self.pool._do_get = timed_do_get
+
+    def _record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if seconds * 1000 >= self.slow_wait_ms:
+                self.slow_waits += 1
+                logging.debug(f"Пул {self.name}: ожидание соединения {seconds * 1000:.1f} мс")
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        checked_out = self._pool_value("checkedout")
+        overflow = self._pool_value("overflow")
+        with self._lock:
+            self.checkouts += 1
+            self.max_checked_out = max(self.max_checked_out, checked_out)
+            if overflow > 0:
+                self.overflow_events += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.checkins += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def _pool_value(self, method: str) -> int:
+        """Значение из QueuePool (size/checkedout/overflow); у других пулов этих методов нет"""
+        getter = getattr(self.pool, method, None)
+        return getter() if callable(getter) else 0
+
+    def snapshot(self) -> dict:
+        """
+        Возвращает текущие метрики пула в виде словаря.
+
+        Returns:
+            dict: размер и занятость пула, счетчики событий, время ожидания соединения
+        """
+        with self._lock:
+            return {
+                "pool_size": self._pool_value("size"),
+                "checked_out": self._pool_value("checkedout"),
+                "overflow": self._pool_value("overflow"),
+                "max_checked_out": self.max_checked_out,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "overflow_events": self.overflow_events,
+                "avg_wait_ms": round(self.wait_total / self.wait_count * 1000, 2) if self.wait_count else 0.0,
+                "max_wait_ms": round(self.wait_max * 1000, 2),
+                "slow_waits": self.slow_waits,
+            }
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+
+from sqlalchemy import select, or_, cast, literal
+from sqlalchemy.types import String
+
+from database.models import AsyncSessionLocal, PostingTarget, ParsingSourceChannel, Channels
+
+
+class SourceRoutingTable:
+    """
+    Таблица маршрутов target_chat_id -> peer_id каналов-источников
+    (и обратная peer_id -> target_chat_id для рассылки доставок).
+
+    Строится одним запросом с JOIN активных целевых каналов, источников
+    парсинга и каналов (источник задается как @username или как peer_id) и
+    хранится в памяти. Поиск источников канала в каждом цикле постинга -
+    обращение к словарю. Таблица перестраивается после invalidate()
+    (изменение настроек постинга или плановая проверка).
+    """
+    def __init__(self):
+        self.routes: dict[str, list[int]] = {}
+        self.targets_by_source: dict[int, list[str]] = {}
+        self.valid = False
+        self.rebuilds = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        """Помечает таблицу устаревшей; она перестроится при следующем обращении"""
+        self.valid = False
+
+    async def rebuild(self) -> None:
+        """Загружает маршруты из БД одним запросом"""
+        # Источник привязан к каналу либо по @username, либо по числовому peer_id
+        source_matches_channel = or_(
+            ParsingSourceChannel.source_identifier == literal("@") + Channels.username,
+            ParsingSourceChannel.source_identifier == cast(Channels.peer_id, String)
+        )
+        query = (
+            select(PostingTarget.target_chat_id, Channels.peer_id)
+            .join(ParsingSourceChannel, ParsingSourceChannel.posting_target_id == PostingTarget.id)
+            .join(Channels, source_matches_channel)
+            .where(PostingTarget.is_active == True)
+        )
+
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(query)).all()
+
+        routes: dict[str, list[int]] = {}
+        targets_by_source: dict[int, list[str]] = {}
+        for target_chat_id, peer_id in rows:
+            peer_ids = routes.setdefault(str(target_chat_id), [])
+            if peer_id not in peer_ids:
+                peer_ids.append(peer_id)
+            target_chat_ids = targets_by_source.setdefault(peer_id, [])
+            if str(target_chat_id) not in target_chat_ids:
+                target_chat_ids.append(str(target_chat_id))
+
+        self.routes = routes
+        self.targets_by_source = targets_by_source
+        self.valid = True
+        self.rebuilds += 1
+        logging.info(f"Таблица маршрутов постинга обновлена: {len(routes)} каналов, {len(rows)} источников")
+
+    async def ensure_valid(self) -> None:
+        """Перестраивает таблицу, если она помечена устаревшей"""
+        if not self.valid:
+            async with self._lock:
+                # Пока ждали блокировку, таблицу могла перестроить другая полоса
+                if not self.valid:
+                    await self.rebuild()
+
+    async def get_targets_by_source(self) -> dict[int, list[str]]:
+        """
+        Возвращает обратные маршруты для рассылки доставок.
+
+        Returns:
+            dict[int, list[str]]: peer_id источника -> target_chat_id активных каналов
+        """
+        await self.ensure_valid()
+        return self.targets_by_source
+
+    async def get_source_peer_ids(self, target_chat_id: str) -> list[int]:
+        """
+        Возвращает peer_id источников целевого канала.
+
+        Args:
+            target_chat_id (str): ID целевого канала
+
+        Returns:
+            list[int]: peer_id источников или пустой список, если их нет
+        """
+        await self.ensure_valid()
+
+        peer_ids = self.routes.get(str(target_chat_id), [])
+        if not peer_ids:
+            logging.warning(f"Нет каналов-источников в БД для целевого канала {target_chat_id}")
+        return peer_ids
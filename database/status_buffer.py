@@ -0,0 +1,147 @@
+import asyncio
+import logging
+
+from sqlalchemy import update, case
+
+from database.models import Messages, AsyncSessionLocal
+
+
+class StatusWriteBuffer:
+    """
+    Буфер отложенной записи изменений сообщений (write-behind).
+
+    Изменения статуса, текста AI, информации об ошибке и счетчика попыток
+    копятся в памяти и объединяются по ID сообщения: цепочка
+    SENT_TO_AI -> AI_PROCESSED -> POSTED, попавшая в одно окно, становится
+    одной записью. Раз в flush_interval секунд (или сразу при накоплении
+    max_rows сообщений) буфер пишется в БД одной транзакцией: bulk UPDATE
+    по первичному ключу (executemany) и один UPDATE ... CASE для счетчиков.
+
+    Код, который читает очередь сообщений, должен вызывать flush() перед
+    запросом, чтобы видеть собственные изменения.
+
+    Args:
+        flush_interval (float): Период сброса в секундах; 0 - писать сразу (без буфера)
+        max_rows (int): Сколько сообщений накопить до внеочередного сброса
+    """
+    def __init__(self, flush_interval: float = 0.3, max_rows: int = 200):
+        self.flush_interval = flush_interval
+        self.max_rows = max(1, max_rows)
+
+        self.pending: dict[int, dict] = {}  # ID сообщения -> новые значения полей
+        self.retry_increments: dict[int, int] = {}  # ID сообщения -> на сколько увеличить retry_count
+
+        self._flush_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+        self.stats = {"updates": 0, "coalesced": 0, "flushes": 0, "rows_flushed": 0, "errors": 0}
+
+    def __len__(self) -> int:
+        return len(self.pending.keys() | self.retry_increments.keys())
+
+    async def set(self, message_id: int, **values) -> None:
+        """Ставит в очередь изменение полей сообщения (более позднее значение поля побеждает)"""
+        row = self.pending.setdefault(message_id, {})
+        if row:
+            self.stats["coalesced"] += 1
+        row.update(values)
+        self.stats["updates"] += 1
+        await self._after_change()
+
+    async def increment_retry(self, message_id: int) -> None:
+        """Ставит в очередь увеличение retry_count на единицу"""
+        if message_id in self.retry_increments:
+            self.stats["coalesced"] += 1
+        self.retry_increments[message_id] = self.retry_increments.get(message_id, 0) + 1
+        self.stats["updates"] += 1
+        await self._after_change()
+
+    async def _after_change(self) -> None:
+        if self.flush_interval <= 0 or self._task is None:
+            # Буфер выключен или фоновый сброс не запущен - пишем сразу
+            await self.flush()
+        elif len(self) >= self.max_rows:
+            self._flush_requested.set()
+
+    async def flush(self) -> int:
+        """
+        Записывает накопленные изменения в БД.
+
+        Returns:
+            int: Количество обновленных сообщений
+        """
+        async with self._flush_lock:
+            if not self.pending and not self.retry_increments:
+                return 0
+
+            # Забираем накопленное; новые изменения во время записи попадут в следующий сброс
+            pending, self.pending = self.pending, {}
+            retry_increments, self.retry_increments = self.retry_increments, {}
+
+            try:
+                async with AsyncSessionLocal() as session:
+                    if pending:
+                        # ORM bulk UPDATE по первичному ключу - executemany, группами по набору полей
+                        await session.execute(
+                            update(Messages),
+                            [{"id": message_id, **values} for message_id, values in pending.items()]
+                        )
+                    if retry_increments:
+                        await session.execute(
+                            update(Messages)
+                            .where(Messages.id.in_(list(retry_increments)))
+                            .values(retry_count=(
+                                case((Messages.retry_count == None, 0), else_=Messages.retry_count)
+                                + case(retry_increments, value=Messages.id, else_=0)
+                            ))
+                            .execution_options(synchronize_session=False)
+                        )
+                    await session.commit()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.error(f"Ошибка записи буфера статусов ({len(pending)} сообщений): {e}", exc_info=True)
+                self._requeue(pending, retry_increments)
+                return 0
+
+            flushed = len(pending.keys() | retry_increments.keys())
+            self.stats["flushes"] += 1
+            self.stats["rows_flushed"] += flushed
+            return flushed
+
+    def _requeue(self, pending: dict[int, dict], retry_increments: dict[int, int]) -> None:
+        """Возвращает неудачно записанные изменения в буфер, не затирая более новые"""
+        for message_id, values in pending.items():
+            self.pending[message_id] = {**values, **self.pending.get(message_id, {})}
+        for message_id, increment in retry_increments.items():
+            self.retry_increments[message_id] = self.retry_increments.get(message_id, 0) + increment
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            # shield: остановка задачи не должна оборвать запись на середине и потерять изменения
+            await asyncio.shield(self.flush())
+
+    def start(self) -> None:
+        """Запускает фоновый периодический сброс (в работающем event loop)"""
+        if self.flush_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает фоновый сброс и записывает остаток буфера"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> dict:
+        """Возвращает счетчики буфера для мониторинга"""
+        return {**self.stats, "pending": len(self)}
@@ -0,0 +1,53 @@
+from database.models import engine
+from sqlalchemy import text
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_add_albums():
+    """Поддержка альбомов: поле grouped_id в messages и таблица message_media"""
+
+    migration_queries = [
+        # Шаг 1: ID альбома в Telegram для сообщений, собранных из нескольких частей
+        "ALTER TABLE messages ADD COLUMN grouped_id BIGINT NULL",
+
+        # Шаг 2: Фото альбома по порядку, с file_id после первой загрузки
+        """CREATE TABLE message_media (
+            id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            message_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            photo_path VARCHAR(255) NOT NULL,
+            file_id VARCHAR(255) NULL,
+            CONSTRAINT uq_media_message_position UNIQUE (message_id, position),
+            FOREIGN KEY (message_id) REFERENCES messages (id)
+        )""",
+
+        # Шаг 3: Индекс для загрузки фото сообщения
+        "CREATE INDEX ix_message_media_message_id ON message_media (message_id)"
+    ]
+
+    try:
+        with engine.begin() as connection:
+            logger.info("🚀 Начинаем миграцию...")
+
+            for i, query in enumerate(migration_queries, 1):
+                logger.info(f"📝 Выполняем запрос {i}/{len(migration_queries)}: {query}")
+                connection.execute(text(query))
+                logger.info(f"✅ Запрос {i} выполнен успешно")
+
+            logger.info("🎉 Миграция завершена успешно!")
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка миграции: {e}")
+        raise
+
+if __name__ == "__main__":
+    print("🔧 Добавление поддержки альбомов (grouped_id, message_media) (MySQL)")
+    print("⚠️  Убедитесь, что backup создан!")
+
+    confirm = input("Продолжить миграцию? (yes/no): ")
+    if confirm.lower() in ['yes', 'y', 'да', 'д']:
+        migrate_add_albums()
+    else:
+        print("❌ Миграция отменена")
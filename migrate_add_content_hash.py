@@ -0,0 +1,88 @@
+from database.models import engine
+from database.messages import generate_content_hash
+from sqlalchemy import text
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 1000
+
+def migrate_add_content_hash():
+    """Добавление индексированного поля content_hash в таблицу messages"""
+
+    migration_queries = [
+        # Шаг 1: Добавляем колонку для хеша обработанного AI текста
+        "ALTER TABLE messages ADD COLUMN content_hash VARCHAR(32) NULL",
+
+        # Шаг 2: Создаем индекс для поиска дубликатов одним запросом
+        "CREATE INDEX ix_messages_content_hash ON messages (content_hash)"
+    ]
+
+    try:
+        with engine.begin() as connection:
+            logger.info("🚀 Начинаем миграцию...")
+
+            for i, query in enumerate(migration_queries, 1):
+                logger.info(f"📝 Выполняем запрос {i}/{len(migration_queries)}: {query}")
+                connection.execute(text(query))
+                logger.info(f"✅ Запрос {i} выполнен успешно")
+
+            logger.info("🎉 Миграция завершена успешно!")
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка миграции: {e}")
+        raise
+
+def backfill_content_hash():
+    """Заполняет content_hash для уже обработанных AI сообщений (порциями)"""
+    total_updated = 0
+    last_id = 0
+
+    try:
+        while True:
+            with engine.begin() as connection:
+                rows = connection.execute(
+                    text(
+                        "SELECT id, ai_processed_text FROM messages "
+                        "WHERE id > :last_id AND content_hash IS NULL "
+                        "AND status IN ('AI_PROCESSED', 'POSTED') "
+                        "AND ai_processed_text IS NOT NULL "
+                        "ORDER BY id LIMIT :limit"
+                    ),
+                    {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE}
+                ).fetchall()
+
+                if not rows:
+                    break
+
+                params = [
+                    {"id": row.id, "content_hash": generate_content_hash(row.ai_processed_text)}
+                    for row in rows
+                ]
+                connection.execute(
+                    text("UPDATE messages SET content_hash = :content_hash WHERE id = :id"),
+                    params
+                )
+
+                last_id = rows[-1].id
+                total_updated += len(rows)
+                logger.info(f"📝 Заполнено {total_updated} хешей (последний ID: {last_id})")
+
+        logger.info(f"🎉 Заполнение завершено, обновлено {total_updated} сообщений")
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка заполнения хешей: {e}")
+        raise
+
+if __name__ == "__main__":
+    print("🔧 Добавление индексированного поля content_hash в messages")
+    print("⚠️  Убедитесь, что backup создан!")
+
+    confirm = input("Продолжить миграцию? (yes/no): ")
+    if confirm.lower() in ['yes', 'y', 'да', 'д']:
+        migrate_add_content_hash()
+        print("\n📦 Заполняем хеши для существующих сообщений...")
+        backfill_content_hash()
+    else:
+        print("❌ Миграция отменена")
@@ -0,0 +1,60 @@
+from database.models import engine
+from sqlalchemy import text
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_add_message_deliveries():
+    """Создание таблицы доставок message_deliveries (сообщение, целевой канал)"""
+
+    migration_queries = [
+        # Шаг 1: Таблица доставок со своим статусом, счетчиком попыток и арендой
+        """CREATE TABLE message_deliveries (
+            id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            message_id INTEGER NOT NULL,
+            target_chat_id VARCHAR(255) NOT NULL,
+            status ENUM('PENDING', 'POSTED', 'ERROR', 'ERROR_PERMANENT'),
+            retry_count INTEGER,
+            error_info VARCHAR(500) NULL,
+            created_at DATETIME,
+            posted_at DATETIME NULL,
+            claimed_by VARCHAR(64) NULL,
+            lease_until DATETIME NULL,
+            CONSTRAINT uq_delivery_message_target UNIQUE (message_id, target_chat_id),
+            FOREIGN KEY (message_id) REFERENCES messages (id)
+        )""",
+
+        # Шаг 2: Очередь доставок активных каналов
+        "CREATE INDEX ix_deliveries_status_target ON message_deliveries (status, target_chat_id)",
+
+        # Шаг 3: Индексы по сообщению и аренде
+        "CREATE INDEX ix_message_deliveries_message_id ON message_deliveries (message_id)",
+        "CREATE INDEX ix_message_deliveries_lease_until ON message_deliveries (lease_until)"
+    ]
+
+    try:
+        with engine.begin() as connection:
+            logger.info("🚀 Начинаем миграцию...")
+
+            for i, query in enumerate(migration_queries, 1):
+                logger.info(f"📝 Выполняем запрос {i}/{len(migration_queries)}: {query}")
+                connection.execute(text(query))
+                logger.info(f"✅ Запрос {i} выполнен успешно")
+
+            logger.info("🎉 Миграция завершена успешно!")
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка миграции: {e}")
+        raise
+
+if __name__ == "__main__":
+    print("🔧 Создание таблицы доставок сообщений по целевым каналам (MySQL)")
+    print("⚠️  Убедитесь, что backup создан!")
+    print("ℹ️  Сообщения AI_PROCESSED будут разосланы по каналам при следующем цикле воркера")
+
+    confirm = input("Продолжить миграцию? (yes/no): ")
+    if confirm.lower() in ['yes', 'y', 'да', 'д']:
+        migrate_add_message_deliveries()
+    else:
+        print("❌ Миграция отменена")
@@ -0,0 +1,45 @@
+from database.models import engine
+from sqlalchemy import text
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_add_message_leases():
+    """Добавление полей аренды (claimed_by, lease_until) в таблицу messages"""
+
+    migration_queries = [
+        # Шаг 1: Кто из воркеров взял сообщение в работу
+        "ALTER TABLE messages ADD COLUMN claimed_by VARCHAR(64) NULL",
+
+        # Шаг 2: До какого времени действует аренда (после - сообщение снова доступно)
+        "ALTER TABLE messages ADD COLUMN lease_until DATETIME NULL",
+
+        # Шаг 3: Индекс для отбора свободных и просроченных сообщений
+        "CREATE INDEX ix_messages_lease_until ON messages (lease_until)"
+    ]
+
+    try:
+        with engine.begin() as connection:
+            logger.info("🚀 Начинаем миграцию...")
+
+            for i, query in enumerate(migration_queries, 1):
+                logger.info(f"📝 Выполняем запрос {i}/{len(migration_queries)}: {query}")
+                connection.execute(text(query))
+                logger.info(f"✅ Запрос {i} выполнен успешно")
+
+            logger.info("🎉 Миграция завершена успешно!")
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка миграции: {e}")
+        raise
+
+if __name__ == "__main__":
+    print("🔧 Добавление полей аренды сообщений (claimed_by, lease_until)")
+    print("⚠️  Убедитесь, что backup создан!")
+
+    confirm = input("Продолжить миграцию? (yes/no): ")
+    if confirm.lower() in ['yes', 'y', 'да', 'д']:
+        migrate_add_message_leases()
+    else:
+        print("❌ Миграция отменена")
@@ -0,0 +1,39 @@
+from database.models import engine
+from sqlalchemy import text
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_add_photo_file_id():
+    """Добавление поля photo_file_id (file_id фото в Telegram) в таблицу messages"""
+
+    migration_queries = [
+        # Шаг 1: file_id после первой загрузки фото - повторные отправки идут без загрузки файла
+        "ALTER TABLE messages ADD COLUMN photo_file_id VARCHAR(255) NULL"
+    ]
+
+    try:
+        with engine.begin() as connection:
+            logger.info("🚀 Начинаем миграцию...")
+
+            for i, query in enumerate(migration_queries, 1):
+                logger.info(f"📝 Выполняем запрос {i}/{len(migration_queries)}: {query}")
+                connection.execute(text(query))
+                logger.info(f"✅ Запрос {i} выполнен успешно")
+
+            logger.info("🎉 Миграция завершена успешно!")
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка миграции: {e}")
+        raise
+
+if __name__ == "__main__":
+    print("🔧 Добавление поля photo_file_id в таблицу messages")
+    print("⚠️  Убедитесь, что backup создан!")
+
+    confirm = input("Продолжить миграцию? (yes/no): ")
+    if confirm.lower() in ['yes', 'y', 'да', 'д']:
+        migrate_add_photo_file_id()
+    else:
+        print("❌ Миграция отменена")
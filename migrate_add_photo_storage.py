@@ -0,0 +1,46 @@
+from database.models import engine
+from sqlalchemy import text
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_add_photo_storage():
+    """Хранение фото по хешу содержимого: путь и sha256 фото в БД"""
+
+    migration_queries = [
+        # Шаг 1: Одинаковые фото разных сообщений лежат в одном файле - путь больше не уникален
+        "ALTER TABLE messages DROP INDEX photo_path",
+        "ALTER TABLE messages MODIFY COLUMN photo_path VARCHAR(255) NULL",
+
+        # Шаг 2: SHA-256 содержимого фото (файл хранится как <storage>/ab/cd/<sha256>.jpg)
+        "ALTER TABLE messages ADD COLUMN photo_sha256 VARCHAR(64) NULL",
+        "CREATE INDEX ix_messages_photo_sha256 ON messages (photo_sha256)",
+        "ALTER TABLE message_media ADD COLUMN photo_sha256 VARCHAR(64) NULL",
+        "CREATE INDEX ix_message_media_photo_sha256 ON message_media (photo_sha256)"
+    ]
+
+    try:
+        with engine.begin() as connection:
+            logger.info("🚀 Начинаем миграцию...")
+
+            for i, query in enumerate(migration_queries, 1):
+                logger.info(f"📝 Выполняем запрос {i}/{len(migration_queries)}: {query}")
+                connection.execute(text(query))
+                logger.info(f"✅ Запрос {i} выполнен успешно")
+
+            logger.info("🎉 Миграция завершена успешно!")
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка миграции: {e}")
+        raise
+
+if __name__ == "__main__":
+    print("🔧 Хранение фото по хешу: photo_sha256, неуникальный photo_path (MySQL)")
+    print("⚠️  Убедитесь, что backup создан!")
+
+    confirm = input("Продолжить миграцию? (yes/no): ")
+    if confirm.lower() in ['yes', 'y', 'да', 'д']:
+        migrate_add_photo_storage()
+    else:
+        print("❌ Миграция отменена")
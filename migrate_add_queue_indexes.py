@@ -0,0 +1,47 @@
+from database.models import engine
+from sqlalchemy import text
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_add_queue_indexes():
+    """Добавление составных индексов для запросов очереди posting worker"""
+
+    migration_queries = [
+        # Шаг 1: Очереди по статусу в порядке даты (NEW для AI, AI_PROCESSED для постинга)
+        "CREATE INDEX ix_messages_status_date ON messages (status, date)",
+
+        # Шаг 2: Очередь целевого канала - статус, источники (channel_id IN ...) и дата
+        "CREATE INDEX ix_messages_status_channel_date ON messages (status, channel_id, date)",
+
+        # Шаг 3: Сообщения с ошибками и счетчиком попыток
+        "CREATE INDEX ix_messages_status_retry ON messages (status, retry_count)"
+    ]
+
+    try:
+        with engine.begin() as connection:
+            logger.info("🚀 Начинаем миграцию...")
+
+            for i, query in enumerate(migration_queries, 1):
+                logger.info(f"📝 Выполняем запрос {i}/{len(migration_queries)}: {query}")
+                connection.execute(text(query))
+                logger.info(f"✅ Запрос {i} выполнен успешно")
+
+            logger.info("🎉 Миграция завершена успешно!")
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка миграции: {e}")
+        raise
+
+if __name__ == "__main__":
+    print("🔧 Добавление составных индексов очереди сообщений")
+    print("⚠️  Убедитесь, что backup создан!")
+    print("ℹ️  На большой таблице создание индексов может занять несколько минут")
+
+    confirm = input("Продолжить миграцию? (yes/no): ")
+    if confirm.lower() in ['yes', 'y', 'да', 'д']:
+        migrate_add_queue_indexes()
+        print("\n🔍 Проверить планы запросов: python check_queue_indexes.py")
+    else:
+        print("❌ Миграция отменена")
@@ -8,6 +8,7 @@ from aiogram.fsm.state import StatesGroup, State
 
 from sqlalchemy import select
 from database.models import SessionLocal, Messages, NewsStatus
+from database.deliveries import requeue_failed_deliveries
 from config import settings
 from telegram.bot.auth.auth_service import AuthService
 
@@ -99,7 +100,10 @@ async def cmd_help(message: Message):
 <b>🤖 Управление AI сервисом:</b>
 /clear_ai_cache - очистить кеш дубликатов AI вручную
 /ai_cache_stats - статистика кеша AI сервиса
-/force_auto_clear - принудительная автоочистка кеша
+/force_auto_clear - вытеснить устаревшие записи кеша
+
+<b>📈 Мониторинг:</b>
+/worker_stats - метрики posting worker (задержки AI, пулы БД и др.)
 
 <b>⚙️ Сервисные команды:</b>
 /help, /commands - показать этот список команд
@@ -107,7 +111,7 @@ async def cmd_help(message: Message):
 /check_channel - проверить доступность канала
 /cancel - отменить текущую операцию
 
-💡 <b>Кеш AI автоматически очищается каждые 24 часа</b>
+💡 <b>Записи кеша AI удаляются по истечении своего TTL (24 часа по умолчанию)</b>
 """
     await message.answer(commands_text, parse_mode="HTML")
     logger.info(f"Показан полный список команд пользователю {user_id}")
@@ -546,14 +550,17 @@ async def reset_error_messages_status():
             
             # Сбрасываем статус сообщений с ошибками постинга на AI_PROCESSED
             posting_errors = session.query(Messages).filter(Messages.status == NewsStatus.ERROR_POSTING)
-            posting_count = posting_errors.count()
+            posting_ids = [message_id for (message_id,) in posting_errors.with_entities(Messages.id)]
             posting_errors.update({"status": NewsStatus.AI_PROCESSED})
             
             session.commit()
-            return ai_count + posting_count
+            return ai_count, posting_ids
     
     import asyncio
-    return await asyncio.to_thread(_update_sync)
+    ai_count, posting_ids = await asyncio.to_thread(_update_sync)
+    # Неудачные доставки возвращаются в очередь, иначе постинг их не возьмет
+    await requeue_failed_deliveries(posting_ids)
+    return ai_count + len(posting_ids)
 
 
 async def reset_message_status(message_id):
@@ -583,7 +590,11 @@ async def reset_message_status(message_id):
             return True
     
     import asyncio
-    return await asyncio.to_thread(_update_sync)
+    updated = await asyncio.to_thread(_update_sync)
+    if updated:
+        # Неудачные доставки возвращаются в очередь, иначе постинг их не возьмет
+        await requeue_failed_deliveries([message_id])
+    return updated
 
 
 async def mark_message_permanent(message_id):
@@ -670,10 +681,13 @@ async def cmd_ai_cache_stats(message: Message):
             if response.status_code == 200:
                 result = response.json()
                 cache_size = result.get('cache_size', 0)
-                last_clear = result.get('last_auto_clear', 'Неизвестно')
-                hours_since = result.get('hours_since_clear', 0)
-                hours_until = result.get('hours_until_next_clear', 0)
-                next_clear = result.get('next_auto_clear', 'Неизвестно')
+                hits = result.get('hits', 0)
+                misses = result.get('misses', 0)
+                evictions = result.get('evictions', 0)
+                hit_rate = result.get('hit_rate', 0)
+                ttl_hours = result.get('ttl_hours', 'Неизвестно')
+                oldest_age = result.get('oldest_entry_age_hours', 0)
+                snapshot = result.get('snapshot_path') or 'отключен'
                 
                 stats_text = f"""
 📊 <b>Статистика кеша AI сервиса</b>
@@ -681,20 +695,25 @@ async def cmd_ai_cache_stats(message: Message):
 🗃️ <b>Размер кеша:</b> {cache_size} записей
 📝 Это количество уникальных постов, которые уже были обработаны
 
-⏰ <b>Автоматическая очистка:</b>
-• Последняя очистка: {last_clear}
-• Прошло часов: {hours_since}
-• До следующей очистки: {hours_until} ч.
-• Следующая очистка: {next_clear}
+🎯 <b>Эффективность:</b>
+• Попадания: {hits}
+• Промахи: {misses}
+• Доля попаданий: {hit_rate:.1%}
+• Вытеснено записей: {evictions}
+
+⏰ <b>Время жизни записей:</b>
+• TTL каждой записи: {ttl_hours} ч.
+• Возраст самой старой записи: {oldest_age} ч.
+• Снимок на диске: {snapshot}
 
 💡 <b>Что это значит:</b>
-• Кеш автоматически очищается каждые 24 часа
-• Это предотвращает накопление старых записей
-• Помогает избежать ложных срабатываний на дубликаты
+• Каждая запись удаляется сама по истечении своего TTL
+• Нет одномоментной очистки всего кеша - дедупликация работает непрерывно
+• Снимок на диске сохраняет кеш между перезапусками сервиса
 
 🧹 <b>Ручное управление:</b>
 • /clear_ai_cache - очистить кеш вручную
-• /force_auto_clear - запустить автоочистку принудительно
+• /force_auto_clear - вытеснить записи с истекшим TTL
 """
                 await message.answer(stats_text, parse_mode="HTML")
                 logger.info(f"Статистика кеша AI запрошена пользователем {message.from_user.id}")
@@ -736,4 +755,102 @@ async def cmd_force_auto_clear(message: Message):
                 
     except Exception as e:
         await message.answer(f"❌ Ошибка при подключении к AI сервису: {str(e)}")
-        logger.error(f"Ошибка при принудительной автоочистке кеша AI: {e}") 
\ No newline at end of file
+        logger.error(f"Ошибка при принудительной автоочистке кеша AI: {e}") 
+
+
+@router.message(Command("worker_stats"))
+async def cmd_worker_stats(message: Message):
+    """
+    Обработчик команды /worker_stats для просмотра метрик posting worker
+    
+    Args:
+        message (Message): Сообщение от пользователя
+    """
+    from telegram.bot.posting_worker import get_worker_stats
+    
+    try:
+        worker_stats = get_worker_stats()
+        ai_stats = worker_stats['ai_requests']
+        near_dup = worker_stats['near_duplicates']
+        deliveries = worker_stats['deliveries']
+        handoff = worker_stats['handoff_queue']
+        downloads = worker_stats['photo_downloads']
+        retention = worker_stats['photo_retention']
+        retention_text = f"{retention['retention_days']:g} дн." if retention['retention_days'] else "без ограничения"
+        limiter = worker_stats['rate_limiter']
+        membership = worker_stats['membership_cache']
+        photos = worker_stats['photos']
+        images = worker_stats['image_preprocess']
+        images_text = (
+            f"• Уменьшено фото: {images['processed']} "
+            f"({images['bytes_before'] / 1024 / 1024:.1f} → {images['bytes_after'] / 1024 / 1024:.1f} МБ), "
+            f"из кеша: {images['cached']}, без выигрыша: {images['not_smaller']}, ошибок: {images['errors']}\n"
+            if images['enabled'] else ""
+        )
+        limiter_chats_text = "".join(
+            f"• {chat_id}: токенов {chat['tokens']}, {chat['rate_per_minute']}/мин"
+            + (f", пауза {chat['blocked_for']}с" if chat['blocked_for'] else "") + "\n"
+            for chat_id, chat in limiter['chats'].items()
+        )
+        
+        status_buffer = worker_stats['status_buffer']
+        pools_text = ""
+        for pool_name, pool in worker_stats['db_pools'].items():
+            pools_text += (
+                f"• {pool_name}: занято {pool['checked_out']}/{pool['pool_size']} "
+                f"(overflow {pool['overflow']}, пик {pool['max_checked_out']})\n"
+                f"  выдач: {pool['checkouts']}, новых соединений: {pool['connects']}, "
+                f"сверх пула: {pool['overflow_events']}, сбросов: {pool['invalidations']}\n"
+                f"  ожидание: сред. {pool['avg_wait_ms']} мс, макс. {pool['max_wait_ms']} мс, "
+                f"медленных: {pool['slow_waits']}\n"
+            )
+        
+        stats_text = f"""
+📈 <b>Метрики posting worker</b>
+
+🤖 <b>Запросы к AI сервису:</b>
+• Всего запросов: {ai_stats['count']} (ошибок: {ai_stats['errors']})
+• Средняя задержка: {ai_stats['avg_ms']} мс
+• p50 / p95: {ai_stats['p50_ms']} / {ai_stats['p95_ms']} мс
+• Максимум: {ai_stats['max_ms']} мс
+
+🔁 <b>Почти-дубликаты:</b>
+• Пропущено до AI: {near_dup['skipped_before_ai']}
+• Пропущено перед постингом: {near_dup['skipped_before_posting']}
+• Размер индексов: {near_dup['source_index_size']} / {near_dup['posted_index_size']}
+
+📥 <b>Очередь парсер → AI:</b>
+• {'Включена' if handoff['enabled'] else 'Выключена (только опрос БД)'}
+• Передано: {handoff['pushed']}, обработано: {handoff['consumed']}
+• В очереди: {handoff['pending']}, отброшено при переполнении: {handoff['dropped']}
+• Загрузка фото: скачано {downloads['downloaded']}, уже в хранилище {downloads['deduplicated']}, ошибок {downloads['failed']}, в очереди {downloads['pending']}
+
+📬 <b>Доставки в каналы:</b>
+• Создано: {deliveries['created']}
+• Опубликовано: {deliveries['posted']}, неудачных попыток: {deliveries['failed']}
+• Фото: загружено {photos['uploaded']}, отправлено по file_id {photos['reused']}
+{images_text}
+🧹 <b>Хранилище фото:</b>
+• Срок хранения: {retention_text}
+• Очищено сообщений: {retention['messages_expired']}, удалено файлов: {retention['files_deleted']}
+• Освобождено: {retention['bytes_reclaimed'] / 1024 / 1024:.1f} МБ, полных проходов: {retention['passes']}
+• Перенесено в хранилище по хешу: {retention['files_compacted']}, не найдено файлов: {retention['files_missing']}
+
+🚦 <b>Лимиты отправки:</b>
+• Отправок: {limiter['sends']}, ожидание: {limiter['waited_seconds']}с
+• Ответов 429: {limiter['retry_after']} (глобальных: {limiter['global_retry_after']})
+• Глобально: токенов {limiter['global_tokens']} из {limiter['global_rate']}/с
+{limiter_chats_text}• Проверки "бот в канале": из кеша {membership['hits']}, запросов {membership['misses']}, сбросов {membership['invalidations']}
+
+📝 <b>Буфер статусов:</b>
+• Изменений: {status_buffer['updates']} (объединено: {status_buffer['coalesced']})
+• Сбросов в БД: {status_buffer['flushes']}, строк: {status_buffer['rows_flushed']}
+• Ожидают записи: {status_buffer['pending']}, ошибок записи: {status_buffer['errors']}
+
+🗄 <b>Пулы соединений БД:</b>
+{pools_text}"""
+        await message.answer(stats_text, parse_mode="HTML")
+        logger.info(f"Метрики posting worker запрошены пользователем {message.from_user.id}")
+    except Exception as e:
+        await message.answer(f"❌ Ошибка при получении метрик: {str(e)}")
+        logger.error(f"Ошибка при получении метрик posting worker: {e}")
@@ -17,6 +17,7 @@ from database.repositories import posting_target_repository as pt_repo
 
 # Импорт функции для обновления парсера
 from telegram.parser.parser_service import trigger_update
+from telegram.bot.utils.trigger_utils import trigger_posting_settings_update
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
@@ -271,6 +272,7 @@ async def process_source_title(message: Message, state: FSMContext):
             
             # Обновляем парсер (вызов синхронной функции)
             trigger_update()
+            trigger_posting_settings_update()  # Источники меняют маршруты постинга
             logger.info(f"Запрошено обновление парсера после добавления источника {source_identifier}")
         else:
             # Если произошла ошибка
@@ -651,6 +653,7 @@ async def process_update_source(message: Message, state: FSMContext):
             
             # Запрашиваем обновление парсера (вызов синхронной функции)
             trigger_update()
+            trigger_posting_settings_update()  # Источники меняют маршруты постинга
             logger.info("Запрошено обновление парсера после изменения источника")
         else:
             await message.answer(
@@ -865,6 +868,7 @@ async def process_delete_confirmation(message: Message, state: FSMContext):
             
             # Обновляем парсер (вызов синхронной функции)
             trigger_update()
+            trigger_posting_settings_update()  # Источники меняют маршруты постинга
             logger.info(f"Запрошено обновление парсера после удаления источника ID {source_id}")
         else:
             await message.answer(
@@ -1210,6 +1214,7 @@ async def process_copy_target_id(message: Message, state: FSMContext):
         
         # Обновляем парсер
         trigger_update()
+        trigger_posting_settings_update()  # Источники меняют маршруты постинга
         logger.info(f"Запрошено обновление парсера после копирования источника ID {source_id} в канал ID {target_id}")
         
         # Очищаем состояние
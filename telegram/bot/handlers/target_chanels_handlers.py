@@ -23,6 +23,7 @@ from database.dao.parsing_source_repository import ParsingSourceRepository
 
 # Импорт функции для обновления настроек постинга
 from telegram.bot.utils.trigger_utils import trigger_posting_settings_update
+from telegram.bot.utils.membership_cache import bot_membership_cache
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
@@ -238,8 +239,15 @@ async def cmd_process_channel_title(message: Message, state: FSMContext):
             await state.clear()
             return
         
-        # Проверяем, может ли постинг-бот отправлять сообщения в канал
+        # Проверяем, может ли постинг-бот отправлять сообщения в канал.
+        # Результат сразу попадает в кеш, и первый пост не тратит запрос на проверку
         await message.answer("Проверяем доступ бота к каналу...")
+        is_member = await bot_membership_cache.warm(target_id)
+        if is_member is False:
+            await message.answer(
+                f"⚠️ Постинг-бот не найден в канале {target_id}. "
+                "Канал будет сохранен, но публикации начнутся только после добавления бота администратором."
+            )
         
         # Сохраняем в БД
         # Выполняем синхронную функцию _db_call_sync в отдельном потоке через asyncio.to_thread,
@@ -504,25 +504,18 @@ async def cmd_activate_account(message: Message):
     try:
         account_id = int(command_parts[1])
         
-        # Деактивируем все аккаунты и активируем выбранный
-        async def _deactivate_all_and_activate_one():
-            # Сначала деактивируем все аккаунты
-            all_accounts = pt_repo.get_all_accounts()
-            for acc in all_accounts:
-                if acc['is_active'] and acc['id'] != account_id:
-                    pt_repo.set_active_status(acc['id'], False)
-            
-            # Затем активируем выбранный аккаунт
+        # Активных аккаунтов может быть несколько: парсер распределяет источники между ними
+        def _activate_one():
             success = pt_repo.set_active_status(account_id, True)
             return success, pt_repo.get_account_by_id(account_id)
             
-        success, account = await asyncio.to_thread(_deactivate_all_and_activate_one)
+        success, account = await asyncio.to_thread(_activate_one)
         
         if success and account:
             await message.answer(
                 "✅ <b>Аккаунт активирован</b>\n\n"
                 f"Аккаунт <code>{account['phone_number']}</code> (ID: {account_id}) успешно активирован.\n"
-                "Все остальные аккаунты деактивированы.",
+                "Парсер распределит источники между всеми активными аккаунтами.",
                 parse_mode="HTML"
             )
             
@@ -1,29 +1,43 @@
-import os # Для работы с переменными окружения и файловой системой
+import argparse # Для запуска отдельных этапов из командной строки
+import time # Для замера задержек
 import httpx # HTTP клиент для асинхронных запросов
 import asyncio # Для асинхронного программирования
 import logging # Для логирования
-import hashlib # Для генерации хешей контента
-import re # Для работы с регулярными выражениями
-from datetime import datetime, timedelta  # Для работы с датой и временем
+from datetime import datetime, timedelta, timezone  # Для работы с датой и временем
 
 from aiogram import Bot  
-from aiogram.types import FSInputFile  # Для отправки файлов в Aiogram 3.x
-from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest  # Импорт исключений Telegram
+from aiogram.types import FSInputFile, InputMediaPhoto  # Для отправки файлов и альбомов в Aiogram 3.x
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest, TelegramRetryAfter  # Импорт исключений Telegram
 
 # SQLAlchemy для работы с базой данных
-from sqlalchemy.orm import sessionmaker  # Для создания сессий БД
-from sqlalchemy import select, update  # Для SQL запросов
-from database.models import Messages, NewsStatus, engine, SessionLocal, PostingTarget  # Модели и настройки БД
+from sqlalchemy import select, update, and_, or_, exists  # Для SQL запросов
+from database.models import Messages, NewsStatus, MessageDelivery, MessageMedia, AsyncSessionLocal  # Модели и асинхронные сессии БД
+from database.models import sync_pool_metrics, async_pool_metrics  # Метрики пулов соединений
+from database.status_buffer import StatusWriteBuffer  # Отложенная пакетная запись статусов
+from database.message_queue import claim_messages, default_worker_id, lease_release_values  # Аренда сообщений
+from database.routing import SourceRoutingTable  # Маршруты целевой канал -> источники
+from database.deliveries import (  # Доставки (сообщение, целевой канал)
+    create_deliveries, claim_deliveries, save_delivery_results, get_finished_messages, delivery_result,
+    count_actionable_backlog, get_stalled_messages, requeue_failed_deliveries
+)
+from database.messages import generate_content_hash, update_media_file_ids_async  # Хеш текста для поиска дубликатов, file_id альбомов
 
 # Импортируем централизованные настройки
 from config import settings
 
-# Импортируем репозиторий для работы с целевыми каналами
-from database.repositories import posting_target_repository
-
 # Импортируем общие события из trigger_utils
 from telegram.bot.utils.trigger_utils import posting_settings_update_event
 
+# Ограничитель частоты отправок (token bucket на канал + глобальный)
+from telegram.bot.utils.rate_limiter import SendRateLimiter, RateLimitMiddleware
+from telegram.bot.utils.membership_cache import bot_membership_cache  # Кеш проверки "бот в канале"
+from telegram.bot.utils.metrics import LatencyStats
+from telegram.bot.utils.near_duplicates import SimHashIndex
+from telegram.bot.utils.handoff_queue import new_messages_queue  # Новые сообщения от парсера
+from telegram.bot.utils.image_preprocess import image_preprocessor  # Уменьшение фото перед загрузкой
+from telegram.parser.media_downloader import media_downloads  # Фоновая загрузка фото парсера (для метрик)
+from telegram.parser.photo_retention import photo_retention  # Очистка хранилища фото
+
 # Настройка базовой конфигурации логгера
 logging.basicConfig(
     level=logging.INFO,
@@ -42,6 +56,209 @@ logging.info("posting_worker.py загружен")
 
 # Глобальные переменные
 last_targets_check = datetime.now()  # Время последней проверки целевых каналов
+# Этапы конвейера; каждый можно запустить отдельным процессом (см. __main__)
+PIPELINE_STAGES = ("ai", "posting", "errors", "retention")
+# Таблица маршрутов target_chat_id -> peer_id источников (сбрасывается в _refresh_routes_if_needed)
+source_routing = SourceRoutingTable()
+# Идентификатор процесса в claimed_by: несколько воркеров разбирают очередь без дублей
+WORKER_ID = settings.telegram_bot.worker_id or default_worker_id()
+# Слоты AI этапа: опрос БД и очередь парсера вместе обрабатывают не больше PIPELINE_AI_CONCURRENCY порций
+ai_stage_slots = asyncio.Semaphore(max(settings.telegram_bot.pipeline_ai_concurrency, 1))
+
+# file_id загруженных фото: следующие отправки того же фото идут без загрузки файла.
+# В памяти - для полос, отправляющих сообщение параллельно; в БД - Messages.photo_file_id
+PHOTO_FILE_ID_CACHE_SIZE = 1000
+photo_file_ids: dict[int, str] = {}
+photo_upload_locks: dict[int, asyncio.Lock] = {}
+photo_stats = {"uploaded": 0, "reused": 0}
+
+# Общий лимитер отправок для всех полос постинга (подключается к боту в create_bot)
+send_rate_limiter = SendRateLimiter(
+    global_rate=settings.telegram_bot.posting_global_rate,
+    chat_rate_per_minute=settings.telegram_bot.posting_chat_rate,
+    chat_burst=settings.telegram_bot.posting_chat_burst
+)
+
+# Долгоживущий HTTP клиент для AI сервиса (создается в run_periodic_tasks)
+ai_http_client: httpx.AsyncClient | None = None
+ai_request_stats = LatencyStats()  # Метрики задержки запросов к AI
+
+# Изменения статусов копятся и пишутся в БД пачками (запускается в run_periodic_tasks)
+status_buffer = StatusWriteBuffer(
+    flush_interval=settings.database.status_flush_interval,
+    max_rows=settings.database.status_flush_max_rows
+)
+
+
+def create_ai_http_client() -> httpx.AsyncClient:
+    """
+    Создает HTTP клиент с пулом keep-alive соединений для запросов к AI сервису.
+    
+    Returns:
+        httpx.AsyncClient: Клиент, настроенный по settings.ai_service
+    """
+    ai_settings = settings.ai_service
+    
+    use_http2 = ai_settings.http2
+    if use_http2:
+        try:
+            import h2  # noqa: F401 - нужен httpx для HTTP/2
+        except ImportError:
+            logging.warning("AI_HTTP2 включен, но пакет h2 не установлен (pip install httpx[http2]). Используется HTTP/1.1")
+            use_http2 = False
+    
+    limits = httpx.Limits(
+        max_connections=ai_settings.http_max_connections,
+        max_keepalive_connections=ai_settings.http_max_keepalive,
+        keepalive_expiry=ai_settings.http_keepalive_expiry
+    )
+    logging.info(
+        f"Создан HTTP клиент AI: max_connections={ai_settings.http_max_connections}, "
+        f"keepalive={ai_settings.http_max_keepalive}, http2={use_http2}"
+    )
+    return httpx.AsyncClient(
+        timeout=ai_settings.request_timeout,
+        limits=limits,
+        http2=use_http2
+    )
+
+
+def get_ai_http_client() -> httpx.AsyncClient:
+    """Возвращает общий HTTP клиент AI, создавая его при первом обращении"""
+    global ai_http_client
+    if ai_http_client is None or ai_http_client.is_closed:
+        ai_http_client = create_ai_http_client()
+    return ai_http_client
+
+
+async def close_ai_http_client() -> None:
+    """Закрывает общий HTTP клиент AI и его соединения"""
+    global ai_http_client
+    if ai_http_client is not None and not ai_http_client.is_closed:
+        await ai_http_client.aclose()
+        logging.info("HTTP клиент AI закрыт")
+    ai_http_client = None
+
+
+async def _post_to_ai(service_url: str, payload: dict) -> httpx.Response:
+    """
+    Отправляет запрос в AI сервис через общий клиент и записывает задержку.
+    
+    Args:
+        service_url (str): URL эндпоинта AI сервиса
+        payload (dict): Тело запроса
+        
+    Returns:
+        httpx.Response: Ответ AI сервиса
+    """
+    started = time.perf_counter()
+    ok = False
+    try:
+        response = await get_ai_http_client().post(service_url, json=payload)
+        ok = response.status_code == 200
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        ai_request_stats.record(elapsed, ok=ok)
+        logging.info(f"Запрос к AI ({len(payload.get('posts', []))} постов) занял {elapsed * 1000:.0f} мс")
+
+
+# Индексы почти-дубликатов: исходные тексты, ушедшие в AI, и тексты, отправленные в каналы
+source_near_dup_index = SimHashIndex(
+    max_distance=settings.ai_service.near_dup_max_distance,
+    retention_hours=settings.ai_service.near_dup_retention_hours
+)
+posted_near_dup_index = SimHashIndex(
+    max_distance=settings.ai_service.near_dup_max_distance,
+    retention_hours=settings.ai_service.near_dup_retention_hours
+)
+near_dup_stats = {"skipped_before_ai": 0, "skipped_before_posting": 0}
+delivery_stats = {"created": 0, "posted": 0, "failed": 0}  # Счетчики доставок (сообщение, канал)
+
+
+async def warm_up_near_duplicate_indexes() -> None:
+    """
+    Заполняет индексы почти-дубликатов сообщениями из БД за период хранения.
+    
+    Действия:
+    1. Загружает сообщения за последние near_dup_retention_hours часов
+    2. Исходные тексты всех уже отправленных в AI сообщений добавляет в source_near_dup_index
+    3. Тексты опубликованных сообщений добавляет в posted_near_dup_index
+    """
+    if not settings.ai_service.near_dup_enabled:
+        return
+    
+    cutoff = datetime.utcnow() - timedelta(hours=settings.ai_service.near_dup_retention_hours)
+    async with AsyncSessionLocal() as session:
+        query = (
+            select(Messages.id, Messages.text, Messages.ai_processed_text, Messages.status, Messages.date)
+            .where(Messages.date >= cutoff, Messages.status != NewsStatus.NEW)
+            .order_by(Messages.date.asc())
+        )
+        rows = (await session.execute(query)).all()
+    
+    for row in rows:
+        # Даты сообщений Telethon хранятся в UTC без часового пояса
+        added_at = row.date.replace(tzinfo=timezone.utc).timestamp()
+        source_near_dup_index.add(row.id, row.text, added_at=added_at)
+        if row.status == NewsStatus.POSTED:
+            posted_near_dup_index.add(row.id, row.ai_processed_text, added_at=added_at)
+    
+    logging.info(
+        f"Индексы почти-дубликатов загружены: исходных текстов {len(source_near_dup_index)}, "
+        f"опубликованных {len(posted_near_dup_index)}"
+    )
+
+
+def find_near_duplicate_source(message_id: int, text: str | None) -> int | None:
+    """
+    Проверяет исходный текст на почти-дубликат перед отправкой в AI.
+    
+    Уникальный текст сразу добавляется в индекс, чтобы следующая
+    копия (в том числе из того же пакета) была распознана.
+    
+    Returns:
+        int | None: ID сообщения-оригинала или None, если текст уникален
+    """
+    if not settings.ai_service.near_dup_enabled:
+        return None
+    duplicate_of = source_near_dup_index.find(text, exclude_key=message_id)
+    if duplicate_of is None:
+        source_near_dup_index.add(message_id, text)
+    return duplicate_of
+
+
+async def _skip_near_duplicate(message_id: int, duplicate_of: int, stage: str) -> None:
+    """Помечает почти-дубликат как окончательно пропущенный (повторы не нужны)"""
+    near_dup_stats[f"skipped_before_{stage}"] += 1
+    logging.info(f"ID {message_id}: почти-дубликат сообщения ID {duplicate_of}, пропуск (этап: {stage})")
+    await _update_message_status(message_id, NewsStatus.ERROR_PERMANENT)
+    await _update_message_error_info(message_id, f"Почти-дубликат сообщения ID {duplicate_of}")
+
+
+def get_worker_stats() -> dict:
+    """Возвращает метрики posting worker для мониторинга"""
+    return {
+        "ai_requests": ai_request_stats.snapshot(),
+        "near_duplicates": {
+            **near_dup_stats,
+            "source_index_size": len(source_near_dup_index),
+            "posted_index_size": len(posted_near_dup_index),
+        },
+        "deliveries": dict(delivery_stats),
+        "handoff_queue": new_messages_queue.snapshot(),
+        "photo_downloads": media_downloads.snapshot(),
+        "photo_retention": photo_retention.snapshot(),
+        "rate_limiter": send_rate_limiter.snapshot(),
+        "membership_cache": bot_membership_cache.snapshot(),
+        "photos": dict(photo_stats),
+        "image_preprocess": image_preprocessor.snapshot(),
+        "status_buffer": status_buffer.snapshot(),
+        "db_pools": {
+            "sync": sync_pool_metrics.snapshot(),
+            "async": async_pool_metrics.snapshot(),
+        },
+    }
 
 
 def create_promotional_block() -> str:
@@ -69,6 +286,9 @@ async def check_bot_in_channel(bot: Bot, channel_id: str | int) -> bool:
     """
     Проверяет, является ли бот участником канала.
     
+    Результат кешируется в bot_membership_cache на POSTING_MEMBERSHIP_TTL секунд,
+    поэтому в обычном режиме проверка не тратит запросы к API.
+    
     Args:
         bot (Bot): Экземпляр бота для проверки
         channel_id (str | int): ID канала или username
@@ -76,31 +296,17 @@ async def check_bot_in_channel(bot: Bot, channel_id: str | int) -> bool:
     Returns:
         bool: True, если бот является участником канала, иначе False
     """
-    try:
-        # Пытаемся получить информацию о чате
-        chat = await bot.get_chat(channel_id)
-        
-        # Получаем ID бота
-        bot_info = await bot.get_me()
-        bot_id = bot_info.id
-        
-        # Проверяем, является ли бот администратором канала
-        try:
-            chat_member = await bot.get_chat_member(chat.id, bot_id)
-            return True  # Если получили информацию о боте в канале, значит он там есть
-        except TelegramBadRequest:
-            return False  # Ошибка запроса - скорее всего бота нет в канале
-    
-    except Exception as e:
-        logging.error(f"Ошибка при проверке бота в канале {channel_id}: {e}")
-        return False  # В случае ошибки предполагаем, что бота нет в канале
+    return await bot_membership_cache.is_member(bot, channel_id)
 
 
 async def post_message_to_telegram(
     bot: Bot | None, 
     channel_id_str: str | None, 
     text_to_post: str | None, 
-    message_db_id: int
+    message_db_id: int,
+    photo_path: str | None = None,
+    photo_file_id: str | None = None,
+    album: list[MessageMedia] | None = None
 ) -> bool:
     """
     Отправляет сообщение в Telegram канал.
@@ -110,14 +316,23 @@ async def post_message_to_telegram(
         channel_id_str (str | None): ID канала или username в виде строки
         text_to_post (str | None): Текст для публикации
         message_db_id (int): ID сообщения в базе данных (для логирования)
+        photo_path (str | None): Путь к фото из БД (Messages.photo_path); None - без фото
+        photo_file_id (str | None): file_id уже загруженного в Telegram фото
+            (Messages.photo_file_id); если есть, файл не загружается повторно
+        album (list[MessageMedia] | None): Фото альбома; если их несколько,
+            сообщение отправляется одной медиагруппой
         
     Returns:
         bool: True если отправка успешна, False в случае ошибки
         
+    Raises:
+        TelegramRetryAfter: Telegram продолжает отвечать 429 после всех повторов
+            RateLimitMiddleware; это не ошибка сообщения, а сигнал подождать
+        
     Действия:
     1. Проверяет наличие всех необходимых данных (бот, ID канала, текст)
     2. Пытается преобразовать ID канала в число, если не получается - использует как строку
-    3. Проверяет наличие изображения для сообщения
+    3. Выбирает способ отправки по данным о фото из БД (файловая система не проверяется)
     4. Отправляет сообщение через бота (с изображением, если оно есть)
     5. Логирует результат отправки
     """
@@ -147,22 +362,31 @@ async def post_message_to_telegram(
             logging.error(f"ID {message_db_id}: {error_msg}")
             return False
 
-        # Проверка наличия изображения
-        photo_path = f"database/photos/{message_db_id}.jpg"
-        has_photo = os.path.exists(photo_path)
+        # Наличие фото известно из БД: путь записывает загрузчик парсера
+        has_photo = photo_path is not None
+        album = list(album or [])
         
-        if has_photo:
+        if len(album) > 1:
+            logging.info(f"ID {message_db_id}: Отправка альбома из {len(album)} фото. chat_id={chat_id_for_send}")
+            await _send_album(
+                bot,
+                chat_id_for_send,
+                message_db_id,
+                album,
+                caption=text_to_post + create_promotional_block()
+            )
+        elif has_photo:
             logging.info(f"ID {message_db_id}: Найдено изображение: {photo_path}")
             # Отправляем сообщение с фото
             logging.info(f"ID {message_db_id}: Отправка в Telegram с фото. chat_id={chat_id_for_send}, text='{text_to_post[:30]}...'")
             
-            # Используем FSInputFile вместо открытия файла напрямую
-            photo = FSInputFile(photo_path)
-            await bot.send_photo(
-                chat_id=chat_id_for_send,
-                photo=photo,
+            await _send_photo(
+                bot,
+                chat_id_for_send,
+                message_db_id,
+                photo_path,
                 caption=text_to_post + create_promotional_block(),
-                parse_mode="HTML"
+                photo_file_id=photo_file_id
             )
         else:
             # Отправляем сообщение без фото
@@ -177,19 +401,148 @@ async def post_message_to_telegram(
             
         logging.info(f"ID {message_db_id}: Сообщение УСПЕШНО отправлено в Telegram канал '{chat_id_for_send}'.")
         return True
+    except TelegramRetryAfter:
+        raise
     except TelegramForbiddenError as e:
+        # Бота могли удалить из канала - следующая отправка проверит членство заново
+        bot_membership_cache.invalidate(chat_id_for_send)
         error_msg = f"Ошибка доступа: бот не имеет прав для отправки сообщений в канал {chat_id_for_send}. Убедитесь, что бот добавлен в канал как администратор."
         logging.error(f"ID {message_db_id}: {error_msg} Подробности: {e}")
         # Сохраняем дополнительную информацию в сообщении о причине ошибки
         await _update_message_error_info(message_db_id, error_msg)
         return False
     except Exception as e:
+        if isinstance(e, TelegramBadRequest):
+            bot_membership_cache.invalidate(chat_id_for_send)
         logging.error(f"ID {message_db_id}: ОШИБКА при отправке сообщения в Telegram с chat_id='{chat_id_for_send}': {e}", exc_info=True)
         # Сохраняем информацию об ошибке
         await _update_message_error_info(message_db_id, str(e))
         return False
 
 
+async def _send_photo(
+    bot: Bot,
+    chat_id: str | int,
+    message_db_id: int,
+    photo_path: str,
+    caption: str,
+    photo_file_id: str | None = None
+) -> None:
+    """
+    Отправляет фото, загружая файл в Telegram только один раз.
+    
+    Args:
+        bot (Bot): Экземпляр бота для отправки сообщений
+        chat_id (str | int): ID канала или username
+        message_db_id (int): ID сообщения в базе данных
+        photo_path (str): Путь к файлу фото
+        caption (str): Подпись к фото
+        photo_file_id (str | None): file_id из БД, если фото уже загружалось
+        
+    Действия:
+    1. Если file_id известен (из БД или из предыдущей отправки в этом процессе),
+       отправляет фото по нему без загрузки файла
+    2. Иначе загружает файл; параллельные полосы других каналов ждут первую
+       загрузку и используют ее file_id
+    3. Сохраняет file_id в памяти и в Messages.photo_file_id (через status_buffer)
+    4. Если Telegram не принял file_id, загружает файл заново
+    """
+    file_id = photo_file_ids.get(message_db_id) or photo_file_id
+    if file_id is None:
+        lock = photo_upload_locks.setdefault(message_db_id, asyncio.Lock())
+        async with lock:
+            file_id = photo_file_ids.get(message_db_id)
+            if file_id is None:
+                await _upload_photo(bot, chat_id, message_db_id, photo_path, caption)
+                photo_upload_locks.pop(message_db_id, None)
+                return
+        photo_upload_locks.pop(message_db_id, None)
+    
+    try:
+        await bot.send_photo(chat_id=chat_id, photo=file_id, caption=caption, parse_mode="HTML")
+        photo_stats["reused"] += 1
+        logging.info(f"ID {message_db_id}: Фото отправлено по file_id без повторной загрузки")
+    except TelegramBadRequest as e:
+        logging.warning(f"ID {message_db_id}: Telegram не принял file_id ({e}), фото загружается заново")
+        photo_file_ids.pop(message_db_id, None)
+        await _upload_photo(bot, chat_id, message_db_id, photo_path, caption)
+
+
+async def _send_album(
+    bot: Bot,
+    chat_id: str | int,
+    message_db_id: int,
+    album: list[MessageMedia],
+    caption: str
+) -> None:
+    """
+    Отправляет альбом одной медиагруппой (подпись - у первого фото).
+    
+    Как и для одиночного фото, файлы загружаются в Telegram один раз: полосы
+    других каналов ждут первую загрузку, а полученные file_id сохраняются
+    в message_media и используются при следующих отправках.
+    """
+    def build_media(use_file_ids: bool, upload_paths: dict[int, str] | None = None) -> list[InputMediaPhoto]:
+        return [
+            InputMediaPhoto(
+                media=item.file_id if use_file_ids and item.file_id else FSInputFile(upload_paths[item.id]),
+                caption=caption if position == 0 else None,
+                parse_mode="HTML" if position == 0 else None
+            )
+            for position, item in enumerate(album)
+        ]
+    
+    if all(item.file_id for item in album):
+        try:
+            await bot.send_media_group(chat_id=chat_id, media=build_media(use_file_ids=True))
+            photo_stats["reused"] += len(album)
+            return
+        except TelegramBadRequest as e:
+            logging.warning(f"ID {message_db_id}: Telegram не принял file_id альбома ({e}), фото загружаются заново")
+            for item in album:
+                item.file_id = None
+    
+    lock = photo_upload_locks.setdefault(message_db_id, asyncio.Lock())
+    async with lock:
+        # Пока ждали, альбом могла загрузить полоса другого канала
+        use_file_ids = all(item.file_id for item in album)
+        upload_paths = None
+        if not use_file_ids:
+            upload_paths = {item.id: await image_preprocessor.prepare(item.photo_path) for item in album}
+        sent = await bot.send_media_group(chat_id=chat_id, media=build_media(use_file_ids, upload_paths))
+        if use_file_ids:
+            photo_stats["reused"] += len(album)
+        else:
+            photo_stats["uploaded"] += len(album)
+            file_ids = {}
+            for item, sent_message in zip(album, sent):
+                if sent_message.photo:
+                    item.file_id = sent_message.photo[-1].file_id
+                    file_ids[item.id] = item.file_id
+            await update_media_file_ids_async(file_ids)
+    photo_upload_locks.pop(message_db_id, None)
+
+
+async def _upload_photo(bot: Bot, chat_id: str | int, message_db_id: int, photo_path: str, caption: str) -> None:
+    """Загружает файл фото в Telegram (уменьшенную копию, если включено) и запоминает полученный file_id"""
+    upload_path = await image_preprocessor.prepare(photo_path)
+    # Используем FSInputFile вместо открытия файла напрямую
+    sent = await bot.send_photo(
+        chat_id=chat_id,
+        photo=FSInputFile(upload_path),
+        caption=caption,
+        parse_mode="HTML"
+    )
+    photo_stats["uploaded"] += 1
+    if sent.photo:
+        # Самый большой размер - последний в списке
+        file_id = sent.photo[-1].file_id
+        photo_file_ids[message_db_id] = file_id
+        while len(photo_file_ids) > PHOTO_FILE_ID_CACHE_SIZE:
+            photo_file_ids.pop(next(iter(photo_file_ids)))
+        await status_buffer.set(message_db_id, photo_file_id=file_id)
+
+
 async def _update_message_error_info(message_id: int, error_info: str) -> None:
     """
     Обновляет информацию об ошибке в сообщении.
@@ -198,65 +551,52 @@ async def _update_message_error_info(message_id: int, error_info: str) -> None:
         message_id (int): ID сообщения
         error_info (str): Информация об ошибке
     """
-    def _update_sync():
-        with SessionLocal() as session:
-            message = session.get(Messages, message_id)
-            if message:
-                # Добавляем поле для хранения ошибки, если его нет
-                try:
-                    if not hasattr(message, 'error_info'):
-                        from sqlalchemy import Column, String
-                        Messages.error_info = Column(String(500), nullable=True)
-                        logging.info(f"Добавлено поле error_info в модель Messages")
-                except Exception as e:
-                    logging.warning(f"Не удалось проверить/добавить поле error_info: {e}")
-                
-                # Сохраняем информацию об ошибке
-                try:
-                    message.error_info = error_info[:500]  # Ограничиваем длину текста ошибки
-                    session.commit()
-                    logging.info(f"ID {message_id}: Сохранена информация об ошибке")
-                except Exception as e:
-                    logging.error(f"ID {message_id}: Ошибка при сохранении информации об ошибке: {e}")
-                    session.rollback()
-    
-    await asyncio.to_thread(_update_sync)
-
-
-async def get_messages_for_ai_processing(limit: int = 5) -> list[Messages]:
+    # Запись уходит в буфер и попадает в БД вместе с остальными изменениями сообщения
+    await status_buffer.set(message_id, error_info=error_info[:500])  # Ограничиваем длину текста ошибки
+    logging.info(f"ID {message_id}: Сохранена информация об ошибке")
+
+
+async def get_messages_for_ai_processing(limit: int = 5, message_ids: list[int] | None = None) -> list[Messages]:
     """
     Получает сообщения из базы данных для обработки искусственным интеллектом.
     
     Args:
         limit (int): Максимальное количество сообщений для получения. По умолчанию 5.
+        message_ids (list[int] | None): Если указан, выбираются только эти сообщения
+            (ID, переданные парсером через new_messages_queue)
         
     Returns:
         list[Messages]: Список объектов Messages, готовых для обработки AI.
         
     Действия:
-    1. Получает сообщения со статусом NEW из базы данных
-    2. Проверяет наличие непустого текста в сообщениях
-    3. Сортирует по дате (старые в начале)
-    4. Ограничивает количество записей параметром limit
+    1. Берет в аренду сообщения со статусом NEW с непустым текстом, а также
+       сообщения SENT_TO_AI, чья аренда истекла (воркер упал, не дождавшись AI)
+    2. Сортирует по дате (старые в начале)
+    3. Ограничивает количество записей параметром limit
     """
     
     logging.info("Получение сообщений для AI (статус NEW)...")
     
-    def _get_sync():
-        with SessionLocal() as session:
-            query = (
-                select(Messages)
-                .where(
-                    Messages.status == NewsStatus.NEW,
-                    Messages.text != None,
-                    Messages.text != ""
-                )
-                .order_by(Messages.date.asc())
-                .limit(limit)
-            )
-            return session.execute(query).scalars().all()
-            
-    messages = await asyncio.to_thread(_get_sync)
+    conditions = [
+        or_(
+            Messages.status == NewsStatus.NEW,
+            # Зависшие без аренды (до появления аренды) не трогаем - только просроченные
+            and_(Messages.status == NewsStatus.SENT_TO_AI, Messages.lease_until != None)
+        ),
+        Messages.text != None,
+        Messages.text != ""
+    ]
+    if message_ids is not None:
+        conditions.append(Messages.id.in_(message_ids))
+    
+    # Сначала дописываем отложенные статусы, чтобы не выбрать уже взятые сообщения
+    await status_buffer.flush()
+    messages = await claim_messages(
+        conditions=conditions,
+        worker_id=WORKER_ID,
+        lease_seconds=settings.telegram_bot.claim_lease_seconds,
+        limit=limit
+    )
     
     if messages:
         logging.info(f"Найдено {len(messages)} сообщений для AI.")
@@ -266,123 +606,52 @@ async def get_messages_for_ai_processing(limit: int = 5) -> list[Messages]:
     return messages
 
 
-async def get_messages_ready_for_posting(limit: int = 5, target_channel_id: str = None) -> list[Messages]:
+async def get_messages_for_fan_out(limit: int, source_peer_ids: list[int]) -> list[Messages]:
     """
-    Получает сообщения из базы данных, готовые для публикации в конкретный Telegram канал.
+    Получает обработанные AI сообщения, для которых еще не созданы доставки.
     
     Args:
-        limit (int): Максимальное количество сообщений для получения. По умолчанию 5.
-        target_channel_id (str): ID целевого канала для постинга. Если указан, 
-                                будут выбраны только сообщения из источников, 
-                                привязанных к этому каналу.
+        limit (int): Максимальное количество сообщений для получения
+        source_peer_ids (list[int]): peer_id источников, привязанных к активным каналам
         
     Returns:
-        list[Messages]: Список объектов Messages, готовых для публикации.
+        list[Messages]: Список объектов Messages для рассылки по каналам.
         
     Действия:
-    1. Если указан target_channel_id, получает список источников, привязанных к нему
-    2. Получает сообщения со статусом AI_PROCESSED из базы данных
-    3. Проверяет наличие обработанного AI текста в сообщениях
-    4. Фильтрует сообщения по источникам, если указан target_channel_id
-    5. Сортирует по дате (старые в начале)
-    6. Ограничивает количество записей параметром limit
-    """
-    
-    logging.info(f"Получение сообщений для постинга (статус AI_PROCESSED) для канала {target_channel_id or 'все каналы'}...")
-    
-    def _get_sync():
-        with SessionLocal() as session:
-            # Базовый запрос для получения обработанных сообщений
-            base_query = (
-                select(Messages)
-                .where(
-                    Messages.status == NewsStatus.AI_PROCESSED,
-                    Messages.ai_processed_text != None,
-                    Messages.ai_processed_text != ""
-                )
-            )
-            
-            # Если указан целевой канал, фильтруем по источникам
-            if target_channel_id:
-                # Получаем целевой канал
-                target = session.execute(
-                    select(PostingTarget).where(PostingTarget.target_chat_id == target_channel_id)
-                ).scalar_one_or_none()
-                
-                if not target:
-                    logging.warning(f"Целевой канал {target_channel_id} не найден в БД")
-                    return []
-                
-                # Получаем ID источников, привязанных к этому каналу
-                from database.models import ParsingSourceChannel, Channels
-                
-                # Получаем записи источников парсинга для данного целевого канала
-                parsing_sources = session.execute(
-                    select(ParsingSourceChannel).where(
-                        ParsingSourceChannel.posting_target_id == target.id
-                    )
-                ).scalars().all()
-                
-                if not parsing_sources:
-                    logging.warning(f"Нет источников парсинга для канала {target_channel_id}")
-                    return []
-                
-                # Получаем идентификаторы источников
-                source_identifiers = [ps.source_identifier for ps in parsing_sources]
-                
-                # Получаем каналы по их идентификаторам (username или ID)
-                source_channels = []
-                for identifier in source_identifiers:
-                    # Пробуем сначала найти по username
-                    if identifier.startswith('@'):
-                        channel = session.execute(
-                            select(Channels).where(Channels.username == identifier[1:])
-                        ).scalar_one_or_none()
-                    else:
-                        # Пробуем найти по peer_id (предполагая, что identifier - это число)
-                        try:
-                            peer_id = int(identifier)
-                            channel = session.execute(
-                                select(Channels).where(Channels.peer_id == peer_id)
-                            ).scalar_one_or_none()
-                        except ValueError:
-                            channel = None
-                    
-                    if channel:
-                        source_channels.append(channel)
-                
-                if not source_channels:
-                    logging.warning(f"Нет каналов в БД, соответствующих источникам для {target_channel_id}")
-                    return []
-                
-                # Получаем peer_id каналов-источников
-                source_peer_ids = [ch.peer_id for ch in source_channels]
-                
-                logging.info(f"Фильтрация по источникам {source_peer_ids} для канала {target_channel_id}")
-                
-                # Фильтруем сообщения только из этих источников
-                base_query = base_query.where(Messages.channel_id.in_(source_peer_ids))
-            
-            # Дополняем запрос сортировкой и лимитом
-            query = (
-                base_query
-                .order_by(Messages.date.asc())
-                .limit(limit)
-            )
-            
-            return session.execute(query).scalars().all()
-            
-    messages = await asyncio.to_thread(_get_sync)
+    1. Берет в аренду сообщения со статусом AI_PROCESSED с непустым текстом AI
+       из источников активных каналов, у которых нет ни одной доставки
+    2. Сортирует по дате (старые в начале)
+    3. Ограничивает количество записей параметром limit
+    """
+    
+    logging.info("Получение сообщений для рассылки по каналам (статус AI_PROCESSED)...")
+    
+    if not source_peer_ids:
+        return []
+    
+    await status_buffer.flush()
+    messages = await claim_messages(
+        conditions=[
+            Messages.status == NewsStatus.AI_PROCESSED,
+            Messages.ai_processed_text != None,
+            Messages.ai_processed_text != "",
+            Messages.channel_id.in_(source_peer_ids),
+            ~exists().where(MessageDelivery.message_id == Messages.id)
+        ],
+        worker_id=WORKER_ID,
+        lease_seconds=settings.telegram_bot.claim_lease_seconds,
+        limit=limit
+    )
     
     if messages:
-        logging.info(f"Найдено {len(messages)} сообщений для постинга в канал {target_channel_id or 'все каналы'}.")
+        logging.info(f"Найдено {len(messages)} сообщений для рассылки по каналам.")
     else:
-        logging.info(f"Нет сообщений для постинга в канал {target_channel_id or 'все каналы'}.")
+        logging.info("Нет новых сообщений для рассылки по каналам.")
         
     return messages
 
 
-async def _fetch_ai_response(message_id: int, text_to_process: str, service_url: str) -> str | None:
+async def _fetch_ai_response(message_id: int, text_to_process: str, service_url: str, has_photo: bool = False) -> str | None:
     """
     Отправляет текст в AI сервис и получает обработанный ответ.
     
@@ -390,12 +659,13 @@ async def _fetch_ai_response(message_id: int, text_to_process: str, service_url:
         message_id (int): ID сообщения в базе данных для логирования
         text_to_process (str): Исходный текст для обработки AI
         service_url (str): URL эндпоинта AI сервиса
+        has_photo (bool): Есть ли у сообщения фото (Messages.photo_path)
         
     Returns:
         str | None: Обработанный AI текст или None в случае ошибки/пустого ответа
         
     Действия:
-    1. Проверяет наличие изображения для сообщения
+    1. Добавляет в запрос признак наличия изображения
     2. Отправляет POST запрос в AI сервис с текстом и информацией об изображении
     3. Получает и проверяет ответ от сервиса
     4. Извлекает обработанный текст из ответа
@@ -404,10 +674,6 @@ async def _fetch_ai_response(message_id: int, text_to_process: str, service_url:
     
     logging.info(f"ID {message_id}: Отправка в AI ({service_url}): {text_to_process[:30]}...")
     
-    # Проверяем наличие изображения
-    photo_path = f"database/photos/{message_id}.jpg"
-    has_photo = os.path.exists(photo_path)
-    
     # Добавляем информацию о наличии изображения в запрос
     payload = {
         "posts": [text_to_process],
@@ -418,69 +684,62 @@ async def _fetch_ai_response(message_id: int, text_to_process: str, service_url:
         logging.info(f"ID {message_id}: Сообщение содержит изображение, эта информация добавлена в запрос к AI")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Делаем запрос к API
-            response = await client.post(service_url, json=payload)
+        # Делаем запрос к API через общий пул соединений
+        response = await _post_to_ai(service_url, payload)
+        
+        # Проверяем статус ответа
+        if response.status_code != 200:
+            logging.error(f"ID {message_id}: Ошибка при запросе к AI: {response.status_code} - {response.text}")
+            return None
             
-            # Проверяем статус ответа
-            if response.status_code != 200:
-                logging.error(f"ID {message_id}: Ошибка при запросе к AI: {response.status_code} - {response.text}")
-                return None
-                
-            # Получаем данные из ответа
-            response_data = response.json()
+        # Получаем данные из ответа
+        response_data = response.json()
+        
+        # Проверяем структуру ответа
+        if not response_data.get('status') == 'success' or 'result' not in response_data:
+            logging.error(f"ID {message_id}: Некорректный ответ от AI: {response_data}")
+            return None
             
-            # Проверяем структуру ответа
-            if not response_data.get('status') == 'success' or 'result' not in response_data:
-                logging.error(f"ID {message_id}: Некорректный ответ от AI: {response_data}")
-                return None
-                
-            # Получаем результаты
-            result = response_data['result']
+        # Получаем результаты
+        result = response_data['result']
+        
+        # Проверяем, что результат непустой
+        if not result or len(result) == 0:
+            logging.info(f"ID {message_id}: AI вернул пустой результат - пост отфильтрован как нерелевантный")
+            return None
             
-            # Проверяем, что результат непустой
-            if not result or len(result) == 0:
-                logging.info(f"ID {message_id}: AI вернул пустой результат - пост отфильтрован как нерелевантный")
-                return None
-                
-            # Извлекаем обработанный текст
-            processed_text = result[0].get('text', '') if isinstance(result, list) and len(result) > 0 else ''
+        # Извлекаем обработанный текст
+        processed_text = result[0].get('text', '') if isinstance(result, list) and len(result) > 0 else ''
+        
+        # Проверяем, что обработанный текст не пустой и достаточно содержательный
+        if not processed_text or len(processed_text) < 10:
+            logging.info(f"ID {message_id}: AI вернул слишком короткий результат ({len(processed_text) if processed_text else 0} символов) - пост отфильтрован")
+            return None
             
-            # Проверяем, что обработанный текст не пустой и достаточно содержательный
-            if not processed_text or len(processed_text) < 10:
-                logging.info(f"ID {message_id}: AI вернул слишком короткий результат ({len(processed_text) if processed_text else 0} символов) - пост отфильтрован")
-                return None
-                
-            logging.info(f"ID {message_id}: AI успешно обработал пост: {processed_text[:30]}...")
-            return processed_text
+        logging.info(f"ID {message_id}: AI успешно обработал пост: {processed_text[:30]}...")
+        return processed_text
             
     except Exception as e:
         logging.error(f"ID {message_id}: Ошибка при запросе к AI: {e}", exc_info=True)
         return None
 
 
-def generate_content_hash(text: str) -> str:
-    """Генерирует хеш для текста, игнорируя пунктуацию и регистр"""
-    if not text:
-        return ""
-    # Приводим к нижнему регистру и удаляем лишние символы
-    normalized = re.sub(r'[^\w\s]', '', text.lower())
-    # Удаляем лишние пробелы
-    normalized = ' '.join(normalized.split())
-    return hashlib.md5(normalized.encode()).hexdigest()
-
-
 async def check_content_duplicate_in_db(content: str, target_channel_id: str = None, hours_back: int = 24) -> bool:
     """
     Проверяет, не был ли уже опубликован похожий контент в последние N часов
     
     Args:
         content (str): Текст для проверки
-        target_channel_id (str): ID целевого канала (опционально)
+        target_channel_id (str): ID целевого канала (опционально). Если указан,
+                                 ищутся только сообщения из источников этого канала
         hours_back (int): Количество часов назад для проверки (по умолчанию 24)
         
     Returns:
         bool: True если дубликат найден, False если контент уникален
+        
+    Действия:
+    Выполняет один запрос по индексу content_hash вместо пересчета
+    хешей всех опубликованных сообщений.
     """
     if not content:
         return False
@@ -489,39 +748,36 @@ async def check_content_duplicate_in_db(content: str, target_channel_id: str = N
     if not content_hash:
         return False
     
-    def _check_sync():
-        with SessionLocal() as session:
-            # Создаем базовый запрос
-            query = select(Messages).where(
-                Messages.status == NewsStatus.POSTED,
-                Messages.date >= datetime.now() - timedelta(hours=hours_back)
-            )
-            
-            # Если указан конкретный канал, фильтруем по нему
-            if target_channel_id:
-                query = query.where(Messages.target_channel_id == target_channel_id)
-            
-            posted_messages = session.execute(query).scalars().all()
-            
-            # Проверяем хеши опубликованных сообщений
-            for msg in posted_messages:
-                if msg.ai_processed_text:
-                    existing_hash = generate_content_hash(msg.ai_processed_text)
-                    if existing_hash == content_hash:
-                        logging.info(f"Найден дубликат: сообщение ID {msg.id} имеет похожий контент")
-                        return True
+    query = select(Messages.id).where(
+        Messages.content_hash == content_hash,
+        Messages.status == NewsStatus.POSTED,
+        Messages.date >= datetime.now() - timedelta(hours=hours_back)
+    )
+    
+    # Если указан конкретный канал, ограничиваемся его источниками
+    if target_channel_id:
+        source_peer_ids = await source_routing.get_source_peer_ids(target_channel_id)
+        if not source_peer_ids:
             return False
+        query = query.where(Messages.channel_id.in_(source_peer_ids))
+    
+    async with AsyncSessionLocal() as session:
+        duplicate_id = (await session.execute(query.limit(1))).scalar_one_or_none()
     
-    return await asyncio.to_thread(_check_sync)
+    if duplicate_id is not None:
+        logging.info(f"Найден дубликат: сообщение ID {duplicate_id} имеет похожий контент")
+        return True
+    return False
 
 
-async def simplified_process_message(message_id: int, original_text: str):
+async def simplified_process_message(message_id: int, original_text: str, has_photo: bool = False):
     """
     Упрощенная обработка сообщения через AI сервис.
     
     Args:
         message_id (int): ID сообщения в базе данных
         original_text (str): Исходный текст сообщения для обработки
+        has_photo (bool): Есть ли у сообщения фото (Messages.photo_path)
         
     Действия:
     1. Проверяет входные данные (текст и URL AI сервиса)
@@ -551,6 +807,12 @@ async def simplified_process_message(message_id: int, original_text: str):
         )
         return
 
+    # Почти-дубликаты уже отправленных в AI текстов не тратят запрос к Gemini
+    duplicate_of = find_near_duplicate_source(message_id, original_text)
+    if duplicate_of is not None:
+        await _skip_near_duplicate(message_id, duplicate_of, "ai")
+        return
+
     try:
         # Обновление статуса на "отправляется в AI"
         await _update_message_status(message_id, NewsStatus.SENT_TO_AI)
@@ -560,24 +822,12 @@ async def simplified_process_message(message_id: int, original_text: str):
         processed_text_from_ai = await _fetch_ai_response(
             message_id, 
             original_text, 
-            AI_SERVICE_URL
+            AI_SERVICE_URL,
+            has_photo=has_photo
         )
 
         # Проверка результата AI
-        if processed_text_from_ai:
-            # Проверяем на дубликаты в базе данных
-            is_duplicate = await check_content_duplicate_in_db(processed_text_from_ai)
-            
-            if is_duplicate:
-                logging.info(f"ID {message_id}: AI обработал текст, но он является дубликатом уже опубликованного контента")
-                new_status = NewsStatus.ERROR_AI_PROCESSING
-                processed_text_from_ai = "Контент отфильтрован как дубликат"
-            else:
-                new_status = NewsStatus.AI_PROCESSED
-                logging.info(f"ID {message_id}: Контент уникален, готов к публикации")
-        else:
-            new_status = NewsStatus.ERROR_AI_PROCESSING
-            processed_text_from_ai = "AI не вернул текст"
+        new_status, processed_text_from_ai = await _resolve_ai_result(message_id, processed_text_from_ai)
 
     except httpx.RequestError as e:
         logging.error(f"ID {message_id}: Ошибка сети при обращении к AI: {e}")
@@ -607,6 +857,135 @@ async def simplified_process_message(message_id: int, original_text: str):
     logging.info(f"ID {message_id}: Обработка завершена. Статус: {new_status.value}")
 
 
+async def _resolve_ai_result(message_id: int, processed_text: str | None) -> tuple[NewsStatus, str]:
+    """
+    Определяет итоговый статус сообщения по ответу AI.
+    
+    Args:
+        message_id (int): ID сообщения в базе данных (для логирования)
+        processed_text (str | None): Текст, полученный от AI
+        
+    Returns:
+        tuple[NewsStatus, str]: Новый статус и текст для поля ai_processed_text
+    """
+    if not processed_text:
+        return NewsStatus.ERROR_AI_PROCESSING, "AI не вернул текст"
+    
+    # Проверяем на дубликаты в базе данных
+    is_duplicate = await check_content_duplicate_in_db(processed_text)
+    
+    if is_duplicate:
+        logging.info(f"ID {message_id}: AI обработал текст, но он является дубликатом уже опубликованного контента")
+        return NewsStatus.ERROR_AI_PROCESSING, "Контент отфильтрован как дубликат"
+    
+    logging.info(f"ID {message_id}: Контент уникален, готов к публикации")
+    return NewsStatus.AI_PROCESSED, processed_text
+
+
+async def _fetch_ai_batch_response(
+    messages: list[Messages],
+    has_image: bool,
+    service_url: str
+) -> dict[int, str]:
+    """
+    Отправляет несколько сообщений в AI сервис одним запросом.
+    
+    Args:
+        messages (list[Messages]): Сообщения для обработки (с непустым текстом)
+        has_image (bool): Есть ли изображения у сообщений пакета
+        service_url (str): URL эндпоинта AI сервиса
+        
+    Returns:
+        dict[int, str]: Обработанные тексты по ID сообщений. Сообщения,
+            отфильтрованные AI, в словарь не попадают.
+        
+    Raises:
+        httpx.RequestError: При ошибках сети
+        httpx.HTTPStatusError: При ошибках HTTP от AI сервиса
+        ValueError: При некорректном ответе AI сервиса
+    """
+    message_ids = [msg.id for msg in messages]
+    logging.info(f"Пакетная отправка в AI ({service_url}): {len(messages)} сообщений {message_ids}, has_image={has_image}")
+    
+    payload = {
+        "posts": [msg.text for msg in messages],
+        "has_image": has_image
+    }
+    
+    response = await _post_to_ai(service_url, payload)
+    response.raise_for_status()
+    response_data = response.json()
+    
+    if not response_data.get('status') == 'success' or not isinstance(response_data.get('result'), list):
+        raise ValueError(f"Некорректный ответ от AI: {str(response_data)[:200]}")
+    
+    # Сопоставляем результаты с сообщениями по индексу входного поста
+    processed: dict[int, str] = {}
+    for item in response_data['result']:
+        index = item.get('index') if isinstance(item, dict) else None
+        if not isinstance(index, int) or not 0 <= index < len(messages):
+            logging.warning(f"Результат AI без корректного индекса пропущен: {str(item)[:100]}")
+            continue
+        
+        message_id = messages[index].id
+        text = item.get('text', '')
+        if message_id in processed:
+            continue
+        if not text or len(text) < 10:
+            logging.info(f"ID {message_id}: AI вернул слишком короткий результат ({len(text) if text else 0} символов) - пост отфильтрован")
+            continue
+        processed[message_id] = text
+    
+    logging.info(f"AI вернул {len(processed)} результатов для пакета из {len(messages)} сообщений")
+    return processed
+
+
+async def process_ai_batch(messages: list[Messages], has_image: bool) -> None:
+    """
+    Обрабатывает пакет сообщений через AI сервис одним запросом.
+    
+    Args:
+        messages (list[Messages]): Сообщения пакета (с непустым текстом)
+        has_image (bool): Есть ли изображения у сообщений пакета
+        
+    Действия:
+    1. Переводит все сообщения пакета в статус SENT_TO_AI
+    2. Отправляет пакет в AI сервис через _fetch_ai_batch_response()
+    3. Для каждого сообщения проверяет результат на дубликаты и обновляет статус;
+       сообщения без результата считаются отфильтрованными AI
+    4. При ошибке запроса помечает ошибкой все сообщения пакета
+    """
+    if not messages:
+        return
+    
+    for msg in messages:
+        await _update_message_status(msg.id, NewsStatus.SENT_TO_AI)
+    
+    try:
+        processed = await _fetch_ai_batch_response(messages, has_image, AI_SERVICE_URL)
+    except httpx.RequestError as e:
+        logging.error(f"Ошибка сети при пакетном обращении к AI: {e}")
+        for msg in messages:
+            await _update_message_status(msg.id, NewsStatus.ERROR_SENDING_TO_AI, f"Ошибка сети: {str(e)}")
+        return
+    except httpx.HTTPStatusError as e:
+        logging.error(f"AI сервис вернул HTTP ошибку для пакета: {e.response.status_code} - {e.response.text}")
+        error_text = f"AI ошибка HTTP: {e.response.status_code} - {e.response.text[:100]}"
+        for msg in messages:
+            await _update_message_status(msg.id, NewsStatus.ERROR_AI_PROCESSING, error_text)
+        return
+    except Exception as e:
+        logging.error(f"Непредвиденная ошибка при пакетной обработке AI: {e}", exc_info=True)
+        for msg in messages:
+            await _update_message_status(msg.id, NewsStatus.ERROR_AI_PROCESSING, f"Ошибка: {str(e)[:100]}")
+        return
+    
+    for msg in messages:
+        new_status, text = await _resolve_ai_result(msg.id, processed.get(msg.id))
+        await _update_message_status(msg.id, new_status, text)
+        logging.info(f"ID {msg.id}: Обработка завершена. Статус: {new_status.value}")
+
+
 async def get_messages_with_errors(limit: int = 2, max_retry_count: int = 3) -> list[Messages]:
     """
     Получает сообщения с ошибками, которые можно повторно обработать.
@@ -627,31 +1006,17 @@ async def get_messages_with_errors(limit: int = 2, max_retry_count: int = 3) ->
     
     logging.info("Получение сообщений с ошибками для повторной обработки...")
     
-    def _get_sync():
-        with SessionLocal() as session:
-            # Добавляем поле для хранения количества попыток обработки, если его нет
-            try:
-                if not hasattr(Messages, 'retry_count'):
-                    from sqlalchemy import Column, Integer
-                    Messages.retry_count = Column(Integer, default=0)
-                    logging.info("Добавлено поле retry_count в модель Messages")
-            except Exception as e:
-                logging.warning(f"Не удалось проверить/добавить поле retry_count: {e}")
-            
-            # Запрос на получение сообщений с ошибками
-            query = (
-                select(Messages)
-                .where(
-                    (Messages.status == NewsStatus.ERROR_AI_PROCESSING) | 
-                    (Messages.status == NewsStatus.ERROR_POSTING),
-                    (Messages.retry_count < max_retry_count) | (Messages.retry_count == None)
-                )
-                .order_by(Messages.date.asc())
-                .limit(limit)
-            )
-            return session.execute(query).scalars().all()
-            
-    messages = await asyncio.to_thread(_get_sync)
+    await status_buffer.flush()
+    messages = await claim_messages(
+        conditions=[
+            (Messages.status == NewsStatus.ERROR_AI_PROCESSING) | 
+            (Messages.status == NewsStatus.ERROR_POSTING),
+            (Messages.retry_count < max_retry_count) | (Messages.retry_count == None)
+        ],
+        worker_id=WORKER_ID,
+        lease_seconds=settings.telegram_bot.claim_lease_seconds,
+        limit=limit
+    )
     
     if messages:
         logging.info(f"Найдено {len(messages)} сообщений с ошибками для повторной обработки.")
@@ -669,20 +1034,8 @@ async def increment_retry_count(message_id: int) -> None:
         message_id (int): ID сообщения для обновления
     """
     
-    def _update_sync():
-        with SessionLocal() as session:
-            message = session.get(Messages, message_id)
-            if message:
-                if hasattr(message, 'retry_count') and message.retry_count is not None:
-                    message.retry_count += 1
-                else:
-                    message.retry_count = 1
-                session.commit()
-                logging.info(f"ID {message_id}: Увеличен счетчик попыток обработки до {message.retry_count}")
-            else:
-                logging.warning(f"ID {message_id}: Сообщение не найдено для обновления счетчика попыток")
-                
-    await asyncio.to_thread(_update_sync)
+    await status_buffer.increment_retry(message_id)
+    logging.info(f"ID {message_id}: Счетчик попыток обработки увеличен")
 
 
 async def process_error_messages() -> None:
@@ -710,7 +1063,7 @@ async def process_error_messages() -> None:
             # Повторная обработка через AI
             if msg.text:
                 logging.info(f"ID {msg.id}: Повторная отправка в AI")
-                await simplified_process_message(msg.id, msg.text)
+                await simplified_process_message(msg.id, msg.text, has_photo=msg.photo_path is not None)
             else:
                 logging.warning(f"ID {msg.id}: Отсутствует текст для повторной обработки")
                 await _update_message_status(
@@ -720,10 +1073,14 @@ async def process_error_messages() -> None:
                 )
         
         elif msg.status == NewsStatus.ERROR_POSTING:
-            # Повторная отправка в постинг (статус остается AI_PROCESSED)
+            # Повторная отправка в постинг: сообщение без доставок заново разошлет
+            # fan_out_messages, а неудачные доставки возвращаются в очередь
             if msg.ai_processed_text:
                 logging.info(f"ID {msg.id}: Сброс статуса на AI_PROCESSED для повторного постинга")
                 await _update_message_status(msg.id, NewsStatus.AI_PROCESSED)
+                requeued = await requeue_failed_deliveries([msg.id])
+                if requeued:
+                    logging.info(f"ID {msg.id}: {requeued} доставок возвращено в очередь")
             else:
                 logging.warning(f"ID {msg.id}: Отсутствует обработанный текст для повторного постинга")
                 await _update_message_status(
@@ -739,23 +1096,22 @@ async def mark_permanently_failed_messages() -> None:
     """
     Помечает сообщения, которые не удалось обработать после максимального количества попыток.
     """
-    def _update_sync():
-        with SessionLocal() as session:
-            # Запрос на обновление статуса сообщений с превышенным количеством попыток
-            stmt = (
-                update(Messages)
-                .where(
-                    ((Messages.status == NewsStatus.ERROR_AI_PROCESSING) | 
-                     (Messages.status == NewsStatus.ERROR_POSTING)),
-                    Messages.retry_count >= 3
-                )
-                .values(status=NewsStatus.ERROR_PERMANENT)
+    # Счетчики попыток могут еще лежать в буфере
+    await status_buffer.flush()
+    async with AsyncSessionLocal() as session:
+        # Запрос на обновление статуса сообщений с превышенным количеством попыток
+        stmt = (
+            update(Messages)
+            .where(
+                ((Messages.status == NewsStatus.ERROR_AI_PROCESSING) | 
+                 (Messages.status == NewsStatus.ERROR_POSTING)),
+                Messages.retry_count >= 3
             )
-            result = session.execute(stmt)
-            session.commit()
-            return result.rowcount
-            
-    updated_count = await asyncio.to_thread(_update_sync)
+            .values(status=NewsStatus.ERROR_PERMANENT)
+        )
+        result = await session.execute(stmt)
+        await session.commit()
+        updated_count = result.rowcount
     
     if updated_count > 0:
         logging.info(f"Помечено {updated_count} сообщений как необратимо проблемные (ERROR_PERMANENT)")
@@ -763,7 +1119,7 @@ async def mark_permanently_failed_messages() -> None:
 
 async def main_logic(bot_for_posting: Bot | None):
     """
-    Основная логика обработки и публикации сообщений.
+    Один последовательный проход всех этапов (разовый запуск: --once).
     
     Args:
         bot_for_posting (Bot | None): Инстанс бота для публикации сообщений.
@@ -772,10 +1128,13 @@ async def main_logic(bot_for_posting: Bot | None):
     Действия:
     1. Запускает обработку сообщений через AI
     2. Делает паузу между этапами
-    3. Публикует обработанные сообщения в Telegram каналы
+    3. Создает доставки (сообщение, канал) для обработанных сообщений и публикует
+       ожидающие доставки параллельно, по одной полосе на канал
        (если предоставлен бот и каналы настроены в базе данных)
     4. Обрабатывает сообщения с ошибками
-    5. Помечает окончательно проблемные сообщения
+    5. Помечает окончательно проблемные сообщения и ставит итоговый статус
+       сообщениям, доставки которых остались только в отключенные каналы
+    6. Удаляет порцию устаревших фото
     """
     
     logging.info("main_logic запущен")
@@ -793,91 +1152,381 @@ async def main_logic(bot_for_posting: Bot | None):
         )
         return
     
-    # Получаем все активные целевые каналы из базы данных
-    active_targets = await asyncio.to_thread(posting_target_repository.get_all_active_target_channels)
+    # Рассылка новых сообщений по каналам и отправка ожидающих доставок
+    _refresh_routes_if_needed()
+    await fan_out_messages()
+    await deliver_pending(bot_for_posting)
+    
+    # Этап 3: Обработка сообщений с ошибками
+    await process_error_messages()
+    
+    # Этап 4: Пометка окончательно проблемных сообщений и зависших в постинге
+    await mark_permanently_failed_messages()
+    await finalize_stalled_messages()
+    
+    # Этап 5: Очистка хранилища фото (одна порция)
+    await photo_retention.step()
+
+
+async def fan_out_messages() -> None:
+    """
+    Рассылает обработанные AI сообщения по целевым каналам.
     
-    if not active_targets:
-        logging.info("Нет активных целевых каналов в базе данных. Постинг пропускается.")
+    Действия:
+    1. Берет в аренду сообщения AI_PROCESSED без доставок из источников активных каналов
+    2. Отсеивает почти-дубликаты уже отправленных текстов
+    3. Для каждого сообщения создает по доставке на каждый канал, к которому
+       привязан его источник (один источник может быть привязан к нескольким каналам)
+    """
+    targets_by_source = await source_routing.get_targets_by_source()
+    if not targets_by_source:
+        logging.info("Нет активных целевых каналов с источниками. Постинг пропускается.")
         return
     
-    logging.info(f"Найдено {len(active_targets)} активных целевых каналов для постинга.")
+    messages = await get_messages_for_fan_out(
+        limit=settings.telegram_bot.posting_lane_batch_size * len(source_routing.routes),
+        source_peer_ids=list(targets_by_source)
+    )
     
-    # Обрабатываем постинг для каждого канала отдельно
-    for target in active_targets:
-        target_id = target["target_chat_id"]
-        logging.info(f"Обработка постинга для канала {target_id}")
-        
-        # Получаем сообщения для конкретного канала
-        messages = await get_messages_ready_for_posting(limit=2, target_channel_id=target_id)
-        
-        if not messages:
-            logging.info(f"Нет сообщений для постинга в канал {target_id}.")
-            continue
-            
-        logging.info(f"Найдено {len(messages)} сообщений для постинга в канал {target_id}.")
-        
-        # Создаем список с одним текущим каналом
-        channel = [{
-            "target_chat_id": target_id,
-            "target_title": target.get("target_title", "Без названия")
-        }]
+    routes: dict[int, list[str]] = {}
+    for msg in messages:
+        # Повторная проверка на почти-дубликат уже отправленного текста.
+        # Текст индексируется при рассылке, чтобы параллельные полосы не опубликовали копию
+        if settings.ai_service.near_dup_enabled:
+            duplicate_of = posted_near_dup_index.find(msg.ai_processed_text, exclude_key=msg.id)
+            if duplicate_of is not None:
+                await _skip_near_duplicate(msg.id, duplicate_of, "posting")
+                continue
+            posted_near_dup_index.add(msg.id, msg.ai_processed_text)
+        routes[msg.id] = targets_by_source.get(msg.channel_id, [])
+    
+    created = await create_deliveries(routes)
+    delivery_stats["created"] += created
+    if created:
+        logging.info(f"Создано {created} доставок для {len(routes)} сообщений")
+
+
+async def deliver_pending(bot: Bot) -> int:
+    """
+    Отправляет ожидающие доставки во все активные каналы.
+    
+    Args:
+        bot (Bot): Экземпляр бота для отправки сообщений
         
-        # Отправляем сообщения в этот канал
-        await _process_posting_messages_multi_channel(bot_for_posting, channel, messages)
+    Returns:
+        int: Количество взятых доставок
         
-        # Небольшая пауза между обработкой разных каналов
-        await asyncio.sleep(1)
+    Действия:
+    1. Одним запросом берет в аренду ожидающие и повторяемые доставки всех каналов
+    2. Группирует их по каналам и отправляет параллельно, по одной полосе на канал;
+       темп отправки задает send_rate_limiter, а не фиксированные паузы
+    3. Сообщениям, все доставки которых завершены, ставит итоговый статус:
+       POSTED, если оно опубликовано хотя бы в один канал, иначе ERROR_PERMANENT
+    """
+    await source_routing.ensure_valid()
+    target_chat_ids = list(source_routing.routes)
+    
+    deliveries = await claim_deliveries(
+        target_chat_ids,
+        worker_id=WORKER_ID,
+        lease_seconds=settings.telegram_bot.claim_lease_seconds,
+        limit=settings.telegram_bot.posting_lane_batch_size * len(target_chat_ids)
+    )
+    if not deliveries:
+        logging.info("Нет доставок для отправки в этом цикле.")
+        return 0
+    
+    lanes: dict[str, list[MessageDelivery]] = {}
+    for delivery in deliveries:
+        lanes.setdefault(delivery.target_chat_id, []).append(delivery)
+    logging.info(f"Взято {len(deliveries)} доставок для {len(lanes)} каналов")
+    
+    lane_results = await asyncio.gather(
+        *(_run_delivery_lane(bot, target_id, lane) for target_id, lane in lanes.items()),
+        return_exceptions=True
+    )
+    for target_id, lane_result in zip(lanes, lane_results):
+        if isinstance(lane_result, Exception):
+            logging.error(f"Ошибка в полосе постинга канала {target_id}: {lane_result}", exc_info=lane_result)
     
-    # Этап 3: Обработка сообщений с ошибками
-    await process_error_messages()
+    finished = await get_finished_messages(list({d.message_id for d in deliveries}), target_chat_ids)
+    await _finalize_messages(finished)
+    return len(deliveries)
+
+
+async def _finalize_messages(finished: dict[int, bool]) -> None:
+    """
+    Ставит итоговый статус сообщениям, все доставки которых завершены.
     
-    # Этап 4: Пометка окончательно проблемных сообщений
-    await mark_permanently_failed_messages()
+    Args:
+        finished (dict[int, bool]): ID сообщения -> опубликовано ли оно хотя бы в один канал
+    """
+    for message_id, posted in finished.items():
+        if posted:
+            await _update_message_status(message_id, NewsStatus.POSTED)
+        else:
+            await _update_message_status(message_id, NewsStatus.ERROR_PERMANENT)
+            await _update_message_error_info(message_id, "Не удалось опубликовать ни в один канал")
+        logging.info(f"ID {message_id}: Все доставки завершены, статус: {'POSTED' if posted else 'ERROR_PERMANENT'}")
 
 
-async def run_periodic_tasks(bot_for_posting: Bot | None):
+async def finalize_stalled_messages(limit: int = 100) -> int:
+    """
+    Ставит итоговый статус сообщениям, оставшиеся доставки которых ведут
+    только в отключенные каналы.
+    
+    deliver_pending проверяет завершенность только сообщений, доставки
+    которых взял в своем цикле; доставки в отключенный канал больше не
+    берутся, и без этой проверки сообщение навсегда осталось бы в AI_PROCESSED.
+    
+    Returns:
+        int: Количество сообщений, получивших итоговый статус
     """
-    Запускает периодические задачи обработки и публикации сообщений.
+    await source_routing.ensure_valid()
+    target_chat_ids = list(source_routing.routes)
+    if not target_chat_ids:
+        # Нет ни одного активного канала (например, настройки постинга меняются):
+        # не закрываем все сообщения разом, ждем следующей проверки
+        return 0
+    
+    await status_buffer.flush()
+    message_ids = await get_stalled_messages(target_chat_ids, limit=limit)
+    if not message_ids:
+        return 0
+    
+    finished = await get_finished_messages(message_ids, target_chat_ids)
+    await _finalize_messages(finished)
+    logging.info(f"Итоговый статус поставлен {len(finished)} сообщениям с доставками только в отключенные каналы")
+    return len(finished)
+
+
+async def _run_delivery_lane(bot: Bot, target_id: str, deliveries: list[MessageDelivery]) -> None:
+    """
+    Полоса постинга для одного целевого канала.
+    
+    Args:
+        bot (Bot): Экземпляр бота для отправки сообщений
+        target_id (str): ID целевого канала
+        deliveries (list[MessageDelivery]): Доставки этого канала (старые в начале)
+        
+    Действия:
+    1. Отправляет сообщения доставок; темп задает RateLimitMiddleware бота
+    2. Если канал продолжает отвечать retry_after, полоса останавливается, а ее
+       оставшиеся доставки возвращаются в очередь без расхода попыток
+    3. Записывает результаты пачкой; неудачная доставка повторяется отдельно,
+       не затрагивая уже опубликованные копии в других каналах
+    """
+    logging.info(f"Постинг {len(deliveries)} доставок в канал {target_id}")
+    results = []
+    try:
+        for index, delivery in enumerate(deliveries):
+            msg = delivery.message
+            try:
+                success = await post_message_to_telegram(
+                    bot, target_id, msg.ai_processed_text, msg.id,
+                    photo_path=msg.photo_path,
+                    photo_file_id=msg.photo_file_id,
+                    album=msg.media
+                )
+            except TelegramRetryAfter as e:
+                logging.warning(f"Канал {target_id}: retry_after {e.retry_after}с, {len(deliveries) - index} доставок отложено")
+                # Только снимаем аренду: статус и счетчик попыток не меняются
+                results.extend({"id": postponed.id} for postponed in deliveries[index:])
+                break
+            delivery_stats["posted" if success else "failed"] += 1
+            results.append(delivery_result(
+                delivery, success,
+                error_info=None if success else f"Ошибка отправки в канал {target_id}"
+            ))
+    finally:
+        # Результаты уже отправленных доставок сохраняются, даже если полоса прервана
+        await save_delivery_results(results)
+
+
+async def run_periodic_tasks(bot_for_posting: Bot | None, stages: tuple[str, ...] = PIPELINE_STAGES):
+    """
+    Запускает этапы обработки и публикации сообщений как независимые задачи.
     
     Args:
         bot_for_posting (Bot | None): Инстанс бота для публикации сообщений.
             Если None, этап публикации будет пропущен.
+        stages (tuple[str, ...]): Какие этапы запускать в этом процессе
+            ("ai", "posting", "errors", "retention"); остальные могут работать в других процессах
             
     Действия:
-    1. Запускает бесконечный цикл выполнения основной логики
-    2. Периодически проверяет обновления в настройках каналов
-    3. Делает паузу между итерациями
-    4. Логирует каждую итерацию
+    1. Создает общий HTTP клиент для AI сервиса (закрывается при остановке)
+    2. Запускает каждый этап своей задачей с собственным числом параллельных циклов:
+       медленный запрос к Gemini не задерживает постинг, а ожидание лимитов
+       Telegram не задерживает AI обработку
+    3. AI этап дополнительно обрабатывает сообщения из очереди парсера сразу
+    4. При остановке дописывает буфер статусов и закрывает HTTP клиент
+    """
+    
+    logging.info(f"Запуск run_periodic_tasks в posting_worker, этапы: {', '.join(stages)}")
+    # HTTP клиент AI живет столько же, сколько воркер, и переиспользует соединения
+    get_ai_http_client()
+    try:
+        await warm_up_near_duplicate_indexes()
+    except Exception as e:
+        logging.error(f"Ошибка загрузки индексов почти-дубликатов: {e}", exc_info=True)
+    status_buffer.start()
+    
+    bot_settings = settings.telegram_bot
+    stage_tasks = []
+    if "ai" in stages:
+        stage_tasks.append(_run_stage("ai", _ai_stage_step, bot_settings.pipeline_ai_concurrency))
+        # Новые сообщения от парсера уходят в AI сразу; опрос БД остается запасным путем
+        if new_messages_queue.enabled:
+            stage_tasks.append(_ai_handoff_loop())
+    if "posting" in stages:
+        if bot_for_posting:
+            stage_tasks.append(_run_stage(
+                "posting",
+                lambda: _posting_stage_step(bot_for_posting),
+                bot_settings.pipeline_posting_concurrency,
+                wake_event=posting_settings_update_event
+            ))
+        else:
+            logging.warning("Инстанс бота для постинга не предоставлен. Этап постинга не запускается.")
+    if "errors" in stages:
+        stage_tasks.append(_run_stage(
+            "errors", _errors_stage_step, 1,
+            idle_interval=bot_settings.pipeline_errors_interval
+        ))
+    if "retention" in stages:
+        stage_tasks.append(_run_stage(
+            "retention", photo_retention.step, 1,
+            idle_interval=settings.telegram_parser.photo_retention_interval
+        ))
+    
+    tasks = [asyncio.create_task(stage) for stage in stage_tasks]
+    try:
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await status_buffer.stop()
+        await close_ai_http_client()
+        image_preprocessor.shutdown()
+
+
+async def _run_stage(
+    name: str,
+    step,
+    concurrency: int,
+    idle_interval: float | None = None,
+    wake_event: asyncio.Event | None = None
+) -> None:
     """
+    Бесконечный цикл одного этапа в concurrency параллельных копиях.
     
+    Args:
+        name (str): Название этапа для логов
+        step: Корутинная функция одного шага; возвращает True, если работа была
+            (тогда следующий шаг начинается сразу)
+        concurrency (int): Сколько циклов этапа работает параллельно; они не мешают
+            друг другу, так как берут сообщения в аренду
+        idle_interval (float | None): Пауза, когда работы нет (по умолчанию PIPELINE_IDLE_INTERVAL)
+        wake_event (asyncio.Event | None): Событие, которое прерывает паузу досрочно
+    
+    Обратное давление: каждый цикл берет новую порцию, только закончив
+    предыдущую, поэтому этап не набирает больше работы, чем успевает сделать.
+    """
+    if idle_interval is None:
+        idle_interval = settings.telegram_bot.pipeline_idle_interval
+    
+    async def loop(worker_number: int) -> None:
+        while True:
+            try:
+                has_work = await step()
+            except Exception as e:
+                logging.error(f"Ошибка этапа {name} (цикл {worker_number}): {e}", exc_info=True)
+                has_work = False
+            
+            if has_work:
+                await asyncio.sleep(0)  # Даем поработать остальным задачам
+                continue
+            
+            try:
+                if wake_event is not None:
+                    await asyncio.wait_for(wake_event.wait(), timeout=idle_interval)
+                else:
+                    await asyncio.sleep(idle_interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    logging.info(f"Этап {name} запущен: {max(concurrency, 1)} параллельных циклов")
+    await asyncio.gather(*(loop(number) for number in range(max(concurrency, 1))))
+
+
+async def _posting_backlog_full() -> bool:
+    """Проверяет, переполнена ли очередь постинга (PIPELINE_MAX_POSTING_BACKLOG)"""
+    max_backlog = settings.telegram_bot.pipeline_max_posting_backlog
+    if max_backlog <= 0:
+        return False
+    backlog = await count_posting_backlog()
+    if backlog >= max_backlog:
+        logging.info(f"Очередь постинга переполнена ({backlog} >= {max_backlog}), AI этап ждет")
+        return True
+    return False
+
+
+async def _ai_stage_step() -> bool:
+    """Шаг AI этапа: обрабатывает порцию новых сообщений, если постинг справляется"""
+    async with ai_stage_slots:
+        if await _posting_backlog_full():
+            return False
+        return await _process_ai_messages() > 0
+
+
+async def _posting_stage_step(bot: Bot) -> bool:
+    """Шаг этапа постинга: рассылка по каналам и отправка ожидающих доставок"""
+    _refresh_routes_if_needed()
+    await fan_out_messages()
+    return await deliver_pending(bot) > 0
+
+
+async def _errors_stage_step() -> bool:
+    """Шаг этапа ошибок: повтор сообщений с ошибками, пометка окончательно проблемных и зависших в постинге"""
+    await process_error_messages()
+    await mark_permanently_failed_messages()
+    await finalize_stalled_messages()
+    return False
+
+
+async def count_posting_backlog() -> int:
+    """
+    Размер очереди постинга для ограничения AI этапа.
+    
+    Учитываются только открытые доставки в активные каналы и ожидающие
+    рассылки сообщения из привязанных к ним источников: сообщения без
+    маршрута постинг никогда не возьмет, и они не должны останавливать AI этап.
+    """
+    await status_buffer.flush()
+    targets_by_source = await source_routing.get_targets_by_source()
+    return await count_actionable_backlog(list(targets_by_source), list(source_routing.routes))
+
+
+def _refresh_routes_if_needed() -> None:
+    """
+    Сбрасывает таблицу маршрутов по событию обновления настроек постинга
+    или раз в 30 секунд (плановая проверка подхватывает каналы, впервые
+    сохраненные парсером).
+    """
     global last_targets_check
     
-    logging.info("Запуск run_periodic_tasks в posting_worker...")
-    while True:
-        await main_logic(bot_for_posting)
-        
-        # Проверяем, прошло ли 30 секунд с последней проверки целевых каналов
-        # или было вызвано событие обновления
-        current_time = datetime.now()
-        if posting_settings_update_event.is_set() or (current_time - last_targets_check).total_seconds() > 30:
-            if posting_settings_update_event.is_set():
-                logging.info("Получено событие обновления настроек целевых каналов.")
-                posting_settings_update_event.clear()
-            else:
-                logging.info("Плановая проверка обновлений в настройках целевых каналов...")
-                
-            last_targets_check = current_time
-            # Здесь нет необходимости в дополнительных действиях, 
-            # так как main_logic получает актуальные данные при каждом вызове
-        
-        logging.info("posting_worker: Следующий цикл через 10 секунд...")
-        try:
-            # Ждем событие обновления с таймаутом
-            await asyncio.wait_for(posting_settings_update_event.wait(), timeout=10)
-            logging.info("Получено событие обновления, начинаем новую итерацию")
-        except asyncio.TimeoutError:
-            # Тайм-аут истек, продолжаем штатно
-            pass
+    current_time = datetime.now()
+    if posting_settings_update_event.is_set() or (current_time - last_targets_check).total_seconds() > 30:
+        if posting_settings_update_event.is_set():
+            logging.info("Получено событие обновления настроек целевых каналов.")
+            posting_settings_update_event.clear()
+        else:
+            logging.info("Плановая проверка обновлений в настройках целевых каналов...")
+            
+        last_targets_check = current_time
+        source_routing.invalidate()
 
 
 # Вспомогательные функции
@@ -897,34 +1546,35 @@ async def _update_message_status(
             
     Действия:
     1. Создает словарь значений для обновления с новым статусом
-    2. Если передан processed_text, добавляет его в значения для обновления
-    3. Выполняет SQL-запрос на обновление через синхронную функцию
-    4. Коммитит изменения в БД
-    """
-    
-    def _update_sync():
-        with SessionLocal() as session:
-            update_values = {"status": status}
-            if processed_text is not None:
-                update_values["ai_processed_text"] = processed_text
-                
-            stmt = (
-                update(Messages)
-                .where(Messages.id == message_id)
-                .values(**update_values)
-            )
-            session.execute(stmt)
-            session.commit()
-            
-    await asyncio.to_thread(_update_sync)
+    2. Если передан processed_text, добавляет его и его content_hash в значения для обновления
+    3. Для всех статусов, кроме SENT_TO_AI, освобождает аренду сообщения
+    4. Ставит изменения в буфер status_buffer, который объединяет их с другими
+       изменениями этого сообщения и пишет в БД пачкой
+    """
+    
+    update_values = {"status": status}
+    if processed_text is not None:
+        update_values["ai_processed_text"] = processed_text
+        # Хеш считается один раз при сохранении текста AI; для текстов ошибок он не нужен
+        update_values["content_hash"] = (
+            generate_content_hash(processed_text) if status == NewsStatus.AI_PROCESSED else None
+        )
+    
+    # SENT_TO_AI - промежуточный статус, аренда сохраняется до ответа AI;
+    # любой другой статус возвращает сообщение в очередь следующего этапа
+    if status != NewsStatus.SENT_TO_AI:
+        update_values.update(lease_release_values())
+        
+    await status_buffer.set(message_id, **update_values)
 
 
-async def _process_ai_messages():
+async def _process_ai_messages() -> int:
     """
     Обрабатывает сообщения с помощью AI.
     
     Действия:
-    1. Получает до 2-х сообщений из БД, готовых к AI обработке
+    1. Получает до 2-х сообщений из БД (или до AI_BATCH_SIZE в пакетном режиме),
+       готовых к AI обработке; в пакетном режиме делегирует _process_ai_messages_batched()
     2. Для каждого сообщения:
        - Проверяет наличие текста
        - Если текст есть - обрабатывает через simplified_process_message()
@@ -932,23 +1582,34 @@ async def _process_ai_messages():
     3. Делает паузу 1 секунду между обработкой сообщений
     
     Returns:
-        None
+        int: Количество взятых в обработку сообщений
         
     Raises:
         Ошибки пробрасываются наверх для обработки в вызывающем коде
     """
     
-    messages = await get_messages_for_ai_processing(limit=2)
+    batch_size = settings.ai_service.batch_size
+    messages = await get_messages_for_ai_processing(limit=max(batch_size, 2))
     
     if not messages:
         logging.info("Нет новых сообщений для AI обработки в этом цикле.")
-        return
-        
+        return 0
+    
+    await _handle_ai_messages(messages)
+    return len(messages)
+
+
+async def _handle_ai_messages(messages: list[Messages]) -> None:
+    """Отправляет взятые в аренду сообщения в AI (пакетами или по одному)"""
     logging.info(f"Обработка AI для {len(messages)} сообщений.")
     
+    if settings.ai_service.batch_size > 1 and AI_SERVICE_URL:
+        await _process_ai_messages_batched(messages)
+        return
+    
     for msg in messages:
         if msg.text:
-            await simplified_process_message(msg.id, msg.text)
+            await simplified_process_message(msg.id, msg.text, has_photo=msg.photo_path is not None)
         else:
             logging.warning(f"Сообщение ID {msg.id} (для AI) имеет пустой текст. Пропуск.")
             await _update_message_status(
@@ -959,88 +1620,75 @@ async def _process_ai_messages():
         await asyncio.sleep(1)
 
 
-async def _process_posting_messages_multi_channel(bot: Bot, target_channels: list[dict], messages: list[Messages]):
+async def _ai_handoff_loop() -> None:
     """
-    Обрабатывает сообщения для постинга в несколько Telegram каналов.
+    AI этап для сообщений, переданных парсером через new_messages_queue.
     
-    Args:
-        bot (Bot): Экземпляр бота Telegram для отправки сообщений
-        target_channels (list[dict]): Список словарей с информацией о целевых каналах
-        messages (list[Messages]): Список сообщений для постинга
-        
     Действия:
-    1. Для каждого сообщения:
-       - Проверяет наличие обработанного AI текста
-       - Если текст есть - отправляет во все Telegram каналы из списка
-       - Обновляет статус сообщения в БД (POSTED или ERROR_POSTING)
-    2. Делает паузу 1 секунду между отправкой сообщений
+    1. Ждет ID новых сообщений и собирает их в пакет (до AI_BATCH_SIZE,
+       не дольше AI_HANDOFF_LINGER секунд)
+    2. Если очередь постинга переполнена, оставляет сообщения в NEW - их
+       подберет опрос БД, когда постинг догонит
+    3. Иначе берет эти сообщения в аренду, если их еще не забрал опрос БД
+       или другой воркер, и сразу отправляет в AI
+    
+    Порция из очереди занимает слот AI этапа (ai_stage_slots) наравне с
+    циклами опроса БД, поэтому AI обрабатывает не больше PIPELINE_AI_CONCURRENCY
+    порций одновременно.
+    """
+    batch_size = max(settings.ai_service.batch_size, 1)
+    while True:
+        message_ids = await new_messages_queue.get_batch(batch_size, settings.ai_service.handoff_linger)
+        try:
+            await _handle_handed_off_messages(message_ids)
+        except Exception as e:
+            # Сообщения остались в БД со статусом NEW - их подберет опрос БД AI этапа
+            logging.error(f"Ошибка AI обработки сообщений из очереди парсера {message_ids}: {e}", exc_info=True)
+
+
+async def _handle_handed_off_messages(message_ids: list[int]) -> int:
+    """
+    Обрабатывает пакет ID из очереди парсера.
     
     Returns:
-        None
+        int: Количество взятых в обработку сообщений (0, если очередь постинга переполнена)
     """
-    if not messages:
-        logging.info("Нет сообщений для постинга в мультиканальном режиме.")
-        return
-    
-    if not target_channels:
-        logging.info("Нет целевых каналов для постинга.")
-        return
-    
-    channels_str = ", ".join([f"{ch.get('target_title', 'Без названия')}({ch['target_chat_id']})" for ch in target_channels])
-    logging.info(f"Постинг {len(messages)} сообщений в каналы: {channels_str}")
+    async with ai_stage_slots:
+        if await _posting_backlog_full():
+            return 0
+        messages = await get_messages_for_ai_processing(limit=len(message_ids), message_ids=message_ids)
+        if messages:
+            await _handle_ai_messages(messages)
+        return len(messages)
+
+
+async def _process_ai_messages_batched(messages: list[Messages]) -> None:
+    """
+    Пакетный режим AI обработки (settings.ai_service.batch_size > 1).
     
+    Сообщения группируются по наличию изображения, так как флаг has_image
+    задается на весь запрос, и каждая группа уходит в AI одним запросом.
+    """
+    batches: dict[bool, list[Messages]] = {True: [], False: []}
     for msg in messages:
-        if not msg.ai_processed_text:
-            logging.warning(
-                f"Сообщение ID {msg.id} (для мультиканального постинга) не имеет "
-                "обработанного текста. Пропуск."
+        if not msg.text:
+            logging.warning(f"Сообщение ID {msg.id} (для AI) имеет пустой текст. Пропуск.")
+            await _update_message_status(
+                msg.id,
+                NewsStatus.ERROR_AI_PROCESSING,
+                "Сообщение имеет пустой текст (None)"
             )
             continue
-        
-        # Отправляем сообщение во все каналы из списка
-        overall_success = True  # Предполагаем успех для всех каналов
-        posting_results = []
-        
-        for channel in target_channels:
-            channel_id = channel["target_chat_id"]
-            channel_title = channel.get("target_title", "Без названия")
-            
-            success = await post_message_to_telegram(
-                bot,
-                channel_id,
-                msg.ai_processed_text,
-                msg.id
-            )
-            
-            posting_results.append({
-                "channel_id": channel_id,
-                "channel_title": channel_title,
-                "success": success
-            })
-            
-            if not success:
-                overall_success = False
-            
-            # Небольшая пауза между отправками в разные каналы
-            await asyncio.sleep(0.5)
-        
-        # Определяем итоговый статус сообщения
-        status = NewsStatus.POSTED if overall_success else NewsStatus.ERROR_POSTING
-        
-        # Формируем детальный отчет о постинге
-        result_details = ", ".join([
-            f"{r['channel_title']}({r['channel_id']}): {'OK' if r['success'] else 'ОШИБКА'}"
-            for r in posting_results
-        ])
-        
-        logging.info(f"ID {msg.id}: Результаты постинга: {result_details}")
-        
-        # Обновляем статус сообщения в БД
-        await _update_message_status(msg.id, status)
-        logging.info(f"ID {msg.id}: Финальный статус в БД: {status.value}")
-        
-        # Пауза перед обработкой следующего сообщения
-        await asyncio.sleep(1)
+        duplicate_of = find_near_duplicate_source(msg.id, msg.text)
+        if duplicate_of is not None:
+            await _skip_near_duplicate(msg.id, duplicate_of, "ai")
+            continue
+        has_photo = msg.photo_path is not None
+        batches[has_photo].append(msg)
+    
+    await asyncio.gather(
+        *(process_ai_batch(batch, has_image) for has_image, batch in batches.items() if batch)
+    )
 
 
 def create_bot():
@@ -1055,6 +1703,12 @@ def create_bot():
         raise ValueError("Token value getting error! token is None")
     
     bot_instance = Bot(token=token)
+    # Все отправки бота идут через общий лимитер и переживают retry_after
+    bot_instance.session.middleware(RateLimitMiddleware(
+        send_rate_limiter,
+        max_attempts=settings.telegram_bot.posting_retry_after_attempts
+    ))
+    bot_membership_cache.bind(bot_instance)
     logging.info(f"Создан бот для постинга (токен: ...{token[-4:]}).")
     
     return bot_instance
@@ -1088,35 +1742,6 @@ def close_bot_session():
     logging.info("Работа posting_worker.py завершена")
 
 
-async def _process_posting_messages(bot: Bot, channel_id: str):
-    """
-    Обрабатывает сообщения для постинга в Telegram канал (для обратной совместимости).
-    
-    Args:
-        bot (Bot): Экземпляр бота Telegram для отправки сообщений
-        channel_id (str): Идентификатор канала для отправки
-        
-    Действия:
-        Делегирует работу функции _process_posting_messages_multi_channel
-        для обеспечения обратной совместимости.
-    """
-    # Получаем сообщения специфично для этого канала
-    messages = await get_messages_ready_for_posting(limit=2, target_channel_id=channel_id)
-    
-    if not messages:
-        logging.info(f"Нет сообщений, готовых к постингу в канал {channel_id}, в этом цикле.")
-        return
-    
-    # Создаем список с одним каналом
-    single_channel = [{
-        "target_chat_id": channel_id,
-        "target_title": f"Канал {channel_id}"
-    }]
-    
-    # Делегируем работу мультиканальной функции
-    await _process_posting_messages_multi_channel(bot, single_channel, messages)
-
-
 def trigger_update():
     """
     Вызывает немедленное обновление списка целевых каналов для постинга.
@@ -1126,23 +1751,61 @@ def trigger_update():
     logging.info("Запущено обновление настроек постинга из posting_worker")
 
 
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """Аргументы запуска posting_worker.py как отдельного процесса"""
+    parser = argparse.ArgumentParser(description="Posting worker: AI обработка, постинг, повтор ошибок и очистка фото")
+    parser.add_argument(
+        "--stages",
+        default=",".join(PIPELINE_STAGES),
+        help=f"Этапы через запятую ({', '.join(PIPELINE_STAGES)}); по умолчанию все"
+    )
+    parser.add_argument("--once", action="store_true", help="Один проход всех этапов и выход")
+    args = parser.parse_args(argv)
+    
+    args.stages = tuple(stage.strip() for stage in args.stages.split(",") if stage.strip())
+    unknown = set(args.stages) - set(PIPELINE_STAGES)
+    if unknown or not args.stages:
+        parser.error(f"Неизвестные этапы: {', '.join(sorted(unknown)) or '(пусто)'}")
+    return args
+
+
+async def run_once(bot_for_posting: Bot | None):
+    """Один проход main_logic с закрытием ресурсов (для отладки и cron)"""
+    get_ai_http_client()
+    try:
+        await main_logic(bot_for_posting)
+    finally:
+        await status_buffer.stop()
+        await close_ai_http_client()
+        image_preprocessor.shutdown()
+
+
 if __name__ == "__main__":
     """
     Запускает основной скрипт posting_worker.py.
     
+    Примеры:
+        python -m telegram.bot.posting_worker                   # все этапы в одном процессе
+        python -m telegram.bot.posting_worker --stages ai       # только AI обработка
+        python -m telegram.bot.posting_worker --stages posting  # только постинг
+    
     Действия:
-    1. Создает экземпляр бота для постинга
-    2. Запускает периодические задачи
+    1. Создает экземпляр бота для постинга (если он нужен выбранным этапам)
+    2. Запускает выбранные этапы
     3. Логирует завершение работы
     """
-    logging.info("Запуск posting_worker.py как отдельного скрипта...")
+    args = parse_args()
+    logging.info(f"Запуск posting_worker.py как отдельного скрипта (этапы: {', '.join(args.stages)})...")
     
-    bot_instance = create_bot()
+    bot_instance = create_bot() if args.once or "posting" in args.stages else None
 
     loop = asyncio.get_event_loop()
     
     try:
-        loop.run_until_complete(run_periodic_tasks(bot_instance))
+        if args.once:
+            loop.run_until_complete(run_once(bot_instance))
+        else:
+            loop.run_until_complete(run_periodic_tasks(bot_instance, args.stages))
     except KeyboardInterrupt:
         logging.info("Программа прервана пользователем.")
     except Exception as e:
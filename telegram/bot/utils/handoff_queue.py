@@ -0,0 +1,76 @@
+import asyncio
+import logging
+
+from config import settings
+
+
+class MessageHandoffQueue:
+    """
+    Очередь ID новых сообщений от парсера к AI этапу posting worker'а (в одном процессе).
+
+    Парсер кладет ID сразу после сохранения сообщения, AI этап забирает их без
+    ожидания очередного цикла опроса. Очередь - только подсказка: сообщение
+    уже лежит в БД со статусом NEW, поэтому переполнение, падение процесса или
+    запуск парсера отдельно от воркера ничего не теряют - такие сообщения
+    подберет обычный опрос БД AI этапа.
+
+    Args:
+        maxsize (int): Размер очереди; 0 - очередь выключена
+    """
+    def __init__(self, maxsize: int = 1000):
+        self.enabled = maxsize > 0
+        self.maxsize = maxsize
+        self._queue: asyncio.Queue[int] | None = None
+        self.stats = {"pushed": 0, "dropped": 0, "consumed": 0}
+
+    @property
+    def queue(self) -> asyncio.Queue[int]:
+        # Создается при первом обращении, уже внутри работающего event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        return self._queue
+
+    def push(self, message_id: int) -> None:
+        """Передает ID нового сообщения AI этапу, не блокируя парсер"""
+        if not self.enabled:
+            return
+        try:
+            self.queue.put_nowait(message_id)
+            self.stats["pushed"] += 1
+        except asyncio.QueueFull:
+            # Сообщение обработает опрос БД
+            self.stats["dropped"] += 1
+            logging.warning(f"Очередь передачи в AI заполнена, сообщение ID {message_id} подождет опроса БД")
+
+    async def get_batch(self, max_items: int, linger: float) -> list[int]:
+        """
+        Ждет первый ID и добирает следующие, пришедшие в течение linger секунд.
+
+        Args:
+            max_items (int): Максимальный размер пакета
+            linger (float): Сколько ждать следующих ID после первого (секунды)
+
+        Returns:
+            list[int]: ID сообщений в порядке поступления
+        """
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + linger
+        while len(batch) < max_items:
+            timeout = deadline - asyncio.get_running_loop().time()
+            try:
+                if timeout <= 0:
+                    batch.append(self.queue.get_nowait())
+                else:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+        self.stats["consumed"] += len(batch)
+        return batch
+
+    def snapshot(self) -> dict:
+        """Возвращает счетчики очереди для мониторинга"""
+        return {**self.stats, "pending": self._queue.qsize() if self._queue else 0, "enabled": self.enabled}
+
+
+# Общая очередь процесса: парсер -> AI этап
+new_messages_queue = MessageHandoffQueue(maxsize=settings.ai_service.handoff_queue_size)
@@ -0,0 +1,158 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from config import settings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow есть в requirements.txt; без него фото загружаются как есть
+    Image = ImageOps = None
+
+
+def variant_path(photo_path: str, max_side: int, quality: int) -> str:
+    """Путь подготовленной копии фото: рядом с оригиналом, с параметрами в имени"""
+    root, _ = os.path.splitext(photo_path)
+    return f"{root}.{max_side}q{quality}.jpg"
+
+
+def _downscale(photo_path: str, target_path: str, max_side: int, quality: int) -> tuple[int, int]:
+    """
+    Уменьшает и пережимает фото (выполняется в отдельном процессе).
+
+    Returns:
+        tuple[int, int]: Размер оригинала и копии в байтах; копия не
+            сохраняется (размер 0), если она не меньше оригинала
+    """
+    original_size = os.path.getsize(photo_path)
+    with Image.open(photo_path) as original:
+        # Поворот из EXIF применяется к пикселям: при пережатии EXIF теряется,
+        # и снятое "боком" фото с телефона иначе загрузится повернутым
+        image = ImageOps.exif_transpose(original)
+        image.thumbnail((max_side, max_side))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        temp_path = f"{target_path}.{os.getpid()}.part"
+        image.save(temp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+
+    new_size = os.path.getsize(temp_path)
+    if new_size >= original_size:
+        os.remove(temp_path)
+        return original_size, 0
+    os.replace(temp_path, target_path)
+    return original_size, new_size
+
+
+class ImagePreprocessor:
+    """
+    Подготовка фото к загрузке в Telegram: уменьшение до max_side и пережатие в JPEG.
+
+    Обработка идет в пуле процессов, не занимая event loop. Результат
+    сохраняется рядом с оригиналом (variant_path) и используется всеми
+    следующими загрузками этого фото - в том числе другими сообщениями с тем
+    же файлом в хранилище по хешу и другими процессами. Если копия не
+    получилась меньше оригинала или обработка упала, загружается оригинал.
+
+    Args:
+        enabled (bool): Включена ли обработка
+        max_side (int): Максимальная сторона фото (пиксели)
+        quality (int): Качество JPEG
+        workers (int): Процессов в пуле
+    """
+    # Сколько решений "какой файл загружать" помнить в памяти
+    CACHE_SIZE = 2000
+
+    def __init__(self, enabled: bool = False, max_side: int = 1280, quality: int = 85, workers: int = 2):
+        if enabled and Image is None:
+            logging.warning("POSTING_IMAGE_PREPROCESS включен, но Pillow не установлен (pip install Pillow). Фото загружаются без обработки")
+            enabled = False
+        self.enabled = enabled
+        self.max_side = max_side
+        self.quality = quality
+        self.workers = max(1, workers)
+        self._executor: ProcessPoolExecutor | None = None
+        self._upload_paths: dict[str, str] = {}  # Оригинал -> файл для загрузки
+        self._locks: dict[str, asyncio.Lock] = {}
+        self.stats = {"processed": 0, "cached": 0, "not_smaller": 0, "errors": 0, "bytes_before": 0, "bytes_after": 0}
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # Процессы создаются при первой обработке
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def prepare(self, photo_path: str) -> str:
+        """
+        Возвращает путь файла, который нужно загрузить вместо photo_path.
+
+        Args:
+            photo_path (str): Путь к оригиналу фото (Messages.photo_path / MessageMedia.photo_path)
+
+        Returns:
+            str: Путь подготовленной копии или оригинала
+        """
+        if not self.enabled:
+            return photo_path
+        upload_path = self._upload_paths.get(photo_path)
+        if upload_path is not None:
+            self.stats["cached"] += 1
+            return upload_path
+
+        lock = self._locks.setdefault(photo_path, asyncio.Lock())
+        async with lock:
+            # Пока ждали, фото могла подготовить параллельная полоса
+            upload_path = self._upload_paths.get(photo_path)
+            if upload_path is None:
+                upload_path = await self._process(photo_path)
+                self._upload_paths[photo_path] = upload_path
+                while len(self._upload_paths) > self.CACHE_SIZE:
+                    self._upload_paths.pop(next(iter(self._upload_paths)))
+            else:
+                self.stats["cached"] += 1
+        self._locks.pop(photo_path, None)
+        return upload_path
+
+    async def _process(self, photo_path: str) -> str:
+        target_path = variant_path(photo_path, self.max_side, self.quality)
+        if await asyncio.to_thread(os.path.exists, target_path):
+            # Копию уже сделал этот или другой процесс
+            self.stats["cached"] += 1
+            return target_path
+        try:
+            original_size, new_size = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _downscale, photo_path, target_path, self.max_side, self.quality
+            )
+        except Exception as e:
+            self.stats["errors"] += 1
+            logging.error(f"Ошибка подготовки фото {photo_path}: {e}")
+            return photo_path
+
+        if not new_size:
+            self.stats["not_smaller"] += 1
+            return photo_path
+        self.stats["processed"] += 1
+        self.stats["bytes_before"] += original_size
+        self.stats["bytes_after"] += new_size
+        logging.info(f"Фото {photo_path} подготовлено: {original_size // 1024} КБ -> {new_size // 1024} КБ")
+        return target_path
+
+    def shutdown(self) -> None:
+        """Останавливает пул процессов"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def snapshot(self) -> dict:
+        """Возвращает счетчики обработки для мониторинга"""
+        return {**self.stats, "enabled": self.enabled}
+
+
+# Общий обработчик фото процесса постинга
+image_preprocessor = ImagePreprocessor(
+    enabled=settings.telegram_bot.posting_image_preprocess,
+    max_side=settings.telegram_bot.posting_image_max_side,
+    quality=settings.telegram_bot.posting_image_quality,
+    workers=settings.telegram_bot.posting_image_workers
+)
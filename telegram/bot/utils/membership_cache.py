@@ -0,0 +1,113 @@
+import time
+import logging
+
+from aiogram import Bot
+from aiogram.types import User
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from config import settings
+
+
+class BotMembershipCache:
+    """
+    Кеш проверок "бот состоит в целевом канале" с TTL.
+
+    Проверка стоит одного вызова get_chat_member (данные бота из get_me
+    запрашиваются один раз за время жизни процесса), а ее результат живет
+    ttl_seconds. В установившемся режиме постинг делает ровно один вызов
+    API на сообщение - саму отправку. Отрицательный результат живет
+    недолго (negative_ttl_seconds), чтобы добавленный в канал бот начал
+    постить без перезапуска. Запись сбрасывается через invalidate(), когда
+    отправка в канал вернула TelegramForbiddenError / TelegramBadRequest.
+
+    Args:
+        ttl_seconds (float): Время жизни положительного результата
+        negative_ttl_seconds (float): Время жизни отрицательного результата
+    """
+    # Статусы участника, при которых бот не может публиковать в канале
+    NOT_MEMBER_STATUSES = ("left", "kicked")
+
+    def __init__(self, ttl_seconds: float = 3600, negative_ttl_seconds: float = 60):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = min(negative_ttl_seconds, ttl_seconds)
+        self.bot: Bot | None = None
+        self.entries: dict[str, tuple[bool, float]] = {}  # ID канала -> (бот в канале, истекает в monotonic)
+        self._me: User | None = None
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "get_me_calls": 0}
+
+    def bind(self, bot: Bot) -> None:
+        """Привязывает бота постинга (для прогрева из обработчиков админ-бота)"""
+        if self.bot is not bot:
+            self._me = None
+        self.bot = bot
+
+    async def get_me(self, bot: Bot) -> User:
+        """Возвращает данные бота; запрос к API выполняется один раз"""
+        if self._me is None:
+            self._me = await bot.get_me()
+            self.stats["get_me_calls"] += 1
+        return self._me
+
+    async def is_member(self, bot: Bot, chat_id: str | int) -> bool:
+        """
+        Проверяет, является ли бот участником канала (с кешированием).
+
+        Args:
+            bot (Bot): Бот постинга
+            chat_id (str | int): ID канала или @username
+
+        Returns:
+            bool: True, если бот в канале
+
+        Raises:
+            TelegramRetryAfter: Лимит Telegram - результат неизвестен и не кешируется
+        """
+        key = str(chat_id)
+        entry = self.entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self.stats["hits"] += 1
+            return entry[0]
+
+        self.stats["misses"] += 1
+        try:
+            me = await self.get_me(bot)
+            chat_member = await bot.get_chat_member(chat_id, me.id)
+            is_member = chat_member.status not in self.NOT_MEMBER_STATUSES
+        except TelegramRetryAfter:
+            raise
+        except (TelegramBadRequest, TelegramForbiddenError):
+            is_member = False  # Ошибка запроса - скорее всего бота нет в канале
+        except Exception as e:
+            # Сетевая ошибка и т.п.: не кешируем, отправка покажет реальное состояние
+            logging.error(f"Ошибка при проверке бота в канале {chat_id}: {e}")
+            return False
+
+        ttl = self.ttl_seconds if is_member else self.negative_ttl_seconds
+        self.entries[key] = (is_member, time.monotonic() + ttl)
+        return is_member
+
+    async def warm(self, chat_id: str | int) -> bool | None:
+        """
+        Проверяет канал заранее (например, при добавлении целевого канала).
+
+        Returns:
+            bool | None: Результат проверки или None, если бот постинга
+                не запущен в этом процессе
+        """
+        if self.bot is None:
+            return None
+        self.invalidate(chat_id)
+        return await self.is_member(self.bot, chat_id)
+
+    def invalidate(self, chat_id: str | int) -> None:
+        """Сбрасывает кешированный результат для канала"""
+        if self.entries.pop(str(chat_id), None) is not None:
+            self.stats["invalidations"] += 1
+
+    def snapshot(self) -> dict:
+        """Возвращает счетчики кеша для мониторинга"""
+        return {**self.stats, "size": len(self.entries)}
+
+
+# Общий кеш процесса: постинг и прогрев при добавлении целевых каналов
+bot_membership_cache = BotMembershipCache(ttl_seconds=settings.telegram_bot.posting_membership_ttl)
@@ -0,0 +1,54 @@
+import time
+from collections import deque
+
+
+class LatencyStats:
+    """
+    Накопитель метрик задержки для однотипных операций (например, запросов к AI).
+
+    Хранит общие счетчики и окно последних замеров, по которому считаются
+    перцентили. Окно ограничено, поэтому память не растет со временем.
+
+    Args:
+        window (int): Сколько последних замеров учитывать в перцентилях
+    """
+    def __init__(self, window: int = 500):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.started_at = time.time()
+
+    def record(self, seconds: float, ok: bool = True) -> None:
+        """Добавляет замер длительности операции"""
+        self.samples.append(seconds)
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if not ok:
+            self.errors += 1
+
+    def _percentile(self, sorted_samples: list[float], percent: float) -> float:
+        """Возвращает перцентиль по отсортированному окну замеров"""
+        if not sorted_samples:
+            return 0.0
+        position = min(len(sorted_samples) - 1, int(round(percent / 100 * (len(sorted_samples) - 1))))
+        return sorted_samples[position]
+
+    def snapshot(self) -> dict:
+        """
+        Возвращает текущие метрики в виде словаря.
+
+        Returns:
+            dict: count, errors, avg_ms, p50_ms, p95_ms, max_ms
+        """
+        sorted_samples = sorted(self.samples)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total_seconds / self.count * 1000, 1) if self.count else 0.0,
+            "p50_ms": round(self._percentile(sorted_samples, 50) * 1000, 1),
+            "p95_ms": round(self._percentile(sorted_samples, 95) * 1000, 1),
+            "max_ms": round(self.max_seconds * 1000, 1),
+        }
@@ -0,0 +1,165 @@
+import re
+import time
+import hashlib
+import logging
+from collections import deque
+
+
+SIMHASH_BITS = 64
+
+
+def _tokenize(text: str) -> list[str]:
+    """Нормализует текст так же, как generate_content_hash, и разбивает на слова"""
+    normalized = re.sub(r'[^\w\s]', '', text.lower())
+    return normalized.split()
+
+
+def _shingles(tokens: list[str], size: int = 1) -> list[str]:
+    """Возвращает шинглы - последовательности из size слов"""
+    if len(tokens) <= size:
+        return [' '.join(tokens)]
+    return [' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+
+
+def simhash(text: str, shingle_size: int = 1) -> int:
+    """
+    Считает 64-битный SimHash текста по словесным шинглам.
+
+    Похожие тексты (перефразированные, с другой пунктуацией или парой
+    замененных слов) дают отпечатки, отличающиеся в небольшом числе бит.
+    Для коротких новостных постов лучше всего работают одиночные слова:
+    у перефразов расстояние обычно 5-8 бит, у разных новостей - около 30.
+    """
+    weights = [0] * SIMHASH_BITS
+    for shingle in _shingles(_tokenize(text), shingle_size):
+        value = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class SimHashIndex:
+    """
+    Индекс почти-дубликатов на SimHash с LSH-корзинами.
+
+    Отпечаток делится на max_distance + 1 полос; по принципу Дирихле два
+    отпечатка с расстоянием Хэмминга не больше max_distance совпадают хотя бы
+    в одной полосе. Поэтому поиск проверяет только кандидатов из корзин своих
+    полос, а не всю историю. Записи старше retention_hours вытесняются.
+
+    Args:
+        max_distance (int): Максимальное расстояние Хэмминга для почти-дубликата
+        retention_hours (float): Сколько часов хранить записи
+        min_tokens (int): Минимальное число слов; более короткие тексты не индексируются,
+            так как SimHash на них ненадежен
+    """
+    def __init__(self, max_distance: int = 8, retention_hours: float = 72, min_tokens: int = 8):
+        self.max_distance = max_distance
+        self.retention_seconds = retention_hours * 3600
+        self.min_tokens = min_tokens
+        self.bands = max_distance + 1
+        self.band_width = SIMHASH_BITS // self.bands
+        self.band_mask = (1 << self.band_width) - 1
+
+        self.fingerprints: dict[int, tuple[int, float]] = {}  # key -> (отпечаток, время добавления)
+        self.buckets: dict[tuple[int, int], set[int]] = {}  # (номер полосы, значение) -> ключи
+        self.order: deque[tuple[int, float]] = deque()  # очередь для вытеснения по времени
+
+    def _band_keys(self, fingerprint: int) -> list[tuple[int, int]]:
+        """Возвращает ключи корзин для всех полос отпечатка"""
+        return [
+            (band, fingerprint >> (band * self.band_width) & self.band_mask)
+            for band in range(self.bands)
+        ]
+
+    def _fingerprint(self, text: str | None) -> int | None:
+        """Считает отпечаток или возвращает None для слишком коротких текстов"""
+        if not text or len(_tokenize(text)) < self.min_tokens:
+            return None
+        return simhash(text)
+
+    def _remove(self, key: int) -> None:
+        """Удаляет запись из индекса"""
+        entry = self.fingerprints.pop(key, None)
+        if entry is None:
+            return
+        for band_key in self._band_keys(entry[0]):
+            bucket = self.buckets.get(band_key)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def evict_expired(self, now: float | None = None) -> int:
+        """
+        Вытесняет записи старше retention_hours.
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        cutoff = (now or time.time()) - self.retention_seconds
+        evicted = 0
+        while self.order and self.order[0][1] < cutoff:
+            key, added_at = self.order.popleft()
+            # Ключ мог быть добавлен повторно позже - удаляем только актуальную запись
+            entry = self.fingerprints.get(key)
+            if entry and entry[1] == added_at:
+                self._remove(key)
+                evicted += 1
+        return evicted
+
+    def add(self, key: int, text: str | None, added_at: float | None = None) -> None:
+        """
+        Добавляет текст в индекс.
+
+        Args:
+            key (int): Идентификатор записи (ID сообщения)
+            text (str | None): Текст
+            added_at (float | None): Время добавления (timestamp), по умолчанию - текущее
+        """
+        fingerprint = self._fingerprint(text)
+        if fingerprint is None:
+            return
+
+        added_at = added_at or time.time()
+        self._remove(key)
+        self.fingerprints[key] = (fingerprint, added_at)
+        self.order.append((key, added_at))
+        for band_key in self._band_keys(fingerprint):
+            self.buckets.setdefault(band_key, set()).add(key)
+
+    def find(self, text: str | None, exclude_key: int | None = None) -> int | None:
+        """
+        Ищет почти-дубликат текста в индексе.
+
+        Args:
+            text (str | None): Текст для проверки
+            exclude_key (int | None): Ключ, который не считается дубликатом (сама запись)
+
+        Returns:
+            int | None: Ключ найденного почти-дубликата или None
+        """
+        self.evict_expired()
+        fingerprint = self._fingerprint(text)
+        if fingerprint is None:
+            return None
+
+        checked = set()
+        for band_key in self._band_keys(fingerprint):
+            for key in self.buckets.get(band_key, ()):
+                if key == exclude_key or key in checked:
+                    continue
+                checked.add(key)
+                distance = bin(fingerprint ^ self.fingerprints[key][0]).count('1')
+                if distance <= self.max_distance:
+                    logging.debug(f"Почти-дубликат: ключ {key}, расстояние {distance}")
+                    return key
+        return None
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
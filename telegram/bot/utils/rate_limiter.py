@@ -0,0 +1,216 @@
+import time
+import asyncio
+import logging
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket для ограничения частоты операций.
+
+    Ведро пополняется со скоростью rate токенов в секунду и вмещает не более
+    capacity токенов. Каждая операция забирает один токен; если токенов нет,
+    вызывающая корутина ждет ровно столько, сколько нужно для пополнения.
+
+    Args:
+        rate (float): Скорость пополнения (токенов в секунду)
+        capacity (float): Максимальное количество токенов (допустимый всплеск)
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0  # До какого момента (monotonic) операции запрещены (retry_after)
+        self._lock = asyncio.Lock()
+
+    def block(self, seconds: float) -> None:
+        """Запрещает операции на seconds секунд (не сокращая уже действующий запрет)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def blocked_for(self) -> float:
+        """Сколько секунд еще действует запрет"""
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    def _refill(self) -> None:
+        """Начисляет токены за время, прошедшее с последнего обращения"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def time_until_available(self, tokens: float = 1.0) -> float:
+        """Возвращает время (в секундах) до появления нужного количества токенов"""
+        self._refill()
+        blocked = self.blocked_for()
+        if self.tokens >= tokens:
+            return blocked
+        return max(blocked, (tokens - self.tokens) / self.rate)
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Забирает токены, дожидаясь их пополнения при необходимости.
+
+        Returns:
+            float: Сколько секунд пришлось ждать
+        """
+        waited = 0.0
+        # Блокировка сохраняет порядок очереди: кто раньше пришел, тот раньше отправит
+        async with self._lock:
+            while True:
+                delay = self.time_until_available(tokens)
+                if delay <= 0:
+                    self.tokens -= tokens
+                    return waited
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+class SendRateLimiter:
+    """
+    Ограничитель частоты отправок бота с глобальным и поканальным бюджетом.
+
+    Telegram ограничивает бота примерно 30 сообщениями в секунду суммарно
+    и примерно 20 сообщениями в минуту в одну группу/канал. Каждый канал
+    получает свое ведро, поэтому медленный канал не тормозит остальные,
+    а общее ведро не дает превысить глобальный лимит.
+
+    Лимитер адаптивный: на ответ 429 (retry_after) ведро канала блокируется
+    на указанное время, а его скорость снижается вдвое; каждая успешная
+    отправка понемногу возвращает скорость к настроенной.
+
+    Args:
+        global_rate (float): Глобальный лимит (сообщений в секунду)
+        chat_rate_per_minute (float): Лимит на один канал (сообщений в минуту)
+        chat_burst (int): Допустимый всплеск отправок в один канал
+    """
+    # Во сколько раз снижается скорость канала после retry_after и насколько растет после успеха
+    SLOWDOWN_FACTOR = 0.5
+    RECOVERY_FACTOR = 1.05
+    MIN_RATE_FRACTION = 0.1  # Скорость не опускается ниже этой доли от настроенной
+
+    def __init__(self, global_rate: float, chat_rate_per_minute: float, chat_burst: int):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate_per_minute / 60.0
+        self.chat_burst = chat_burst
+        self.global_bucket = TokenBucket(rate=global_rate, capacity=global_rate)
+        self.chat_buckets: dict[str, TokenBucket] = {}
+        self.stats = {"sends": 0, "retry_after": 0, "global_retry_after": 0, "waited_seconds": 0.0}
+
+    def _get_chat_bucket(self, chat_id: str | int) -> TokenBucket:
+        """Возвращает ведро канала, создавая его при первом обращении"""
+        key = str(chat_id)
+        bucket = self.chat_buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate=self.chat_rate, capacity=self.chat_burst)
+            self.chat_buckets[key] = bucket
+        return bucket
+
+    async def acquire(self, chat_id: str | int) -> None:
+        """
+        Дожидается разрешения на отправку одного сообщения в канал.
+
+        Сначала ждем поканальный бюджет, затем глобальный - так канал,
+        упершийся в свой лимит, не удерживает глобальные токены.
+        """
+        chat_wait = await self._get_chat_bucket(chat_id).acquire()
+        global_wait = await self.global_bucket.acquire()
+
+        total_wait = chat_wait + global_wait
+        self.stats["sends"] += 1
+        self.stats["waited_seconds"] += total_wait
+        if total_wait > 0:
+            logging.debug(f"Rate limiter: ожидание {total_wait:.2f}с перед отправкой в {chat_id}")
+
+    def record_retry_after(self, chat_id: str | int | None, retry_after: float) -> None:
+        """
+        Учитывает ответ 429: останавливает полосу канала на retry_after секунд
+        и снижает ее скорость. Без chat_id (метод не привязан к чату)
+        останавливается глобальный бюджет.
+        """
+        if chat_id is None:
+            self.stats["global_retry_after"] += 1
+            self.global_bucket.block(retry_after)
+            logging.warning(f"Rate limiter: глобальный retry_after {retry_after}с")
+            return
+
+        self.stats["retry_after"] += 1
+        bucket = self._get_chat_bucket(chat_id)
+        bucket.block(retry_after)
+        bucket.rate = max(bucket.rate * self.SLOWDOWN_FACTOR, self.chat_rate * self.MIN_RATE_FRACTION)
+        logging.warning(
+            f"Rate limiter: retry_after {retry_after}с для {chat_id}, "
+            f"скорость снижена до {bucket.rate * 60:.1f} сообщений/мин"
+        )
+
+    def record_success(self, chat_id: str | int) -> None:
+        """Постепенно возвращает скорость канала к настроенной после успешной отправки"""
+        bucket = self.chat_buckets.get(str(chat_id))
+        if bucket is not None and bucket.rate < self.chat_rate:
+            bucket.rate = min(self.chat_rate, bucket.rate * self.RECOVERY_FACTOR)
+
+    def snapshot(self) -> dict:
+        """Возвращает текущие бюджеты и счетчики для мониторинга"""
+        self.global_bucket._refill()
+        chats = {}
+        for chat_id, bucket in self.chat_buckets.items():
+            bucket._refill()
+            chats[chat_id] = {
+                "tokens": round(bucket.tokens, 2),
+                "rate_per_minute": round(bucket.rate * 60, 1),
+                "blocked_for": round(bucket.blocked_for(), 1),
+            }
+        return {
+            **self.stats,
+            "waited_seconds": round(self.stats["waited_seconds"], 1),
+            "global_tokens": round(self.global_bucket.tokens, 2),
+            "global_rate": self.global_rate,
+            "global_blocked_for": round(self.global_bucket.blocked_for(), 1),
+            "chats": chats,
+        }
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии aiogram: все отправки бота проходят через SendRateLimiter.
+
+    Методы отправки ждут бюджет канала и глобальный бюджет. На TelegramRetryAfter
+    полоса этого канала паркуется на retry_after секунд и запрос повторяется;
+    остальные каналы продолжают работу. Если повторы исчерпаны, исключение
+    пробрасывается вызывающему коду.
+
+    Args:
+        limiter (SendRateLimiter): Общий лимитер отправок
+        max_attempts (int): Сколько раз выполнять запрос при повторяющихся retry_after
+    """
+    # Методы Bot API, которые расходуют лимит отправок
+    SEND_METHODS = frozenset({
+        "sendMessage", "sendPhoto", "sendMediaGroup", "sendVideo", "sendDocument",
+        "sendAnimation", "copyMessage", "forwardMessage",
+    })
+
+    def __init__(self, limiter: SendRateLimiter, max_attempts: int = 3):
+        self.limiter = limiter
+        self.max_attempts = max(1, max_attempts)
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        is_send = method.__api_method__ in self.SEND_METHODS and chat_id is not None
+
+        for attempt in range(1, self.max_attempts + 1):
+            if is_send:
+                await self.limiter.acquire(chat_id)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.limiter.record_retry_after(chat_id, e.retry_after)
+                if attempt >= self.max_attempts:
+                    raise
+                if not is_send:
+                    # Для остальных методов ведро не ждем - ждем сами
+                    await asyncio.sleep(e.retry_after)
+                continue
+            if is_send:
+                self.limiter.record_success(chat_id)
+            return response
@@ -0,0 +1,188 @@
+import os
+import asyncio
+import hashlib
+import logging
+import secrets
+
+from telethon.tl.types import Message
+
+from config import settings
+from database.messages import save_message_photos_async, extend_photo_lease_async
+from telegram.bot.utils.handoff_queue import new_messages_queue
+
+
+logger = logging.getLogger(__name__)
+
+
+def photo_storage_path(storage_dir: str, sha256: str) -> str:
+    """Путь фото в хранилище по хешу содержимого: <storage>/ab/cd/<sha256>.jpg"""
+    return os.path.join(storage_dir, sha256[:2], sha256[2:4], f"{sha256}.jpg")
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 файла, читается блоками (выполняется в потоке)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def move_into_storage(temp_path: str, final_path: str) -> bool:
+    """
+    Переносит скачанный файл в хранилище (выполняется в потоке).
+
+    Returns:
+        bool: False, если такой файл уже был (временный файл удаляется)
+    """
+    if os.path.exists(final_path):
+        os.remove(temp_path)
+        # Свежее время изменения защищает файл от удаления очисткой хранилища,
+        # пока новое сообщение еще не записало ссылку на него в БД
+        os.utime(final_path)
+        return False
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(temp_path, final_path)  # Атомарно: читатели не увидят недописанный файл
+    return True
+
+
+class MediaDownloadQueue:
+    """
+    Фоновая загрузка фото новых сообщений парсера.
+
+    Обработчик сообщения сохраняет его в БД под арендой загрузчика
+    (add_message_async(photo_lease_seconds=...)) и ставит загрузку в очередь,
+    не дожидаясь скачивания. Загрузчики скачивают фото во временный файл,
+    считают SHA-256 и переносят файл в хранилище по хешу - одинаковые фото
+    (репосты одной картинки в разные каналы) хранятся одним файлом. Путь и хеш
+    записываются в БД вместе со снятием аренды, после чего сообщение
+    передается AI этапу. Posting worker узнает о фото только из БД.
+
+    Очередь ограничена: при заполнении обработчик ждет свободного места, так
+    что отставание загрузок притормаживает парсер, а не растит память. Если
+    загрузка не уложилась в аренду, AI этап возьмет сообщение без фото;
+    аренда продлевается, когда загрузчик берет сообщение из очереди.
+
+    Args:
+        storage_dir (str): Корень хранилища фото (PHOTO_STORAGE)
+        workers (int): Количество загрузчиков
+        maxsize (int): Размер очереди загрузок
+        timeout (float): Таймаут загрузки всех фото одного сообщения (секунды)
+    """
+    def __init__(self, storage_dir: str, workers: int = 3, maxsize: int = 200, timeout: float = 60.0):
+        self.storage_dir = storage_dir
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._queue: asyncio.Queue[tuple[int, list[Message]]] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self.stats = {"queued": 0, "downloaded": 0, "deduplicated": 0, "failed": 0, "bytes": 0}
+
+    @property
+    def queue(self) -> asyncio.Queue[tuple[int, list[Message]]]:
+        # Создается при первом обращении, уже внутри работающего event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        return self._queue
+
+    def start(self) -> None:
+        """Запускает загрузчики (повторный вызов ничего не делает)"""
+        self._tasks = [task for task in self._tasks if not task.done()]
+        for index in range(len(self._tasks), self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"photo-download-{index}"))
+
+    async def stop(self) -> None:
+        """Останавливает загрузчики; недокачанные сообщения AI возьмет после истечения аренды"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def put(self, message_id: int, parts: list[Message]) -> None:
+        """
+        Ставит загрузку фото сообщения в очередь.
+
+        Args:
+            message_id (int): ID сообщения в БД
+            parts (list[Message]): Сообщения Telegram с фото (для альбома - все части по порядку)
+        """
+        self.start()
+        await self.queue.put((message_id, parts))
+        self.stats["queued"] += 1
+
+    async def _worker(self) -> None:
+        while True:
+            message_id, parts = await self.queue.get()
+            try:
+                # Таймаут аренды отсчитывается от начала скачивания, а не от постановки в очередь
+                if not await extend_photo_lease_async(message_id, self.timeout):
+                    logger.warning(f"ID {message_id}: аренда загрузчика истекла в очереди, сообщение могло уйти в AI без фото")
+                photos = await self.download_message(message_id, parts)
+                await save_message_photos_async(message_id, photos)
+                # Фото уже в БД: AI этап может забрать сообщение сразу
+                new_messages_queue.push(message_id)
+            except Exception as e:
+                logger.error(f"Ошибка фоновой загрузки фото сообщения ID {message_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def download_message(self, message_id: int, parts: list[Message]) -> list[tuple[str, str]]:
+        """
+        Скачивает фото сообщения по порядку в пределах общего таймаута.
+
+        Returns:
+            list[tuple[str, str]]: (путь, sha256) успешно скачанных фото
+        """
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        photos = []
+        for part in parts:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                logger.warning(f"ID {message_id}: таймаут загрузки, сохранено {len(photos)} из {len(parts)} фото")
+                break
+            try:
+                photos.append(await asyncio.wait_for(self.store_photo(part), remaining))
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"ID {message_id}: ошибка при скачивании фото: {e}")
+        return photos
+
+    async def store_photo(self, part: Message) -> tuple[str, str]:
+        """
+        Скачивает фото во временный файл и переносит его в хранилище по хешу.
+
+        Returns:
+            tuple[str, str]: Путь фото в хранилище и его SHA-256
+        """
+        temp_dir = os.path.join(self.storage_dir, "tmp")
+        os.makedirs(temp_dir, exist_ok=True)
+        temp_path = os.path.join(temp_dir, f"{secrets.token_hex(8)}.part")
+        try:
+            # Telethon пишет файл на диск частями, фото не собирается в памяти целиком
+            await part.download_media(file=temp_path)
+            size = os.path.getsize(temp_path)
+            sha256 = await asyncio.to_thread(file_sha256, temp_path)
+            final_path = photo_storage_path(self.storage_dir, sha256)
+            is_new = await asyncio.to_thread(move_into_storage, temp_path, final_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self.stats["downloaded" if is_new else "deduplicated"] += 1
+        self.stats["bytes"] += size if is_new else 0
+        logger.info(f"Фото сохранено в {final_path}{'' if is_new else ' (уже было в хранилище)'}")
+        return final_path, sha256
+
+    def snapshot(self) -> dict:
+        """Возвращает счетчики загрузок для мониторинга"""
+        return {**self.stats, "pending": self._queue.qsize() if self._queue else 0, "workers": len(self._tasks)}
+
+
+# Общая очередь загрузок процесса парсера
+media_downloads = MediaDownloadQueue(
+    settings.telegram_parser.photo_storage,
+    workers=settings.telegram_parser.download_workers,
+    maxsize=settings.telegram_parser.download_queue_size,
+    timeout=settings.telegram_parser.download_timeout
+)
@@ -25,19 +25,28 @@ from config import settings
 
 # Импорт DB-функций
 from database.repositories import parsing_telegram_acc_repository, parsing_source_repository
-from database.channels import add_channel, get_channel_by_peer_id
-from database.messages import add_message, update_message_photo_path
+from database.channels import add_channel_async, get_channel_by_peer_id_async
+from database.messages import add_message_async
+
+# Передача новых сообщений AI этапу без ожидания опроса БД
+from telegram.bot.utils.handoff_queue import new_messages_queue
+# Фоновая загрузка фото (хранилище по хешу содержимого)
+from telegram.parser.media_downloader import media_downloads
+# Распределение источников по аккаунтам
+from telegram.parser.sharding import HashRing
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
 
 # Константы
 PHOTO_STORAGE = settings.telegram_parser.photo_storage
+ALBUM_WINDOW = settings.telegram_parser.album_window  # Сколько ждать остальные части альбома (секунды)
 
 # Глобальные переменные
-client = None
-active_account_id = None
-active_sources = []
+clients: Dict[int, TelegramClient] = {}  # ID аккаунта -> подключенный клиент
+account_sources: Dict[int, List[str]] = {}  # ID аккаунта -> источники, к которым он подключен
+album_buffers: Dict[tuple, List[Message]] = {}  # (channel_id, grouped_id) -> части альбома
+album_flush_tasks: set[asyncio.Task] = set()  # Отложенные сохранения альбомов (event loop хранит задачи только по слабым ссылкам)
 update_event = asyncio.Event()
 TOTAL_HANDLED = 0
 
@@ -78,26 +87,25 @@ async def get_message_views(client: TelegramClient, message: Message) -> int:
         logger.error(f"Ошибка при получении просмотров: {e}")
         return 0
 
-async def get_active_account_from_db():
-    """Получает активный аккаунт из БД"""
+async def get_active_accounts_from_db():
+    """Получает все активные аккаунты из БД"""
     try:
-        # Выполняем синхронные операции в отдельном потоке
-        active_accounts = await asyncio.to_thread(parsing_telegram_acc_repository.get_active_parsing_accounts)
+        active_accounts = await parsing_telegram_acc_repository.get_active_parsing_accounts_async()
         
-        if active_accounts and len(active_accounts) > 0:
-            logger.info(f"Найден активный аккаунт: ID {active_accounts[0]['id']}")
-            return active_accounts[0]
+        if active_accounts:
+            logger.info(f"Найдено активных аккаунтов: {len(active_accounts)} (ID {[account['id'] for account in active_accounts]})")
+            return active_accounts
         
         logger.warning("Нет активных аккаунтов в БД")
-        return None
+        return []
     except Exception as e:
-        logger.error(f"Ошибка при получении активного аккаунта: {e}")
+        logger.error(f"Ошибка при получении активных аккаунтов: {e}")
         return None
 
 async def get_parsing_sources_from_db():
     """Получает список источников из БД"""
     try:
-        sources = await asyncio.to_thread(parsing_source_repository.get_all_sources)
+        sources = await parsing_source_repository.get_all_sources_async()
         source_identifiers = [source['source_identifier'] for source in sources]
         logger.info(f"Получено {len(source_identifiers)} источников для парсинга")
         return source_identifiers
@@ -106,9 +114,7 @@ async def get_parsing_sources_from_db():
         return []
 
 async def setup_client(account_data):
-    """Создает и подключает клиент Telegram"""
-    global client
-    
+    """Создает и подключает клиент Telegram для аккаунта"""
     try:
         # Проверка API настроек
         if not settings.telegram_api.api_id or not settings.telegram_api.api_hash:
@@ -143,6 +149,7 @@ async def setup_client(account_data):
             is_authorized = await asyncio.wait_for(client.is_user_authorized(), timeout=10)
             if not is_authorized:
                 logger.error("Клиент не авторизован")
+                await client.disconnect()  # Аккаунт переподключается каждую итерацию - не копим соединения
                 return None
             
             # Получаем данные пользователя
@@ -152,15 +159,14 @@ async def setup_client(account_data):
             return client
         except Exception as e:
             logger.error(f"Ошибка проверки авторизации: {e}")
+            await client.disconnect()
             return None
     except Exception as e:
         logger.error(f"Ошибка при настройке клиента: {e}")
         return None
 
-async def join_channel_if_needed(source_identifier):
+async def join_channel_if_needed(client, source_identifier):
     """Присоединяется к каналу если нужно"""
-    global client
-    
     try:
         # Нормализуем идентификатор (убираем @ если есть)
         if source_identifier.startswith('@'):
@@ -187,6 +193,19 @@ async def join_channel_if_needed(source_identifier):
             return None
             
         logger.info(f"Успешно получен канал: {entity.title}")
+        
+        # Обновления приходят только из каналов, в которых аккаунт состоит:
+        # новый владелец источника после перераспределения должен вступить в канал
+        if entity.left:
+            try:
+                await asyncio.wait_for(
+                    client(functions.channels.JoinChannelRequest(entity)),
+                    timeout=20
+                )
+                logger.info(f"Аккаунт вступил в канал {entity.title}")
+            except Exception as e:
+                logger.error(f"Не удалось вступить в канал {source_identifier}: {e}")
+                return None
         return entity
     except Exception as e:
         logger.error(f"Общая ошибка при подключении к {source_identifier}: {e}")
@@ -214,49 +233,51 @@ async def handle_new_message(event):
         logger.info(f"Processing message for channel ID: {channel_id}")
             
         # Проверяем канал в БД
-        channel = await asyncio.to_thread(get_channel_by_peer_id, channel_id)
+        channel = await get_channel_by_peer_id_async(channel_id)
         if not channel:
             try:
                 logger.info(f"Channel {channel_id} not found in DB, adding...")
-                channel_entity = await client.get_entity(PeerChannel(channel_id))
-                await asyncio.to_thread(add_channel, channel_entity)
+                channel_entity = await event.client.get_entity(PeerChannel(channel_id))
+                await add_channel_async(channel_entity)
                 logger.info(f"Channel {channel_id} added to DB")
             except Exception as e:
                 logger.error(f"Ошибка при добавлении канала: {e}")
                 return
         
+        # Части альбома копятся и сохраняются одним сообщением
+        if message.grouped_id:
+            buffer_album_part(channel_id, message)
+            return
+        
         # Получаем ссылки и просмотры
         links = check_message_for_links(message)
-        views = await get_message_views(client, message)
+        views = await get_message_views(event.client, message)
+        
+        has_photo = bool(message.photo and PHOTO_STORAGE)
         
-        # Сначала добавляем сообщение в БД без фото
-        db_message_id = await asyncio.to_thread(
-            add_message,
+        # Сообщение с фото сохраняется под арендой загрузчика: AI возьмет его после скачивания
+        db_message_id, created = await add_message_async(
             channel_id=channel_id,
             message_id=message.id,
             text=message.text,
             date=message.date,
-            photo_path=None,  # Сначала без фото
+            photo_path=None,  # Путь запишет загрузчик
             links=links,
-            views=views
+            views=views,
+            photo_lease_seconds=media_downloads.timeout if has_photo else None
         )
         
-        # Обрабатываем фото и обновляем путь в БД если есть
-        if message.photo and PHOTO_STORAGE:
-            try:
-                # Используем ID из базы данных вместо message.id для имени файла
-                photo_path = os.path.join(PHOTO_STORAGE, f"{db_message_id}.jpg")
-                await asyncio.wait_for(message.download_media(photo_path), timeout=20)
-                logger.info(f"Photo saved to {photo_path}")
-                
-                # Обновляем путь к фото в БД
-                await asyncio.to_thread(
-                    update_message_photo_path,
-                    message_id=db_message_id,
-                    photo_path=photo_path
-                )
-            except Exception as e:
-                logger.error(f"Ошибка при скачивании фото: {e}")
+        if not created:
+            # Дубликат (например, пока источник переезжает к другому аккаунту):
+            # загрузку и передачу AI уже выполнил тот, кто сохранил сообщение
+            if db_message_id:
+                logger.info(f"Сообщение ID {message.id} уже сохранено, повторная обработка пропущена")
+        elif has_photo:
+            # Фото скачивается в фоне; загрузчик сам передаст сообщение AI этапу
+            await media_downloads.put(db_message_id, [message])
+        else:
+            # Сообщение уже в БД: AI этап может забрать его сразу
+            new_messages_queue.push(db_message_id)
         
         TOTAL_HANDLED += 1
         logger.info(f"Обработано сообщение ID: {message.id}, всего: {TOTAL_HANDLED}")
@@ -265,10 +286,101 @@ async def handle_new_message(event):
         import traceback
         logger.error(traceback.format_exc())
 
-async def setup_message_handlers(channel_entities):
-    """Настраивает обработчики сообщений"""
-    global client
+def buffer_album_part(channel_id: int, message: Message) -> None:
+    """
+    Добавляет часть альбома в буфер. Первая часть запускает отложенное
+    сохранение: через ALBUM_WINDOW секунд все части с тем же grouped_id
+    сохраняются одним сообщением.
+    """
+    key = (channel_id, message.grouped_id)
+    parts = album_buffers.setdefault(key, [])
+    parts.append(message)
+    if len(parts) == 1:
+        task = asyncio.create_task(flush_album_later(key))
+        album_flush_tasks.add(task)
+        task.add_done_callback(album_flush_tasks.discard)
+
+
+async def flush_pending_albums() -> None:
+    """Дожидается сохранения альбомов, части которых еще копятся (при остановке парсера)"""
+    if album_flush_tasks:
+        logger.info(f"Ожидание сохранения {len(album_flush_tasks)} альбомов")
+        await asyncio.gather(*album_flush_tasks, return_exceptions=True)
+
+
+def cancel_pending_albums() -> None:
+    """Отменяет отложенные сохранения альбомов (при отмене задачи парсера)"""
+    for task in list(album_flush_tasks):
+        task.cancel()
+    if album_buffers:
+        logger.warning(f"Парсер остановлен, не сохранено альбомов: {len(album_buffers)}")
+    album_buffers.clear()
+
+
+async def flush_album_later(key: tuple[int, int]) -> None:
+    """Ждет остальные части альбома и сохраняет его"""
+    global TOTAL_HANDLED
+    
+    await asyncio.sleep(ALBUM_WINDOW)
+    parts = sorted(album_buffers.pop(key, []), key=lambda part: part.id)
+    if not parts:
+        return
     
+    channel_id, grouped_id = key
+    try:
+        await save_album(channel_id, grouped_id, parts)
+        TOTAL_HANDLED += 1
+        logger.info(f"Обработан альбом {grouped_id} из {len(parts)} частей, всего: {TOTAL_HANDLED}")
+    except Exception as e:
+        logger.error(f"Ошибка при обработке альбома {grouped_id}: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+
+
+async def save_album(channel_id: int, grouped_id: int, parts: list[Message]) -> int | None:
+    """
+    Сохраняет альбом одним сообщением.
+    
+    Текст берется из первой части с подписью (обычно подпись есть только у одной),
+    ссылки собираются со всех частей. Фото скачиваются в фоне (media_downloads):
+    первое записывается в сообщение, все по порядку - в message_media.
+    
+    Returns:
+        int | None: ID сообщения в БД (None при ошибке сохранения)
+    """
+    first = parts[0]
+    caption_part = next((part for part in parts if part.text), first)
+    links = []
+    for part in parts:
+        links.extend(link for link in check_message_for_links(part) if link not in links)
+    views = await get_message_views(first.client, first)
+    photo_parts = [part for part in parts if part.photo] if PHOTO_STORAGE else []
+    
+    db_message_id, created = await add_message_async(
+        channel_id=channel_id,
+        message_id=first.id,
+        text=caption_part.text,
+        date=first.date,
+        photo_path=None,
+        links=links,
+        views=views,
+        grouped_id=grouped_id,
+        photo_lease_seconds=media_downloads.timeout if photo_parts else None
+    )
+    if not created:
+        # Ошибка сохранения или альбом уже сохранен (повтор при переезде источника)
+        return db_message_id
+    
+    if photo_parts:
+        await media_downloads.put(db_message_id, photo_parts)
+    else:
+        new_messages_queue.push(db_message_id)
+    logger.info(f"Альбом {grouped_id} сохранен как сообщение ID {db_message_id}: {len(parts)} частей, {len(photo_parts)} фото в очереди загрузки")
+    return db_message_id
+
+
+async def setup_message_handlers(client, channel_entities):
+    """Настраивает обработчики сообщений клиента (только его доля источников)"""
     try:
         # Очищаем предыдущие обработчики
         try:
@@ -306,9 +418,84 @@ async def setup_message_handlers(channel_entities):
         logger.error(traceback.format_exc())
 
                          
+async def disconnect_account(account_id: int) -> None:
+    """Отключает клиент аккаунта; его источники перейдут к остальным аккаунтам"""
+    client = clients.pop(account_id, None)
+    account_sources.pop(account_id, None)
+    if client:
+        try:
+            await client.disconnect()
+        except Exception as e:
+            logger.error(f"Ошибка при отключении аккаунта ID {account_id}: {e}")
+
+
+async def sync_clients(accounts) -> None:
+    """
+    Приводит подключенные клиенты к списку активных аккаунтов.
+    
+    Клиенты деактивированных аккаунтов и аккаунтов, потерявших соединение,
+    отключаются; для новых активных аккаунтов создаются клиенты. Аккаунт,
+    который не удалось подключить, не получает источников до следующей итерации.
+    """
+    active_ids = {account['id'] for account in accounts}
+    
+    for account_id in list(clients):
+        if account_id not in active_ids:
+            logger.info(f"Аккаунт ID {account_id} больше не активен, отключаем")
+            await disconnect_account(account_id)
+        elif not clients[account_id].is_connected():
+            logger.warning(f"Аккаунт ID {account_id} потерял соединение, его источники перераспределяются")
+            await disconnect_account(account_id)
+    
+    for account_data in accounts:
+        if account_data['id'] in clients:
+            continue
+        logger.info(f"Подключение аккаунта ID {account_data['id']}")
+        client = await setup_client(account_data)
+        if client:
+            clients[account_data['id']] = client
+        else:
+            logger.error(f"Ошибка настройки клиента аккаунта ID {account_data['id']}")
+
+
+async def rebalance_sources(sources) -> None:
+    """
+    Распределяет источники по подключенным аккаунтам (консистентное хеширование).
+    
+    Переподписывается только аккаунт, набор источников которого изменился:
+    при добавлении или отключении аккаунта переезжает лишь часть источников.
+    Новый владелец источника вступает в канал (join_channel_if_needed);
+    источник, к которому подключиться не удалось, повторяется при следующей
+    синхронизации. Пока источник переезжает, его сообщения могут прийти дважды: для повтора
+    add_message_async возвращает created=False, и фото не скачивается, а
+    сообщение не передается AI этапу второй раз.
+    """
+    assignment = HashRing(list(clients)).assign(sources)
+    
+    for account_id, assigned in assignment.items():
+        if set(assigned) == set(account_sources.get(account_id, [])):
+            continue
+        
+        client = clients[account_id]
+        channel_entities = []
+        joined = []
+        for source in assigned:
+            entity = await join_channel_if_needed(client, source)
+            if entity:
+                channel_entities.append(entity)
+                joined.append(source)
+        
+        await setup_message_handlers(client, channel_entities)
+        # Запоминаются только подключенные источники: набор не совпадет с
+        # назначенным, и не подключенные (таймаут, ошибка вступления) будут
+        # повторены при следующей синхронизации
+        account_sources[account_id] = joined
+        logger.info(f"Аккаунт ID {account_id}: отслеживается {len(channel_entities)} из {len(assigned)} источников")
+
+
 async def check_updates_loop():
     """Основной цикл проверки обновлений"""
-    global client, active_account_id, active_sources, is_running, update_event
+    global is_running, update_event
     
     logger.info("Запуск основного цикла проверки")
     
@@ -319,31 +506,21 @@ async def check_updates_loop():
             # Сбрасываем событие обновления
             update_event.clear()
                 
-            # Получаем активный аккаунт
-            account_data = await get_active_account_from_db()
+            # Получаем активные аккаунты
+            accounts = await get_active_accounts_from_db()
             
-            if not account_data:
-                logger.warning("Нет активного аккаунта, ожидание 30 сек...")
+            if accounts is None:
+                # Ошибка БД: уже подключенные аккаунты продолжают работать
+                await asyncio.sleep(30)
+                continue
+            
+            # Подключаем новые аккаунты и отключаем лишние
+            await sync_clients(accounts)
+            
+            if not clients:
+                logger.warning("Нет подключенных аккаунтов, ожидание 30 сек...")
                 await asyncio.sleep(30)
                 continue
-                
-            # Проверяем изменения аккаунта
-            if active_account_id != account_data['id']:
-                logger.info(f"Смена активного аккаунта на ID: {account_data['id']}")
-                
-                # Отключаем предыдущий клиент
-                if client:
-                    await client.disconnect()
-                    
-                # Настраиваем новый клиент
-                active_account_id = account_data['id']
-                client = await setup_client(account_data)
-                
-                if not client:
-                    logger.error("Ошибка настройки клиента")
-                    active_account_id = None
-                    await asyncio.sleep(30)
-                    continue
             
             # Получаем источники
             current_sources = await get_parsing_sources_from_db()
@@ -353,24 +530,8 @@ async def check_updates_loop():
                 await asyncio.sleep(30)
                 continue
                 
-            # Проверяем изменения в источниках
-            if set(current_sources) != set(active_sources):
-                logger.info("Обновление списка источников")
-                active_sources = current_sources
-                
-                # Подключаемся к каналам
-                channel_entities = []
-                for source in active_sources:
-                    entity = await join_channel_if_needed(source)
-                    if entity:
-                        channel_entities.append(entity)
-                        
-                # Настраиваем обработчики
-                if channel_entities:
-                    await setup_message_handlers(channel_entities)
-                    logger.info(f"Отслеживается {len(channel_entities)} каналов")
-                else:
-                    logger.warning("Не удалось подключиться ни к одному каналу")
+            # Распределяем источники по аккаунтам
+            await rebalance_sources(current_sources)
             
             # Ждем до следующей проверки
             logger.info("Ожидание 60 секунд или события обновления")
@@ -399,23 +560,30 @@ async def run_parser():
             except Exception as e:
                 logger.error(f"Ошибка создания папки для фото: {e}")
         
+        # Загрузчики фото работают независимо от обработчиков сообщений
+        media_downloads.start()
+        
         # Запускаем основной цикл
         logger.info("Запуск основного цикла парсера")
         await check_updates_loop()
+        # Альбомы сохраняются, пока клиенты еще подключены
+        await flush_pending_albums()
+        await media_downloads.stop()
         
-        # Отключаем клиент
-        if client:
-            await client.disconnect()
-            logger.info("Клиент отключен")
+        # Отключаем клиенты
+        for account_id in list(clients):
+            await disconnect_account(account_id)
+        logger.info("Клиенты отключены")
             
     except asyncio.CancelledError:
         logger.info("Задача отменена")
-        if client:
-            await client.disconnect()
+        cancel_pending_albums()
+        for account_id in list(clients):
+            await disconnect_account(account_id)
     except Exception as e:
         logger.error(f"Неожиданная ошибка в парсере: {e}")
-        if client:
-            await client.disconnect()
+        for account_id in list(clients):
+            await disconnect_account(account_id)
 
 def signal_handler(sig, frame):
     """Обработчик сигналов для корректного завершения"""
@@ -0,0 +1,204 @@
+import os
+import glob
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from config import settings
+from database.photo_storage import (
+    get_expired_photo_messages, get_shared_photo_hashes, clear_message_photos,
+    get_legacy_photo_messages, save_photo_locations
+)
+from telegram.parser.media_downloader import photo_storage_path, file_sha256, move_into_storage
+
+
+logger = logging.getLogger(__name__)
+
+
+def _variant_files(path: str) -> list[str]:
+    """Подготовленные к загрузке копии фото (<имя>.<параметры>.jpg рядом с оригиналом)"""
+    root, _ = os.path.splitext(path)
+    return glob.glob(f"{glob.escape(root)}.*.jpg")
+
+
+def _remove_files(paths: list[str], min_age_seconds: float) -> tuple[int, int, set[str]]:
+    """
+    Удаляет файлы, не изменявшиеся min_age_seconds, вместе с их
+    подготовленными копиями (выполняется в потоке).
+
+    Returns:
+        tuple[int, int, set[str]]: Количество удаленных файлов, освобожденные
+            байты и пути, оставленные из-за недавнего изменения
+    """
+    removed, reclaimed = 0, 0
+    kept = set()
+    now = time.time()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            if now - stat.st_mtime < min_age_seconds:
+                kept.add(path)  # Файл только что переиспользован загрузчиком
+                continue
+            os.remove(path)
+            removed += 1
+            reclaimed += stat.st_size
+        except FileNotFoundError:
+            continue
+        for variant in _variant_files(path):
+            try:
+                reclaimed += os.path.getsize(variant)
+                os.remove(variant)
+            except FileNotFoundError:
+                continue
+    return removed, reclaimed, kept
+
+
+def _compact_file(storage_dir: str, path: str) -> tuple[str, str] | None:
+    """
+    Переносит файл старого формата ({id}.jpg) в хранилище по хешу (выполняется в потоке).
+
+    Returns:
+        tuple[str, str] | None: Новый путь и SHA-256; None, если файла нет
+    """
+    if not os.path.exists(path):
+        return None
+    sha256 = file_sha256(path)
+    final_path = photo_storage_path(storage_dir, sha256)
+    if os.path.abspath(final_path) != os.path.abspath(path):
+        for variant in _variant_files(path):
+            os.remove(variant)  # Копия старого пути больше не найдется; сделается заново
+        move_into_storage(path, final_path)
+    return final_path, sha256
+
+
+class PhotoRetention:
+    """
+    Очистка хранилища фото: удаление старых фото и перенос файлов старого формата.
+
+    Каждый шаг обрабатывает небольшую порцию и сразу отдает управление, поэтому
+    очистка идет постепенно и не задерживает ни парсер, ни другие этапы
+    воркера; файловые операции выполняются в потоках.
+
+    - Срок хранения: у сообщений в окончательных статусах (POSTED,
+      ERROR_PERMANENT) старше retention_days удаляется файл фото, затем
+      ссылка на него в БД. Файл по хешу удаляется, только если на него не
+      ссылаются другие сообщения, и не удаляется, если загрузчик только что
+      переиспользовал его; тогда ссылка остается до следующего прохода.
+    - Уплотнение: фото, сохраненные до хранилища по хешу ({id}.jpg в одной
+      папке), переносятся в <storage>/ab/cd/<sha256>.jpg; одинаковые файлы
+      сливаются в один. Записи о пропавших файлах снимаются из БД.
+
+    Args:
+        storage_dir (str): Корень хранилища фото (PHOTO_STORAGE)
+        retention_days (float): Срок хранения фото; 0 - фото не удаляются
+        batch_size (int): Сообщений за один шаг
+        grace_seconds (float): Недавно измененные файлы не удаляются
+    """
+    def __init__(self, storage_dir: str, retention_days: float = 14, batch_size: int = 200, grace_seconds: float = 600):
+        self.storage_dir = storage_dir
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.grace_seconds = grace_seconds
+        self._since: datetime | None = None  # Курсор прохода по истекшим сообщениям
+        self.stats = {
+            "messages_expired": 0, "files_deleted": 0, "bytes_reclaimed": 0,
+            "files_compacted": 0, "files_missing": 0, "passes": 0
+        }
+
+    async def step(self) -> bool:
+        """
+        Один шаг очистки.
+
+        Returns:
+            bool: True, если работа еще осталась (следующий шаг можно начинать сразу)
+        """
+        compacted = await self.compact_legacy()
+        expired = await self.expire() if self.retention_days > 0 else 0
+        if not compacted and not expired:
+            await asyncio.to_thread(self._remove_stale_temp_files)
+        return compacted >= self.batch_size or expired >= self.batch_size
+
+    async def expire(self) -> int:
+        """Удаляет фото одной порции истекших сообщений. Возвращает размер порции"""
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        messages = await get_expired_photo_messages(cutoff, self._since, self.batch_size)
+        if not messages:
+            # Проход окончен; следующий начнется сначала (сообщения, завершенные позже)
+            if self._since is not None:
+                self.stats["passes"] += 1
+            self._since = None
+            return 0
+        self._since = messages[-1].date
+
+        photos = {msg.photo_path: msg.photo_sha256 for msg in messages}
+        for msg in messages:
+            photos.update((item.photo_path, item.photo_sha256) for item in msg.media)
+        shared = await get_shared_photo_hashes([sha for sha in photos.values() if sha], [msg.id for msg in messages])
+        # Файл старого формата принадлежит одному сообщению, файл по хешу - всем с тем же хешем
+        paths = [path for path, sha in photos.items() if sha not in shared]
+
+        removed, reclaimed, kept = await asyncio.to_thread(_remove_files, paths, self.grace_seconds)
+        # Ссылки снимаются только у сообщений, все файлы которых удалены или
+        # нужны другим сообщениям. Оставленный из-за недавнего изменения файл
+        # сохраняет ссылку, и следующий проход проверит его снова - иначе на
+        # файл по хешу никто бы не ссылался, и удалить его было бы некому
+        cleared_ids = [
+            msg.id for msg in messages
+            if not kept.intersection([msg.photo_path, *(item.photo_path for item in msg.media)])
+        ]
+        await clear_message_photos(cleared_ids)
+
+        self.stats["messages_expired"] += len(cleared_ids)
+        self.stats["files_deleted"] += removed
+        self.stats["bytes_reclaimed"] += reclaimed
+        logger.info(
+            f"Очистка фото: {len(cleared_ids)} из {len(messages)} сообщений, удалено файлов {removed}, "
+            f"освобождено {reclaimed / 1024 / 1024:.1f} МБ"
+        )
+        return len(messages)
+
+    async def compact_legacy(self) -> int:
+        """Переносит одну порцию фото старого формата в хранилище по хешу. Возвращает размер порции"""
+        messages = await get_legacy_photo_messages(self.batch_size)
+        if not messages:
+            return 0
+
+        message_locations: dict[int, tuple[str, str] | None] = {}
+        media_locations: dict[int, tuple[str, str] | None] = {}
+        for msg in messages:
+            # Первое фото альбома - тот же файл, что и у сообщения: переносится один раз
+            moved: dict[str, tuple[str, str] | None] = {}
+            for path in [msg.photo_path, *(item.photo_path for item in msg.media)]:
+                if path not in moved:
+                    moved[path] = await asyncio.to_thread(_compact_file, self.storage_dir, path)
+            message_locations[msg.id] = moved[msg.photo_path]
+            media_locations.update((item.id, moved[item.photo_path]) for item in msg.media)
+
+            self.stats["files_compacted"] += sum(1 for location in moved.values() if location)
+            self.stats["files_missing"] += sum(1 for location in moved.values() if not location)
+
+        await save_photo_locations(message_locations, media_locations)
+        logger.info(f"Уплотнение хранилища фото: обработано {len(messages)} сообщений старого формата")
+        return len(messages)
+
+    def _remove_stale_temp_files(self) -> None:
+        """Удаляет временные файлы загрузок, прерванных падением процесса"""
+        temp_dir = os.path.join(self.storage_dir, "tmp")
+        if not os.path.isdir(temp_dir):
+            return
+        paths = [os.path.join(temp_dir, name) for name in os.listdir(temp_dir)]
+        _remove_files(paths, self.grace_seconds)
+
+    def snapshot(self) -> dict:
+        """Возвращает счетчики очистки для мониторинга"""
+        return {**self.stats, "retention_days": self.retention_days}
+
+
+# Очистка хранилища фото (запускается этапом retention posting worker'а)
+photo_retention = PhotoRetention(
+    settings.telegram_parser.photo_storage,
+    retention_days=settings.telegram_parser.photo_retention_days,
+    batch_size=settings.telegram_parser.photo_retention_batch,
+    grace_seconds=settings.telegram_parser.download_timeout * 10
+)
@@ -0,0 +1,58 @@
+import bisect
+import hashlib
+
+
+def _hash(value: str) -> int:
+    """Стабильный между запусками хеш строки (встроенный hash() рандомизирован)"""
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+def normalize_source(source_identifier: str) -> str:
+    """Ключ источника для распределения: @Channel, channel и CHANNEL - один источник"""
+    return source_identifier.lstrip("@").lower()
+
+
+class HashRing:
+    """
+    Консистентное хеширование источников по аккаунтам парсинга.
+
+    Каждый аккаунт занимает replicas точек на кольце; источник достается
+    аккаунту, чья точка идет следующей после хеша источника. При добавлении
+    или удалении аккаунта переезжает только примерно 1/N источников - те, что
+    попали на его участки кольца, - остальные аккаунты не переподписываются.
+
+    Args:
+        nodes (list[int]): ID аккаунтов
+        replicas (int): Виртуальных точек на аккаунт (равномерность распределения)
+    """
+    def __init__(self, nodes: list[int], replicas: int = 100):
+        self.nodes = sorted(set(nodes))
+        self.replicas = replicas
+        self._ring: list[tuple[int, int]] = sorted(
+            (_hash(f"{node}:{replica}"), node)
+            for node in self.nodes
+            for replica in range(replicas)
+        )
+        self._points = [point for point, _ in self._ring]
+
+    def get_node(self, key: str) -> int | None:
+        """Возвращает аккаунт для источника или None, если аккаунтов нет"""
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._points, _hash(normalize_source(key))) % len(self._ring)
+        return self._ring[index][1]
+
+    def assign(self, keys: list[str]) -> dict[int, list[str]]:
+        """
+        Распределяет источники по аккаунтам.
+
+        Returns:
+            dict[int, list[str]]: ID аккаунта -> его источники (у каждого аккаунта
+                есть ключ, даже если источников ему не досталось)
+        """
+        assignment: dict[int, list[str]] = {node: [] for node in self.nodes}
+        for key in keys:
+            node = self.get_node(key)
+            if node is not None:
+                assignment[node].append(key)
+        return assignment
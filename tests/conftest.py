@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+# Тесты работают с отдельной SQLite базой: строка подключения задается до
+# импорта database.models (таблицы создаются при импорте)
+_db_dir = tempfile.mkdtemp(prefix="newsbot-tests-")
+os.environ["DB_CONNECT_STRING"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Канал-источник, который создается в чистой БД (фикстура db)
+SOURCE_PEER_ID = 1001
+
+
+@pytest.fixture
+def db():
+    """Очищает все таблицы и создает канал-источник SOURCE_PEER_ID (@source)"""
+    from sqlalchemy import delete
+    from database.models import BaseModel, SessionLocal, Channels
+
+    with SessionLocal() as session:
+        for table in reversed(BaseModel.metadata.sorted_tables):
+            session.execute(delete(table))
+        session.add(Channels(peer_id=SOURCE_PEER_ID, username="source", title="Source"))
+        session.commit()
+    yield
+
+
+@pytest.fixture
+def add_message(db):
+    """
+    Фабрика сообщений: add_message(message_id, channel_id=SOURCE_PEER_ID,
+    status=AI_PROCESSED, deliveries={target_chat_id: DeliveryStatus}, **поля) -> ID
+    """
+    from database.models import SessionLocal, Messages, MessageDelivery, NewsStatus
+
+    def factory(message_id: int, channel_id: int = SOURCE_PEER_ID, status=NewsStatus.AI_PROCESSED,
+                deliveries: dict | None = None, delivery_retry_count: int = 0, **fields) -> int:
+        values = {
+            "text": "text", "length": 4, "date": datetime.utcnow(), "views": 0,
+            "ai_processed_text": "processed", **fields
+        }
+        with SessionLocal() as session:
+            msg = Messages(channel_id=channel_id, message_id=message_id, status=status, **values)
+            session.add(msg)
+            session.flush()
+            session.add_all(
+                MessageDelivery(message_id=msg.id, target_chat_id=target, status=delivery_status, retry_count=delivery_retry_count)
+                for target, delivery_status in (deliveries or {}).items()
+            )
+            session.commit()
+            return msg.id
+    return factory
@@ -0,0 +1,46 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from database.models import SessionLocal, Messages, MessageMedia
+from database.messages import add_message_async, save_message_photos_async, extend_photo_lease_async
+from conftest import SOURCE_PEER_ID
+
+
+pytestmark = pytest.mark.usefixtures("db")
+
+
+def save_message(message_id: int) -> tuple[int | None, bool]:
+    return asyncio.run(add_message_async(
+        channel_id=SOURCE_PEER_ID, message_id=message_id, text="text", date=datetime(2026, 1, 1),
+        photo_path=None, links=[], views=0, photo_lease_seconds=60
+    ))
+
+
+def test_duplicate_is_reported_as_not_created():
+    first_id, first_created = save_message(1)
+    # Повтор приходит, пока источник переезжает к другому аккаунту
+    second_id, second_created = save_message(1)
+
+    assert first_created is True
+    assert second_created is False
+    assert second_id == first_id
+
+
+def test_photo_save_keeps_foreign_lease_and_existing_album():
+    message_id, _ = save_message(1)
+    photos = [("a.jpg", "a" * 64), ("b.jpg", "b" * 64)]
+    assert asyncio.run(save_message_photos_async(message_id, photos))
+
+    # Аренда истекла, сообщение взял AI этап; загрузчик повторно сохраняет альбом
+    with SessionLocal() as session:
+        session.get(Messages, message_id).claimed_by = "posting-worker"
+        session.commit()
+    assert asyncio.run(save_message_photos_async(message_id, photos))
+
+    with SessionLocal() as session:
+        assert session.get(Messages, message_id).claimed_by == "posting-worker"
+        assert len(session.scalars(select(MessageMedia).where(MessageMedia.message_id == message_id)).all()) == 2
+    assert not asyncio.run(extend_photo_lease_async(message_id, 60))
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from config import settings
+from database.models import SessionLocal, Messages, PostingTarget, ParsingSourceChannel, NewsStatus
+import telegram.bot.posting_worker as posting_worker
+
+
+@pytest.fixture(autouse=True)
+def routes(db, monkeypatch):
+    with SessionLocal() as session:
+        session.add(PostingTarget(target_chat_id="@active", is_active=True, parsing_sources=[
+            ParsingSourceChannel(source_identifier="@source")
+        ]))
+        session.commit()
+    posting_worker.source_routing.invalidate()
+    monkeypatch.setattr(settings.telegram_bot, "pipeline_max_posting_backlog", 1)
+
+
+@pytest.fixture
+def handled(monkeypatch):
+    handled = []
+
+    async def handle(messages):
+        handled.extend(msg.id for msg in messages)
+    monkeypatch.setattr(posting_worker, "_handle_ai_messages", handle)
+    return handled
+
+
+def test_handoff_waits_while_posting_backlog_is_full(add_message, handled):
+    add_message(1)  # Ждет рассылки в активный канал - очередь постинга заполнена
+    new_id = add_message(2, status=NewsStatus.NEW)
+
+    assert asyncio.run(posting_worker._handle_handed_off_messages([new_id])) == 0
+    assert handled == []
+    with SessionLocal() as session:
+        msg = session.get(Messages, new_id)
+        # Сообщение остается в NEW без аренды - его подберет опрос БД
+        assert msg.status == NewsStatus.NEW
+        assert msg.claimed_by is None
+
+
+def test_handoff_processes_when_posting_keeps_up(add_message, handled):
+    new_id = add_message(1, status=NewsStatus.NEW)
+
+    assert asyncio.run(posting_worker._handle_handed_off_messages([new_id])) == 1
+    assert handled == [new_id]
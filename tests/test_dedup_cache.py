@@ -0,0 +1,47 @@
+import time
+
+from AIservice.dedup_cache import TTLHashCache
+
+
+def test_entries_expire_individually():
+    now = time.time()
+    cache = TTLHashCache(ttl_seconds=100, bucket_seconds=10)
+    cache.add("old", added_at=now - 150)
+    cache.add("boundary", added_at=now - 101)
+    cache.add("fresh", added_at=now - 50)
+
+    assert cache.evict_expired(now=now) == 2
+    assert cache.contains("fresh")
+    assert not cache.contains("old")
+    assert cache.evictions == 2
+
+
+def test_re_adding_extends_ttl():
+    now = time.time()
+    cache = TTLHashCache(ttl_seconds=100, bucket_seconds=10)
+    cache.add("hash", added_at=now - 150)
+    cache.add("hash", added_at=now - 10)
+
+    assert cache.evict_expired(now=now) == 0
+    assert cache.contains("hash")
+
+
+def test_snapshot_round_trip_skips_expired(tmp_path):
+    path = str(tmp_path / "snapshots" / "dedup.sqlite")
+    now = time.time()
+    cache = TTLHashCache(ttl_seconds=100, snapshot_path=path)
+    cache.add("fresh", added_at=now - 10)
+    cache.add("stale", added_at=now - 500)
+    cache.write_snapshot(cache.snapshot_rows())
+
+    restored = TTLHashCache(ttl_seconds=100, snapshot_path=path)
+    assert restored.load_snapshot() == 1
+    assert restored.contains("fresh")
+    assert not restored.contains("stale")
+    assert cache.last_snapshot_at is not None
+
+
+def test_missing_snapshot_loads_nothing(tmp_path):
+    cache = TTLHashCache(ttl_seconds=100, snapshot_path=str(tmp_path / "missing.sqlite"))
+
+    assert cache.load_snapshot() == 0
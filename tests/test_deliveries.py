@@ -0,0 +1,34 @@
+import asyncio
+
+from sqlalchemy import select
+
+from database.models import SessionLocal, MessageDelivery, DeliveryStatus
+from database.deliveries import get_stalled_messages, get_finished_messages, requeue_failed_deliveries
+
+
+ACTIVE_TARGETS = ["@active"]
+
+
+def test_messages_left_with_disabled_targets_are_stalled(add_message):
+    stalled = add_message(1, deliveries={"@active": DeliveryStatus.POSTED, "@disabled": DeliveryStatus.PENDING})
+    add_message(2, deliveries={"@active": DeliveryStatus.PENDING, "@disabled": DeliveryStatus.PENDING})
+    add_message(3)  # Еще ждет рассылки по каналам
+
+    message_ids = asyncio.run(get_stalled_messages(ACTIVE_TARGETS))
+    assert message_ids == [stalled]
+    assert asyncio.run(get_finished_messages(message_ids, ACTIVE_TARGETS)) == {stalled: True}
+
+
+def test_requeue_failed_deliveries_reopens_them(add_message):
+    message_id = add_message(
+        1, deliveries={"@active": DeliveryStatus.ERROR_PERMANENT, "@other": DeliveryStatus.POSTED},
+        delivery_retry_count=3
+    )
+
+    assert asyncio.run(requeue_failed_deliveries([message_id])) == 1
+    with SessionLocal() as session:
+        rows = dict(session.execute(
+            select(MessageDelivery.target_chat_id, MessageDelivery.status).where(MessageDelivery.message_id == message_id)
+        ).all())
+    assert rows == {"@active": DeliveryStatus.PENDING, "@other": DeliveryStatus.POSTED}
+    assert asyncio.run(get_stalled_messages(ACTIVE_TARGETS)) == []
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from AIservice import gemini
+from AIservice.gemini import attach_result_indexes, process_posts
+
+
+def test_indexes_are_normalized_to_request_positions():
+    results = attach_result_indexes(
+        [{"text": "a", "index": "2"}, {"text": "b", "index": 7}, {"text": "c", "index": "x"}, "garbage"],
+        indexes=[0, 2]
+    )
+
+    assert results == [
+        {"text": "a", "index": 2},
+        {"text": "b", "index": None},  # Такого поста в запросе не было
+        {"text": "c", "index": None},
+    ]
+
+
+def test_single_post_result_without_index_belongs_to_it():
+    assert attach_result_indexes([{"text": "a"}], indexes=[3]) == [{"text": "a", "index": 3}]
+
+
+@pytest.fixture
+def gemini_calls(monkeypatch):
+    gemini.dedup_cache.clear()
+    gemini.response_cache.clear()
+    monkeypatch.setattr(gemini, "response_cache_enabled", True)
+    calls = []
+
+    async def generate(content):
+        calls.append(content)
+        return '[{"index": 0, "text": "Обработанная новость"}]'
+    monkeypatch.setattr(gemini, "generate_with_limit", generate)
+    yield calls
+    gemini.dedup_cache.clear()
+    gemini.response_cache.clear()
+
+
+def test_repeated_post_is_answered_from_cache(gemini_calls):
+    post = "Исходная новость из канала"
+
+    first = asyncio.run(process_posts([post]))
+    # Повтор того же поста (например, из другого источника) не фильтруется как дубликат своего же ответа
+    second = asyncio.run(process_posts([post]))
+
+    assert first == [{"index": 0, "text": "Обработанная новость"}]
+    assert second == first
+    assert len(gemini_calls) == 1
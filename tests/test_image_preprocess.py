@@ -0,0 +1,18 @@
+from PIL import Image
+
+from telegram.bot.utils.image_preprocess import _downscale, variant_path
+
+
+def test_downscale_applies_exif_orientation(tmp_path):
+    # Фото 400x200 с пометкой "повернуть на 90°" (Orientation=6), как снимает телефон
+    photo_path = str(tmp_path / "photo.jpg")
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.effect_noise((400, 200), 64).convert("RGB").save(photo_path, "JPEG", quality=100, exif=exif)
+
+    target_path = variant_path(photo_path, 100, 50)
+    _, new_size = _downscale(photo_path, target_path, max_side=100, quality=50)
+
+    assert new_size > 0
+    with Image.open(target_path) as image:
+        assert image.size == (50, 100)
@@ -0,0 +1,42 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from database.models import SessionLocal, Messages, NewsStatus
+from database.message_queue import claim_messages
+
+
+NEW = [Messages.status == NewsStatus.NEW]
+
+
+def claim(worker_id: str, limit: int = 10, conditions=NEW) -> list[int]:
+    claimed = asyncio.run(claim_messages(conditions, worker_id=worker_id, lease_seconds=60, limit=limit))
+    return [msg.id for msg in claimed]
+
+
+def test_claimed_rows_are_not_given_to_another_worker(add_message):
+    first = add_message(1, status=NewsStatus.NEW, date=datetime(2026, 1, 1))
+    second = add_message(2, status=NewsStatus.NEW, date=datetime(2026, 1, 2))
+
+    assert claim("worker-a", limit=1) == [first]  # Старые в начале
+    assert claim("worker-b") == [second]
+    assert claim("worker-c") == []
+
+    with SessionLocal() as session:
+        msg = session.get(Messages, first)
+        assert msg.claimed_by.startswith("worker-a/")
+        assert msg.lease_until > datetime.utcnow()
+
+
+def test_expired_lease_can_be_reclaimed(add_message):
+    message_id = add_message(
+        1, status=NewsStatus.NEW, claimed_by="crashed-worker/0000",
+        lease_until=datetime.utcnow() - timedelta(seconds=1)
+    )
+
+    assert claim("worker-a") == [message_id]
+
+
+def test_conditions_limit_the_claim(add_message):
+    add_message(1, status=NewsStatus.AI_PROCESSED)
+
+    assert claim("worker-a") == []
@@ -0,0 +1,54 @@
+from telegram.bot.utils.near_duplicates import SimHashIndex, simhash
+
+
+NEWS = (
+    "Центральный банк сохранил ключевую ставку на уровне шестнадцати процентов годовых третий раз подряд, "
+    "сообщила пресс-служба регулятора в пятницу вечером после заседания совета директоров"
+)
+PARAPHRASE = "Срочно: " + NEWS.replace(" вечером", "")
+OTHER = "Футбольный клуб из Казани подписал контракт с новым главным тренером на два ближайших сезона"
+
+
+def distance(a: str, b: str) -> int:
+    return bin(simhash(a) ^ simhash(b)).count("1")
+
+
+def test_paraphrase_is_closer_than_other_news():
+    assert simhash(NEWS) == simhash(NEWS.upper() + "!!!")  # Регистр и пунктуация не влияют
+    assert distance(NEWS, PARAPHRASE) < distance(NEWS, OTHER)
+
+
+def test_index_finds_near_duplicate_and_skips_itself():
+    index = SimHashIndex(max_distance=8, min_tokens=8)
+    index.add(1, NEWS)
+
+    assert index.find(PARAPHRASE) == 1
+    assert index.find(OTHER) is None
+    assert index.find(NEWS, exclude_key=1) is None
+
+
+def test_short_texts_are_not_indexed():
+    index = SimHashIndex(min_tokens=8)
+    index.add(1, "Коротко о главном")
+
+    assert len(index) == 0
+    assert index.find("Коротко о главном") is None
+
+
+def test_expired_entries_are_evicted():
+    index = SimHashIndex(retention_hours=1)
+    index.add(1, NEWS, added_at=1000.0)
+    index.add(2, OTHER, added_at=1000.0 + 3000)
+
+    assert index.evict_expired(now=1000.0 + 3700) == 1
+    assert len(index) == 1
+    assert index.buckets and all(keys == {2} for keys in index.buckets.values())
+
+
+def test_readded_key_survives_eviction_of_old_entry():
+    index = SimHashIndex(retention_hours=1)
+    index.add(1, NEWS, added_at=1000.0)
+    index.add(1, NEWS, added_at=1000.0 + 3000)
+
+    assert index.evict_expired(now=1000.0 + 3700) == 0
+    assert len(index) == 1
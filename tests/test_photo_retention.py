@@ -0,0 +1,32 @@
+import os
+import asyncio
+from datetime import datetime, timedelta
+
+from database.models import SessionLocal, Messages, NewsStatus
+from telegram.parser.photo_retention import PhotoRetention
+
+
+def test_file_in_grace_window_keeps_its_reference(tmp_path, add_message):
+    photo_path = str(tmp_path / "ab" / "cd" / f"{'a' * 64}.jpg")
+    os.makedirs(os.path.dirname(photo_path))
+    with open(photo_path, "wb") as file:
+        file.write(b"photo")
+    message_id = add_message(
+        1, status=NewsStatus.POSTED, date=datetime.utcnow() - timedelta(days=30),
+        photo_path=photo_path, photo_sha256="a" * 64
+    )
+    retention = PhotoRetention(str(tmp_path), retention_days=14, grace_seconds=600)
+
+    # Файл только что переиспользован загрузчиком: не удаляется, ссылка остается
+    asyncio.run(retention.expire())
+    assert os.path.exists(photo_path)
+    with SessionLocal() as session:
+        assert session.get(Messages, message_id).photo_path == photo_path
+
+    # Окно прошло: следующий проход удаляет и файл, и ссылку
+    old = datetime.now().timestamp() - 3600
+    os.utime(photo_path, (old, old))
+    asyncio.run(retention.expire())
+    assert not os.path.exists(photo_path)
+    with SessionLocal() as session:
+        assert session.get(Messages, message_id).photo_path is None
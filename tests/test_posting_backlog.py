@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from database.models import SessionLocal, Channels, PostingTarget, ParsingSourceChannel, DeliveryStatus
+from database.routing import SourceRoutingTable
+from database.deliveries import count_actionable_backlog
+
+
+UNROUTED_PEER_ID = 1002
+INACTIVE_PEER_ID = 1003
+
+
+@pytest.fixture(autouse=True)
+def routes(db):
+    # @source привязан к активному каналу, @inactive - только к отключенному, @unrouted - ни к одному
+    with SessionLocal() as session:
+        session.add_all([
+            Channels(peer_id=UNROUTED_PEER_ID, username="unrouted", title="Unrouted"),
+            Channels(peer_id=INACTIVE_PEER_ID, username="inactive", title="Inactive"),
+            PostingTarget(target_chat_id="@active", is_active=True, parsing_sources=[
+                ParsingSourceChannel(source_identifier="@source")
+            ]),
+            PostingTarget(target_chat_id="@disabled", is_active=False, parsing_sources=[
+                ParsingSourceChannel(source_identifier="@inactive")
+            ]),
+        ])
+        session.commit()
+
+
+def count_backlog() -> int:
+    async def run() -> int:
+        routing = SourceRoutingTable()
+        targets_by_source = await routing.get_targets_by_source()
+        return await count_actionable_backlog(list(targets_by_source), list(routing.routes))
+    return asyncio.run(run())
+
+
+def test_unroutable_messages_do_not_block_ai_stage(add_message):
+    # Источник не привязан ни к одному каналу или привязан только к отключенному
+    for number in range(5):
+        add_message(number, channel_id=UNROUTED_PEER_ID)
+        add_message(number, channel_id=INACTIVE_PEER_ID)
+
+    assert count_backlog() == 0
+
+
+def test_deliveries_to_disabled_targets_are_not_counted(add_message):
+    add_message(1, deliveries={"@disabled": DeliveryStatus.PENDING})
+
+    assert count_backlog() == 0
+
+
+def test_routed_messages_and_open_deliveries_are_counted(add_message):
+    add_message(1)  # Ждет рассылки по каналам
+    add_message(2, deliveries={"@active": DeliveryStatus.ERROR})
+    add_message(3, deliveries={"@active": DeliveryStatus.POSTED})
+
+    assert count_backlog() == 2
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from telegram.bot.utils import rate_limiter
+from telegram.bot.utils.rate_limiter import TokenBucket, SendRateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемые часы: time.monotonic лимитера и asyncio.sleep двигают одно время"""
+    now = [100.0]
+
+    async def sleep(delay):
+        now[0] += delay
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", sleep)
+    return now
+
+
+def test_bucket_allows_burst_then_waits_for_refill(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+
+    async def run():
+        return [await bucket.acquire() for _ in range(4)]
+    waits = asyncio.run(run())
+
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[3] == pytest.approx(0.5)
+
+
+def test_block_delays_even_with_tokens(clock):
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.block(3)
+    bucket.block(1)  # Более короткий запрет не сокращает действующий
+
+    assert bucket.time_until_available() == pytest.approx(3)
+    assert asyncio.run(bucket.acquire()) == pytest.approx(3)
+
+
+def test_retry_after_slows_chat_and_success_recovers(clock):
+    limiter = SendRateLimiter(global_rate=30, chat_rate_per_minute=60, chat_burst=3)
+    asyncio.run(limiter.acquire("@chat"))
+    limiter.record_retry_after("@chat", 5)
+
+    bucket = limiter.chat_buckets["@chat"]
+    assert bucket.rate == pytest.approx(0.5)
+    assert bucket.blocked_for() == pytest.approx(5)
+    assert limiter.global_bucket.blocked_for() == 0  # Остальные каналы не останавливаются
+
+    for _ in range(100):
+        limiter.record_success("@chat")
+    assert bucket.rate == pytest.approx(1.0)
+
+
+def test_rate_does_not_drop_below_floor(clock):
+    limiter = SendRateLimiter(global_rate=30, chat_rate_per_minute=60, chat_burst=3)
+    for _ in range(10):
+        limiter.record_retry_after("@chat", 1)
+
+    assert limiter.chat_buckets["@chat"].rate == pytest.approx(1.0 * SendRateLimiter.MIN_RATE_FRACTION)
+
+
+def test_retry_after_without_chat_blocks_global_budget(clock):
+    limiter = SendRateLimiter(global_rate=30, chat_rate_per_minute=20, chat_burst=3)
+    limiter.record_retry_after(None, 7)
+
+    assert limiter.global_bucket.blocked_for() == pytest.approx(7)
+    assert limiter.snapshot()["global_retry_after"] == 1
@@ -0,0 +1,43 @@
+from AIservice import response_cache
+from AIservice.response_cache import ResponseCache
+
+
+KEY_A = ("v1", "a", False)
+KEY_B = ("v1", "b", False)
+KEY_C = ("v1", "c", False)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, ttl_seconds=100)
+    cache.put(KEY_A, [{"text": "a"}])
+    cache.put(KEY_B, [{"text": "b"}])
+    cache.get(KEY_A)  # A использован позже B
+    cache.put(KEY_C, [{"text": "c"}])
+
+    assert cache.get(KEY_B) is None
+    assert cache.get(KEY_A) == [{"text": "a"}]
+    assert cache.evictions == 1
+
+
+def test_expired_entry_is_a_miss(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(max_entries=10, ttl_seconds=100)
+    cache.put(KEY_A, [])
+    cache.put(KEY_B, [{"text": "b"}])
+
+    now[0] += 50
+    assert cache.get(KEY_A) == []  # Пустой ответ - тоже ответ
+    now[0] += 60
+    assert cache.get(KEY_A) is None
+    assert cache.evict_expired() == 1
+    assert len(cache) == 0
+    assert cache.expirations == 2
+
+
+def test_returned_results_are_copies():
+    cache = ResponseCache(max_entries=10, ttl_seconds=100)
+    cache.put(KEY_A, [{"text": "a"}])
+    cache.get(KEY_A)[0]["index"] = 5
+
+    assert cache.get(KEY_A) == [{"text": "a"}]
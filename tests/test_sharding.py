@@ -0,0 +1,43 @@
+from telegram.parser.sharding import HashRing, normalize_source
+
+
+SOURCES = [f"@channel_{number}" for number in range(400)]
+
+
+def test_every_source_gets_exactly_one_account():
+    assignment = HashRing([1, 2, 3]).assign(SOURCES)
+
+    assert sorted(assignment) == [1, 2, 3]
+    assert sorted(source for sources in assignment.values() for source in sources) == sorted(SOURCES)
+    assert all(sources for sources in assignment.values())  # Ни один аккаунт не простаивает
+
+
+def test_assignment_is_stable_between_runs_and_node_order():
+    assert HashRing([1, 2, 3]).assign(SOURCES) == HashRing([3, 1, 2]).assign(SOURCES)
+
+
+def test_adding_account_moves_only_its_share():
+    before = HashRing([1, 2, 3])
+    after = HashRing([1, 2, 3, 4])
+
+    moved = [source for source in SOURCES if before.get_node(source) != after.get_node(source)]
+    # Переезжают только источники нового аккаунта (около 1/4), остальные остаются на местах
+    assert all(after.get_node(source) == 4 for source in moved)
+    assert len(moved) < len(SOURCES) * 0.4
+
+
+def test_removing_account_keeps_other_sources_in_place():
+    before = HashRing([1, 2, 3])
+    after = HashRing([1, 3])
+
+    for source in SOURCES:
+        if before.get_node(source) != 2:
+            assert after.get_node(source) == before.get_node(source)
+
+
+def test_source_spellings_map_to_same_account():
+    ring = HashRing([1, 2, 3])
+
+    assert normalize_source("@News") == "news"
+    assert ring.get_node("@News") == ring.get_node("news") == ring.get_node("NEWS")
+    assert HashRing([]).get_node("news") is None
@@ -0,0 +1,67 @@
+import asyncio
+
+from database import status_buffer as status_buffer_module
+from database.models import SessionLocal, Messages, NewsStatus
+from database.status_buffer import StatusWriteBuffer
+
+
+def load(message_id: int) -> Messages:
+    with SessionLocal() as session:
+        return session.get(Messages, message_id)
+
+
+def test_changes_are_merged_into_one_row(add_message):
+    message_id = add_message(1, status=NewsStatus.NEW)
+    buffer = StatusWriteBuffer(flush_interval=10)
+    buffer._task = object()  # Как будто фоновый сброс запущен: изменения копятся
+
+    async def run():
+        await buffer.set(message_id, status=NewsStatus.SENT_TO_AI)
+        await buffer.set(message_id, status=NewsStatus.AI_PROCESSED, ai_processed_text="new")
+        await buffer.increment_retry(message_id)
+        await buffer.increment_retry(message_id)
+        return await buffer.flush()
+
+    assert asyncio.run(run()) == 1
+    msg = load(message_id)
+    assert msg.status == NewsStatus.AI_PROCESSED
+    assert msg.ai_processed_text == "new"
+    assert msg.retry_count == 2
+    assert buffer.stats["coalesced"] == 2
+
+
+def test_failed_flush_is_requeued_without_overwriting_newer_values(add_message, monkeypatch):
+    message_id = add_message(1, status=NewsStatus.NEW)
+    buffer = StatusWriteBuffer(flush_interval=10)
+    buffer._task = object()
+
+    def broken_session():
+        raise RuntimeError("database is down")
+
+    async def run():
+        await buffer.set(message_id, status=NewsStatus.SENT_TO_AI, error_info="old")
+        await buffer.increment_retry(message_id)
+        with monkeypatch.context() as patch:
+            patch.setattr(status_buffer_module, "AsyncSessionLocal", broken_session)
+            assert await buffer.flush() == 0
+        # Пока БД недоступна, пришло более новое значение
+        await buffer.set(message_id, status=NewsStatus.AI_PROCESSED)
+        await buffer.increment_retry(message_id)
+        return await buffer.flush()
+
+    assert asyncio.run(run()) == 1
+    msg = load(message_id)
+    assert msg.status == NewsStatus.AI_PROCESSED
+    assert msg.error_info == "old"
+    assert msg.retry_count == 2
+    assert buffer.stats["errors"] == 1
+
+
+def test_writes_immediately_when_background_flush_is_off(add_message):
+    message_id = add_message(1, status=NewsStatus.NEW)
+    buffer = StatusWriteBuffer(flush_interval=0)
+
+    asyncio.run(buffer.set(message_id, status=NewsStatus.POSTED))
+
+    assert len(buffer) == 0
+    assert load(message_id).status == NewsStatus.POSTED